@@ -0,0 +1,63 @@
+"""CPU cost of encoding a streamed chunk as `chat_stream` sends it.
+
+Compares `ChatMessage.from_lc(...).model_dump_json()` with `ChunkEncoder`, for
+the small chunks of a per-token stream and the large ones of a coalesced stream,
+and checks that both produce the same bytes. Also reports the size of the
+delta-only (v2) events of `DeltaChunkEncoder`.
+
+Usage:
+    uv run python -m benchmarks.chunk_encoder
+"""
+
+import time
+
+from langchain_core.messages import AIMessageChunk
+
+from chatbot.routers.chat import ChunkEncoder, DeltaChunkEncoder
+from chatbot.schemas import ChatMessage
+
+NUM_CHUNKS = 20000
+PARENT_ID = "8f5b8f2e-6a3e-4d5e-9d2a-3c9b8a7f6e5d"
+MESSAGE_ID = "lc_run--0199a0e2-1c1d-7c3e-8f3b-6f0e6a0e6b1a"
+
+
+def make_chunk(text: str) -> AIMessageChunk:
+    return AIMessageChunk(
+        id=MESSAGE_ID,
+        content=[{"type": "text", "text": text, "index": 1}],
+        additional_kwargs={"raw_content": text},
+    )
+
+
+def measure(name: str, encode, chunk: AIMessageChunk) -> float:
+    start = time.perf_counter()
+    for _ in range(NUM_CHUNKS):
+        encode(chunk)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<12} {elapsed / NUM_CHUNKS * 1e6:8.2f} us / chunk")
+    return elapsed
+
+
+def main() -> None:
+    for label, text in (("token", " tok"), ("coalesced", " tok" * 500)):
+        chunk = make_chunk(text)
+        encoder = ChunkEncoder(parent_id=PARENT_ID)
+
+        def from_lc(msg: AIMessageChunk) -> str:
+            return ChatMessage.from_lc(msg, parent_id=PARENT_ID).model_dump_json()
+
+        assert encoder.encode(chunk) == from_lc(chunk), "outputs differ"
+
+        print(f"{label} chunk, {len(from_lc(chunk))} bytes")
+        baseline = measure("from_lc", from_lc, chunk)
+        fast = measure("ChunkEncoder", encoder.encode, chunk)
+        print(f"{'speedup':<12} {baseline / fast:8.1f}x")
+
+        delta_encoder = DeltaChunkEncoder(parent_id=PARENT_ID)
+        delta_encoder.encode(chunk)  # The envelope.
+        print(f"v2 delta, {len(delta_encoder.encode(chunk))} bytes")
+        measure("Delta", delta_encoder.encode, chunk)
+
+
+if __name__ == "__main__":
+    main()
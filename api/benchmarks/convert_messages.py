@@ -0,0 +1,125 @@
+"""CPU cost of converting the conversation history to OpenAI messages per turn.
+
+A turn converts the whole history once per token count (and `trim_messages` counts
+several times), then once more for the request payload.
+
+Usage:
+    uv run python -m benchmarks.convert_messages
+"""
+
+import json
+import time
+from uuid import uuid4
+
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    ToolMessage,
+    trim_messages,
+)
+
+from chatbot.llm_client.base import ExtendedChatOpenAI
+
+NUM_MESSAGES = 200
+NUM_TURNS = 20
+
+
+def build_history(num_messages: int) -> list[BaseMessage]:
+    """A history of question / answer pairs, every 5th answer uses a tool."""
+    messages = []
+    for i in range(num_messages // 2):
+        if i % 5 == 4:
+            tool_call_id = str(uuid4())
+            messages.append(
+                AIMessage(
+                    id=str(uuid4()),
+                    content="",
+                    tool_calls=[
+                        {
+                            "name": "web_search",
+                            "args": {"query": f"query {i}"},
+                            "id": tool_call_id,
+                        }
+                    ],
+                )
+            )
+            messages.append(
+                ToolMessage(
+                    id=str(uuid4()),
+                    content=json.dumps([{"title": "foo", "snippet": "bar " * 80}] * 5),
+                    tool_call_id=tool_call_id,
+                )
+            )
+            continue
+        attachments = (
+            [{"url": f"https://example.com/{i}.png", "mimetype": "image/png"}]
+            if i % 10 == 0
+            else []
+        )
+        messages.append(
+            HumanMessage(
+                id=str(uuid4()),
+                content=f"Question {i}: " + "lorem ipsum " * 40,
+                additional_kwargs={"attachments": attachments},
+            )
+        )
+        answer = "dolor sit amet " * 120
+        messages.append(
+            AIMessage(
+                id=str(uuid4()),
+                content=[{"type": "text", "text": answer, "index": 0}],
+                additional_kwargs={"raw_content": f"<think>hmm</think>{answer}"},
+            )
+        )
+    return messages
+
+
+class UncachedChatOpenAI(ExtendedChatOpenAI):
+    def _convert_message(self, message: BaseMessage, cache) -> list[dict]:
+        return self._do_convert_message(message)
+
+
+def run_turn(llm: ExtendedChatOpenAI, history: list[BaseMessage]) -> None:
+    def token_counter(messages: list[BaseMessage]) -> int:
+        oai_messages = llm.convert_messages(messages)
+        return sum(len(str(message["content"])) // 4 for message in oai_messages)
+
+    trimmed = trim_messages(
+        history,
+        token_counter=token_counter,
+        max_tokens=20_000,
+        start_on="human",
+    )
+    llm.convert_messages(trimmed)
+
+
+def measure(llm: ExtendedChatOpenAI, history: list[BaseMessage]) -> float:
+    """Return the CPU seconds per turn."""
+    # The history is deserialized from the checkpoint on every turn.
+    turns = [
+        [message.model_copy(deep=True) for message in history] for _ in range(NUM_TURNS)
+    ]
+    start = time.process_time()
+    for messages in turns:
+        run_turn(llm, messages)
+    return (time.process_time() - start) / NUM_TURNS
+
+
+def main() -> None:
+    history = build_history(NUM_MESSAGES)
+
+    uncached = UncachedChatOpenAI(api_key="whatever", base_url="http://localhost/v1")
+    baseline = measure(uncached, history)
+
+    # The first turn populates the cache.
+    llm = ExtendedChatOpenAI(api_key="whatever", base_url="http://localhost/v1")
+    cached = measure(llm, history)
+
+    print(f"{NUM_MESSAGES} messages, {NUM_TURNS} turns")
+    print(f"without cache: {baseline * 1000:8.2f} ms CPU / turn")
+    print(f"with cache:    {cached * 1000:8.2f} ms CPU / turn")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Bytes saved and CPU cost of compressing a chat stream, per stream.
+
+A streamed answer (with reasoning, as `raw_content` doubles the text) is encoded as
+`chat_stream` does, one event per token or coalesced, in both wire formats, then
+compressed with a flush after every event.
+
+Usage:
+    uv run python -m benchmarks.sse_compression
+"""
+
+import asyncio
+import time
+
+from langchain_core.messages import AIMessageChunk
+
+from chatbot.compression import COMPRESSORS, compress_stream
+from chatbot.routers.chat import ChunkEncoder, DeltaChunkEncoder
+from chatbot.streaming import sse_event
+
+NUM_TOKENS = 2000
+PARENT_ID = "8f5b8f2e-6a3e-4d5e-9d2a-3c9b8a7f6e5d"
+MESSAGE_ID = "lc_run--0199a0e2-1c1d-7c3e-8f3b-6f0e6a0e6b1a"
+WORDS = "the model thinks about the question step by step before it answers".split()
+
+
+def make_events(encoder: ChunkEncoder, tokens_per_event: int) -> list[str]:
+    events = []
+    for i in range(0, NUM_TOKENS, tokens_per_event):
+        text = "".join(
+            f" {WORDS[j % len(WORDS)]}" for j in range(i, i + tokens_per_event)
+        )
+        chunk = AIMessageChunk(
+            id=MESSAGE_ID,
+            content=[{"type": "text", "text": text, "index": 1}],
+            additional_kwargs={"raw_content": text},
+        )
+        events.append(sse_event(len(events) + 1, encoder.encode(chunk)))
+    return events
+
+
+async def compress(events: list[str], encoding: str) -> int:
+    async def source():
+        for event in events:
+            yield event
+
+    return sum([len(chunk) async for chunk in compress_stream(source(), encoding)])
+
+
+def main() -> None:
+    print(f"{NUM_TOKENS} tokens per stream")
+    for version, encoder_class in (("v1", ChunkEncoder), ("v2", DeltaChunkEncoder)):
+        for tokens_per_event in (1, 25):
+            events = make_events(encoder_class(parent_id=PARENT_ID), tokens_per_event)
+            raw = sum(len(event.encode()) for event in events)
+            label = f"{version} {tokens_per_event:>2} tokens/event"
+            print(f"{label:<22} {'identity':<8} {raw / 1024:8.1f} KiB")
+            for encoding in COMPRESSORS:
+                start = time.process_time()
+                size = asyncio.run(compress(events, encoding))
+                cpu = time.process_time() - start
+                print(
+                    f"{'':<22} {encoding:<8} {size / 1024:8.1f} KiB "
+                    f"{1 - size / raw:6.1%} saved {cpu * 1000:8.2f} ms CPU / stream"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""CPU cost of turning a streamed answer into server-sent events, per token.
+
+The answer is streamed as `stream_mode="messages"` yields it and encoded as
+`chat_stream` does. There are no sleeps: the tokens are built upfront and the clock
+of `coalesce_chunks` is simulated, advancing by one token interval per token, so every
+run merges the same chunks and only the encode/coalesce path is timed.
+
+Usage:
+    uv run python -m benchmarks.sse_stream
+"""
+
+import asyncio
+import gc
+import statistics
+import time
+from typing import Any, AsyncIterator
+from unittest.mock import patch
+
+from langchain_core.messages import AIMessageChunk, BaseMessage
+
+from chatbot.routers.chat import ChunkEncoder
+from chatbot.streaming import coalesce_chunks
+
+NUM_TOKENS = 2000
+TOKENS_PER_SECOND = 500
+REPEATS = 50
+PARENT_ID = "8f5b8f2e-6a3e-4d5e-9d2a-3c9b8a7f6e5d"
+MESSAGE_ID = "lc_run--0199a0e2-1c1d-7c3e-8f3b-6f0e6a0e6b1a"
+METADATA = {"langgraph_node": "chatbot", "tags": []}
+
+
+class Clock:
+    """The simulated `monotonic` of `coalesce_chunks`."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_tokens() -> list[AIMessageChunk]:
+    return [
+        AIMessageChunk(
+            id=MESSAGE_ID,
+            content=[{"type": "text", "text": f" tok{i % 10}", "index": 1}],
+            additional_kwargs={"raw_content": f" tok{i % 10}"},
+        )
+        for i in range(NUM_TOKENS)
+    ]
+
+
+async def token_stream(
+    tokens: list[AIMessageChunk], clock: Clock
+) -> AsyncIterator[tuple[BaseMessage, dict[str, Any]]]:
+    for i, token in enumerate(tokens):
+        clock.now = i / TOKENS_PER_SECOND
+        yield token, METADATA
+
+
+async def encode(stream) -> tuple[int, int]:
+    """Returns the number of events and bytes."""
+    encoder = ChunkEncoder(parent_id=PARENT_ID)
+    events, size = 0, 0
+    async for msg, _ in stream:
+        sse_data = f"data: {encoder.encode(msg)}\n\n"
+        events += 1
+        size += len(sse_data)
+    return events, size
+
+
+def measure(
+    runner: asyncio.Runner, name: str, tokens: list[AIMessageChunk], interval=None
+) -> None:
+    timings = []
+    results = set()
+    for _ in range(REPEATS):
+        clock = Clock()
+        stream = token_stream(tokens, clock)
+        if interval is not None:
+            stream = coalesce_chunks(stream, interval=interval)
+        # Like `timeit`, keep the garbage collector out of the timings.
+        gc.collect()
+        gc.disable()
+        with patch("chatbot.streaming.monotonic", clock):
+            start = time.perf_counter()
+            results.add(runner.run(encode(stream)))
+            timings.append(time.perf_counter() - start)
+        gc.enable()
+    # The simulated clock makes every run emit the same events.
+    assert len(results) == 1, "runs differ"
+    events, size = results.pop()
+    print(
+        f"{name:<16} {events:6d} events {size / 1024:8.1f} KiB "
+        f"{min(timings) / NUM_TOKENS * 1e6:8.2f} us / token (min) "
+        f"{statistics.median(timings) / NUM_TOKENS * 1e6:8.2f} us / token (median)"
+    )
+
+
+def main() -> None:
+    tokens = make_tokens()
+    print(f"{NUM_TOKENS} tokens at {TOKENS_PER_SECOND} tokens/s, {REPEATS} runs")
+    with asyncio.Runner() as runner:
+        measure(runner, "per chunk", tokens)
+        for interval in (0.016, 0.05):
+            measure(runner, f"coalesce {interval * 1000:.0f}ms", tokens, interval)
+
+
+if __name__ == "__main__":
+    main()
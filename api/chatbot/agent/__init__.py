@@ -8,17 +8,25 @@ from langchain_core.messages import BaseMessage, SystemMessage, trim_messages
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import RunnablePassthrough
 from langchain_core.tools import BaseTool
-from langchain_core.runnables.config import RunnableConfig
+from langchain_core.runnables.config import RunnableConfig, run_in_executor
 from langgraph.graph import END, START, MessagesState, StateGraph
 from langgraph.prebuilt import ToolNode, tools_condition
 
+from chatbot.llm_client.base import content_version
 from chatbot.safety import create_hazard_classifier, hazard_categories
 
-from .token_management import resolve_token_management_params
+from .token_management import (
+    MIN_POSITIVE_TOKENS,
+    count_tool_tokens,
+    resolve_output_budget,
+    resolve_token_management_params,
+)
 from .toolpicker import create_tool_picker
 
 if TYPE_CHECKING:
+    from langchain_core.caches import BaseCache
     from langchain_core.language_models import BaseChatModel
+    from langchain_core.runnables import Runnable
     from langgraph.checkpoint.base import BaseCheckpointSaver
     from langgraph.graph.state import CompiledStateGraph
 
@@ -30,22 +38,39 @@ def create_agent(
     chat_model: BaseChatModel,
     *,
     safety_model: BaseChatModel | None = None,
+    hazard_classifier: Runnable | None = None,
     checkpointer: BaseCheckpointSaver = None,
     token_counter: (
         Callable[[list[BaseMessage]], int] | Callable[[BaseMessage], int] | None
     ) = None,
     context_length: int | None = None,
     tools: list[BaseTool] = None,
+    cache: BaseCache | None = None,
 ) -> CompiledStateGraph:
-    token_counter, max_input_tokens, _ = resolve_token_management_params(
-        chat_model, token_counter, context_length
+    """Creates the chat agent.
+
+    `cache` is only used by the internal tool picking call,
+    never by the chat model answering the user.
+    A prebuilt (e.g. shared) `hazard_classifier` takes precedence over `safety_model`.
+    """
+    token_counter, max_input_tokens, is_message_counting = (
+        resolve_token_management_params(chat_model, token_counter, context_length)
     )
+    output_budget = (
+        None
+        if is_message_counting
+        else resolve_output_budget(chat_model, context_length)
+    )
+    if output_budget is not None:
+        # Only the minimum output is reserved, the rest is decided per request.
+        max_input_tokens = output_budget.max_input_tokens
 
-    tool_picker = create_tool_picker(chat_model, tools) if tools else None
+    tool_picker = create_tool_picker(chat_model, tools, cache=cache) if tools else None
     tool_node = ToolNode(tools) if tools else None
+    # Token counts of the tool schemas, keyed by the names of the selected tools.
+    tool_tokens_counts: dict[tuple[str, ...], int] = {}
 
-    hazard_classifier = None
-    if safety_model is not None:
+    if hazard_classifier is None and safety_model is not None:
         hazard_classifier = create_hazard_classifier(safety_model)
 
     async def input_guard(state: MessagesState) -> MessagesState:
@@ -100,17 +125,6 @@ Current date: {date}
             ]
         )
 
-        # Notice we don't pass in messages. This creates
-        # a RunnableLambda that takes messages as input
-        trimmer = trim_messages(
-            token_counter=token_counter,
-            max_tokens=max_input_tokens,
-            start_on="human",
-            include_system=True,
-        )
-
-        bound = RunnablePassthrough.assign(date=_get_responding_at) | prompt | trimmer
-
         # Default to select all tools
         selected_tools = tools
         if tool_picker:
@@ -131,12 +145,54 @@ Current date: {date}
             except Exception:
                 logger.exception("Error picking tools, binding all")
 
+        # The tool schemas are part of the prompt too, leave room for them.
+        tool_tokens = 0
+        max_history_tokens = max_input_tokens
+        if selected_tools and not is_message_counting:
+            selected_names = tuple(tool.name for tool in selected_tools)
+            if selected_names not in tool_tokens_counts:
+                tool_tokens_counts[selected_names] = await run_in_executor(
+                    config, count_tool_tokens, selected_tools, token_counter
+                )
+            tool_tokens = tool_tokens_counts[selected_names]
+            # Keep some history even if the schemas take most of the context.
+            max_history_tokens = max(
+                max_input_tokens - tool_tokens, MIN_POSITIVE_TOKENS
+            )
+
+        # Remember the counts of the trimmer, the kept messages are usually counted already.
+        # Keyed by content rather than `id()`, which can be reused once a message is collected.
+        counts: dict[tuple[tuple[str | None, int], ...], int] = {}
+
+        def memo_token_counter(messages: list[BaseMessage]) -> int:
+            key = tuple((message.id, content_version(message)) for message in messages)
+            if key not in counts:
+                counts[key] = token_counter(messages)
+            return counts[key]
+
+        # Notice we don't pass in messages. This creates
+        # a RunnableLambda that takes messages as input
+        trimmer = trim_messages(
+            token_counter=memo_token_counter if output_budget else token_counter,
+            max_tokens=max_history_tokens,
+            start_on="human",
+            include_system=True,
+        )
+
+        trim = RunnablePassthrough.assign(date=_get_responding_at) | prompt | trimmer
+        trimmed = await trim.ainvoke({"messages": state["messages"]})
+
+        kwargs = {}
+        if output_budget is not None:
+            prompt_tokens = await run_in_executor(config, memo_token_counter, trimmed)
+            kwargs["max_tokens"] = output_budget.for_prompt(prompt_tokens + tool_tokens)
+
         if selected_tools:
-            bound = bound | chat_model.bind_tools(selected_tools)
+            bound = chat_model.bind_tools(selected_tools, **kwargs)
         else:
-            bound = bound | chat_model
+            bound = chat_model.bind(**kwargs)
 
-        messages = await bound.ainvoke({"messages": state["messages"]})
+        messages = await bound.ainvoke(trimmed)
         return {"messages": [messages]}
 
     builder = StateGraph(MessagesState)
@@ -1,11 +1,15 @@
 from typing import Callable
 
+from langchain_core.caches import BaseCache
 from langchain_core.language_models import BaseChatModel
 from langchain_core.messages import BaseMessage, trim_messages
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import Runnable
 
+from chatbot.llm_client.cache import with_response_cache
+from chatbot.llm_client.scheduler import PRIORITY_METADATA_KEY, Priority
+from chatbot.llm_client.sglang import SGLangChatOpenAI
 from chatbot.llm_client.vllm import VLLMChatOpenAI
 
 from .token_management import resolve_token_management_params
@@ -36,6 +40,7 @@ def create_summary_agent(
     | Callable[[BaseMessage], int]
     | None = None,
     context_length: int | None = None,
+    cache: BaseCache | None = None,
 ) -> Runnable:
     token_counter, max_input_tokens, _ = resolve_token_management_params(
         chat_model, token_counter, context_length
@@ -50,11 +55,16 @@ def create_summary_agent(
         include_system=True,
     )
 
+    chat_model = with_response_cache(chat_model, cache)
+
     # Disable internal "thinking" behavior when using reasoning models.
-    # NOTE: This only applies when using the VLLM-based chat service.
-    if isinstance(chat_model, VLLMChatOpenAI):
+    # NOTE: This only applies when using the VLLM or SGLang based chat service.
+    if isinstance(chat_model, (VLLMChatOpenAI, SGLangChatOpenAI)):
         extra_body = chat_model.extra_body or {}
         extra_body = extra_body | {"chat_template_kwargs": {"enable_thinking": False}}
         chat_model = chat_model.bind(extra_body=extra_body)
 
-    return tmpl | trimmer | chat_model | output_parser
+    chain = tmpl | trimmer | chat_model | output_parser
+    return chain.with_config(
+        metadata={PRIORITY_METADATA_KEY: Priority.SUMMARIZATION.label}
+    )
@@ -1,14 +1,17 @@
 from __future__ import annotations
 
+import json
 import logging
-from typing import TYPE_CHECKING, Callable
+from typing import TYPE_CHECKING, Callable, NamedTuple
 
-from langchain_core.messages import BaseMessage
+from langchain_core.messages import BaseMessage, SystemMessage
+from langchain_core.utils.function_calling import convert_to_openai_tool
 
 from chatbot.utils import is_valid_positive_int
 
 if TYPE_CHECKING:
     from langchain_core.language_models import BaseLanguageModel
+    from langchain_core.tools import BaseTool
 
 
 logger = logging.getLogger(__name__)
@@ -17,6 +20,47 @@ DEFAULT_MESSAGE_CONTEXT_LENGTH = 20
 DEFAULT_TOKEN_CONTEXT_LENGTH = 4096
 DEFAULT_INPUT_TOKEN_RATIO = 0.8
 MIN_POSITIVE_TOKENS = 1024
+DEFAULT_MIN_OUTPUT_TOKENS = 1024
+TOOL_TEMPLATE_TOKENS = 256
+"""Reserved for the instructions the chat template wraps around the tool schemas."""
+
+
+class OutputBudget(NamedTuple):
+    """Bounds of the per-request output budget.
+
+    Instead of statically reserving the model's `max_tokens` for output, only `min_tokens`
+    is reserved when trimming, and each request gets whatever the prompt leaves of the context,
+    capped by `max_tokens`.
+    """
+
+    context_length: int
+    min_tokens: int
+    max_tokens: int | None = None
+
+    @property
+    def max_input_tokens(self) -> int:
+        return self.context_length - self.min_tokens
+
+    def for_prompt(self, prompt_tokens: int) -> int:
+        """Calculates the `max_tokens` of a request given its prompt size."""
+        budget = self.context_length - prompt_tokens
+        if self.max_tokens is not None:
+            budget = min(budget, self.max_tokens)
+        return max(budget, self.min_tokens)
+
+
+def count_tool_tokens(
+    tools: list[BaseTool], token_counter: Callable[[list[BaseMessage]], int]
+) -> int:
+    """Counts the tokens the tool schemas take in the prompt.
+
+    The schemas are rendered by the chat template of the server, which is unknown here.
+    So they are counted as JSON in a system message, plus `TOOL_TEMPLATE_TOKENS`.
+    """
+    if not tools:
+        return 0
+    schemas = json.dumps([convert_to_openai_tool(tool) for tool in tools])
+    return token_counter([SystemMessage(content=schemas)]) + TOOL_TEMPLATE_TOKENS
 
 
 def resolve_token_management_params(
@@ -65,6 +109,49 @@ def resolve_token_management_params(
     return effective_token_counter, max_input_tokens, is_message_counting
 
 
+def resolve_output_budget(
+    chat_model: BaseLanguageModel, context_length: int | None = None
+) -> OutputBudget | None:
+    """Determines the bounds of the per-request output budget.
+
+    The minimum comes from `min_output_tokens` in the model's metadata and the maximum from
+    the model's `max_tokens`.
+
+    Returns:
+        The output budget, or None if the context length of the model is unknown, in which
+        case the output is reserved statically (see `resolve_token_management_params`).
+    """
+    resolved_context_length = _get_known_context_length(chat_model, context_length)
+    if resolved_context_length is None:
+        logger.info("Context length unknown, per-request output budget disabled.")
+        return None
+
+    model_max_output_tokens = _get_model_max_output_tokens(chat_model)
+    min_output_tokens = _get_model_min_output_tokens(chat_model)
+    if model_max_output_tokens is not None:
+        min_output_tokens = min(min_output_tokens, model_max_output_tokens)
+
+    if min_output_tokens >= resolved_context_length:
+        logger.warning(
+            "min_output_tokens (%d) is >= context_length (%d), per-request output budget disabled.",
+            min_output_tokens,
+            resolved_context_length,
+        )
+        return None
+
+    logger.info(
+        "Per-request output budget: %d to %s tokens (capacity: %d).",
+        min_output_tokens,
+        model_max_output_tokens,
+        resolved_context_length,
+    )
+    return OutputBudget(
+        context_length=resolved_context_length,
+        min_tokens=min_output_tokens,
+        max_tokens=model_max_output_tokens,
+    )
+
+
 def _get_effective_token_counter(
     language_model: BaseLanguageModel,
     token_counter: (
@@ -126,6 +213,22 @@ def _resolve_token_context_length(
     chat_model: BaseLanguageModel, user_context_length: int | None = None
 ) -> int:
     """Resolves the context length when counting by tokens."""
+    if (
+        context_length := _get_known_context_length(chat_model, user_context_length)
+    ) is not None:
+        return context_length
+
+    logger.warning(
+        "Using default context_length: %d tokens (model/user value unavailable/invalid).",
+        DEFAULT_TOKEN_CONTEXT_LENGTH,
+    )
+    return DEFAULT_TOKEN_CONTEXT_LENGTH
+
+
+def _get_known_context_length(
+    chat_model: BaseLanguageModel, user_context_length: int | None = None
+) -> int | None:
+    """Gets the context length from the user or the model, None if neither is available."""
     if is_valid_positive_int(user_context_length):
         logger.info(
             "Using user-provided context_length: %d tokens.", user_context_length
@@ -159,12 +262,7 @@ def _resolve_token_context_length(
         logger.exception(
             "Unexpected error accessing chat_model.get_context_length: %s.", e
         )
-
-    logger.warning(
-        "Using default context_length: %d tokens (model/user value unavailable/invalid).",
-        DEFAULT_TOKEN_CONTEXT_LENGTH,
-    )
-    return DEFAULT_TOKEN_CONTEXT_LENGTH
+    return None
 
 
 def _get_model_max_output_tokens(chat_model: BaseLanguageModel) -> int | None:
@@ -186,3 +284,23 @@ def _get_model_max_output_tokens(chat_model: BaseLanguageModel) -> int | None:
             e,
         )
     return None
+
+
+def _get_model_min_output_tokens(chat_model: BaseLanguageModel) -> int:
+    """Gets `min_output_tokens` from the model's metadata, or the default."""
+    metadata = getattr(chat_model, "metadata", None) or {}
+    if (value := metadata.get("min_output_tokens")) is None:
+        return DEFAULT_MIN_OUTPUT_TOKENS
+    try:
+        # Values from environment variables are strings.
+        value = int(value)
+    except (ValueError, TypeError):
+        value = None
+    if not is_valid_positive_int(value):
+        logger.error(
+            "Invalid min_output_tokens in metadata: %s, using default %d",
+            metadata.get("min_output_tokens"),
+            DEFAULT_MIN_OUTPUT_TOKENS,
+        )
+        return DEFAULT_MIN_OUTPUT_TOKENS
+    return value
@@ -8,11 +8,14 @@ from langchain_core.runnables import Runnable
 from langchain_core.tools import BaseTool
 from pydantic import BaseModel, Field
 
+from chatbot.llm_client.cache import with_response_cache
+from chatbot.llm_client.scheduler import PRIORITY_METADATA_KEY, Priority
 from chatbot.llm_client.vllm import VLLMChatOpenAI
 
 from .token_management import resolve_token_management_params
 
 if TYPE_CHECKING:
+    from langchain_core.caches import BaseCache
     from langchain_core.language_models import BaseChatModel
 
 
@@ -30,6 +33,7 @@ def create_tool_picker(
     | Callable[[BaseMessage], int]
     | None = None,
     context_length: int | None = None,
+    cache: BaseCache | None = None,
 ) -> Runnable:
     assert tools, "No tools provided to the tool picker."
 
@@ -72,12 +76,19 @@ def create_tool_picker(
         include_system=True,
     )
 
-    chat_model = chat_model.with_structured_output(
-        PickTools,
-        method="json_schema",
-        strict=True,
-        include_raw=True,
-    ).with_config(tags=["internal"])
+    chat_model = (
+        with_response_cache(chat_model, cache)
+        .with_structured_output(
+            PickTools,
+            method="json_schema",
+            strict=True,
+            include_raw=True,
+        )
+        .with_config(
+            tags=["internal"],
+            metadata={PRIORITY_METADATA_KEY: Priority.TOOL_PICKER.label},
+        )
+    )
 
     # Disable internal "thinking" behavior when using reasoning models.
     # NOTE: This only applies when using the VLLM-based chat service.
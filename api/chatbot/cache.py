@@ -0,0 +1,102 @@
+from collections import OrderedDict
+from collections.abc import Hashable
+from threading import Lock
+from time import monotonic
+
+
+class LRUCache[K: Hashable, V]:
+    """A minimal thread-safe LRU cache.
+
+    Unlike `functools.lru_cache`, this is a container rather than a decorator,
+    so it can be shared, inspected and invalidated explicitly.
+    It is thread-safe because some of its users (e.g. token counters) run in
+    executor threads.
+
+    Optionally, entries expire `ttl` seconds after being set, and the total
+    `size` of the entries (as reported to `set`) is bounded by `max_bytes`.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        *,
+        ttl: float | None = None,
+        max_bytes: int | None = None,
+    ):
+        if maxsize <= 0:
+            raise ValueError(f"maxsize must be positive, got {maxsize}")
+        if ttl is not None and ttl <= 0:
+            raise ValueError(f"ttl must be positive, got {ttl}")
+        if max_bytes is not None and max_bytes <= 0:
+            raise ValueError(f"max_bytes must be positive, got {max_bytes}")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        # key -> (value, expires_at, size)
+        self._data: OrderedDict[K, tuple[V, float | None, int]] = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: K, default: V | None = None) -> V | None:
+        with self._lock:
+            try:
+                value, expires_at, _ = self._data[key]
+            except KeyError:
+                return default
+            if expires_at is not None and expires_at <= monotonic():
+                self._remove(key)
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: K, value: V, size: int = 0) -> None:
+        """Sets an entry, `size` is only used to honor `max_bytes`.
+
+        Entries larger than `max_bytes` are not stored at all.
+        """
+        if self.max_bytes is not None and size > self.max_bytes:
+            self.pop(key)
+            return
+        expires_at = monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._remove(key)
+            self._data[key] = (value, expires_at, size)
+            self.nbytes += size
+            while len(self._data) > self.maxsize or (
+                self.max_bytes is not None and self.nbytes > self.max_bytes
+            ):
+                _, (_, _, evicted_size) = self._data.popitem(last=False)
+                self.nbytes -= evicted_size
+
+    def pop(self, key: K, default: V | None = None) -> V | None:
+        with self._lock:
+            if (entry := self._remove(key)) is None:
+                return default
+            return entry[0]
+
+    def values(self) -> list[V]:
+        """Returns the values that have not expired, from the least recently used."""
+        now = monotonic()
+        with self._lock:
+            return [
+                value
+                for value, expires_at, _ in self._data.values()
+                if expires_at is None or expires_at > now
+            ]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+    def _remove(self, key: K) -> tuple[V, float | None, int] | None:
+        """Removes an entry, the caller must hold the lock."""
+        if (entry := self._data.pop(key, None)) is not None:
+            self.nbytes -= entry[2]
+        return entry
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._data
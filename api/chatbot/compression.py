@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import zlib
+from time import perf_counter
+from typing import AsyncIterator, Protocol
+
+from chatbot.metrics.streaming import (
+    compressed_bytes,
+    compression_seconds,
+    uncompressed_bytes,
+)
+
+try:
+    # Installed with `aiohttp[speedups]`.
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+
+class FlushingCompressor(Protocol):
+    def compress(self, data: bytes) -> bytes:
+        """Compresses `data`, and flushes so that the client can decode it right away."""
+
+    def finish(self) -> bytes: ...
+
+
+class GzipCompressor:
+    def __init__(self, level: int = 6):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(
+            zlib.Z_SYNC_FLUSH
+        )
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliCompressor:
+    def __init__(self, quality: int = 5):
+        self._compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+COMPRESSORS: dict[str, type[FlushingCompressor]] = {"gzip": GzipCompressor}
+if brotli is not None:
+    COMPRESSORS["br"] = BrotliCompressor
+
+
+def negotiate_encoding(accept_encoding: str | None) -> str | None:
+    """Picks the encoding of a stream from the `Accept-Encoding` header, brotli first.
+
+    Returns None if the client accepts none of them.
+    """
+    if not accept_encoding:
+        return None
+    accepted, rejected = set(), set()
+    for item in accept_encoding.split(","):
+        coding, *params = item.split(";")
+        if all(_get_quality(param) > 0 for param in params):
+            accepted.add(coding.strip().lower())
+        else:
+            rejected.add(coding.strip().lower())
+    for encoding in ("br", "gzip"):
+        if (
+            encoding in COMPRESSORS
+            and encoding not in rejected
+            and (encoding in accepted or "*" in accepted)
+        ):
+            return encoding
+    return None
+
+
+def _get_quality(param: str) -> float:
+    """The quality value of an `Accept-Encoding` param, 1 if it is not a quality."""
+    name, _, value = param.partition("=")
+    if name.strip().lower() != "q":
+        return 1.0
+    try:
+        return float(value)
+    except ValueError:
+        return 0.0
+
+
+async def compress_stream(
+    events: AsyncIterator[str], encoding: str
+) -> AsyncIterator[bytes]:
+    """Compresses a stream of server-sent events, flushing after every event.
+
+    Flushing costs some compression ratio, but the client receives every event as soon
+    as it is produced, as without compression.
+    """
+    compressor = COMPRESSORS[encoding]()
+    cpu = 0.0
+    raw_size = compressed_size = 0
+    try:
+        async for event in events:
+            data = event.encode()
+            start = perf_counter()
+            compressed = compressor.compress(data)
+            cpu += perf_counter() - start
+            raw_size += len(data)
+            compressed_size += len(compressed)
+            yield compressed
+        start = perf_counter()
+        compressed = compressor.finish()
+        cpu += perf_counter() - start
+        compressed_size += len(compressed)
+        yield compressed
+    finally:
+        uncompressed_bytes.labels(encoding=encoding).inc(raw_size)
+        compressed_bytes.labels(encoding=encoding).inc(compressed_size)
+        compression_seconds.labels(encoding=encoding).observe(cpu)
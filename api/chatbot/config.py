@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 import logging
-from typing import Any, Self
+from typing import Any, Literal, Self
 
 from langchain_openai import ChatOpenAI
 from pydantic import (
@@ -15,7 +15,11 @@ from pydantic import (
 from pydantic.networks import _BaseMultiHostUrl
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
-from chatbot.llm_client import ExtendedChatOpenAI, llm_client_factory
+from chatbot.llm_client import (
+    ExtendedChatOpenAI,
+    VLLMChatOpenAI,
+    llm_client_factory,
+)
 from chatbot.llm_client.base import StreamThinkingProcessor
 
 
@@ -42,11 +46,119 @@ class S3Settings(BaseModel):
     bucket: str
 
 
+class DBPoolSettings(BaseModel):
+    """Connection pool settings of the database engines, the primary and the standby have one pool each."""
+
+    size: int = 5
+    """Number of connections kept open. 0 to disable pooling, every session opening its own connection."""
+    max_overflow: int = 10
+    """Number of connections opened beyond `size` under load, closed once returned."""
+    timeout: float = 30.0
+    """Seconds to wait for a connection when the pool is exhausted."""
+    recycle: int = 1800
+    """Seconds after which a connection is replaced, -1 to keep connections forever."""
+    pre_ping: bool = True
+    """Test connections when they are checked out, e.g. after the database or pgbouncer restarted."""
+    prepare_threshold: int | None = 5
+    """Executions of a query after which psycopg prepares it on the server.
+    None to never prepare, required behind pgbouncer in transaction mode, unless it tracks
+    prepared statements (pgbouncer >= 1.21 with `max_prepared_statements`).
+    """
+
+
+class LLMHttpSettings(BaseModel):
+    """Connection pool settings of the HTTP transport shared by all LLM clients."""
+
+    max_connections: int = 100
+    """Maximum number of concurrent connections across all LLM backends."""
+    max_keepalive_connections: int = 20
+    """Maximum number of idle connections kept alive in the pool."""
+    keepalive_expiry: float = 30.0
+    """Seconds an idle connection is kept alive before being closed."""
+    http2: bool = True
+    """Negotiate HTTP/2 (via ALPN) when the backend supports it.
+    Plain-text backends keep using HTTP/1.1.
+    """
+    timeout: float = 600.0
+    """Seconds before a request to an LLM backend times out, the OpenAI SDK default.
+    Applies to the calls made outside the SDK (tokenize, server info, batched completions),
+    the SDK calls use the `request_timeout` of the LLM client.
+    """
+
+
+class LLMCacheSettings(BaseModel):
+    """Settings of the response cache of internal LLM calls (title summarization and tool picking)."""
+
+    enabled: bool = True
+    maxsize: int = 1024
+    """Maximum number of cached responses."""
+    ttl: float | None = 3600
+    """Seconds a cached response stays valid, None to never expire."""
+    max_bytes: int | None = 16 * 1024 * 1024
+    """Maximum estimated size of the cached responses, None for no limit."""
+
+
+class SafetySettings(BaseModel):
+    """Settings of the safety classification with `safety_llm`."""
+
+    batch_window: float | None = None
+    """Seconds to wait for concurrent classifications to be sent as one completion request, None to disable batching.
+    Only supported when `safety_llm` is served by vLLM, with `"metadata": {"provider": "vllm"}`.
+    """
+    max_batch_size: int = 32
+    """Maximum number of classifications in one batch."""
+    verdict_cache_size: int = 4096
+    """Maximum number of cached verdicts, 0 to disable the verdict cache."""
+    verdict_cache_ttl: float | None = 3600
+    """Seconds a cached verdict stays valid, None to never expire."""
+    max_input_tokens: int | None = 2048
+    """Token budget of the input to classify, longer inputs are classified by head and tail windows.
+    None to only bound it by the context length of `safety_llm`.
+    """
+
+
+class SSESettings(BaseModel):
+    """Settings of the server-sent events of the chat stream."""
+
+    coalesce_interval: float | None = None
+    """Seconds to merge consecutive chunks of a message into one event (e.g. 0.016 to 0.05).
+    None to send one event per chunk.
+    """
+    coalesce_max_bytes: int = 4096
+    """Size of the merged text at which a merged event is sent without waiting for the interval."""
+    replay_max_bytes: int | None = 1024 * 1024
+    """Size of the events kept per generation for clients to resume the stream. None to disable resuming."""
+    replay_max_streams: int = 256
+    """Maximum number of generations kept for resuming."""
+    replay_ttl: float = 900
+    """Seconds a generation is kept for resuming after it started."""
+    abandon_timeout: float | None = 30
+    """Seconds a generation carries on after its client disconnected, for the client to resume it.
+    None to always complete the generation. Without resuming, the generation is aborted right away.
+    """
+    backpressure_high_water: int | None = 256 * 1024
+    """Size of the events not sent to a client yet at which `backpressure_policy` applies.
+    None to buffer without limit (or up to `replay_max_bytes`, after which the client is dropped).
+    """
+    backpressure_low_water: int = 64 * 1024
+    """Size of the events not sent to a client yet at which `backpressure_policy` stops applying."""
+    backpressure_policy: Literal["coalesce", "pause", "drop"] = "coalesce"
+    """What to do while a client is behind the high-water mark:
+
+    - "coalesce": merge the chunks of a message into bigger events, the generation goes on.
+    - "pause": stop reading the generation until the client catches up.
+    - "drop": end the stream of the client, it gets the final answer with the conversation.
+    """
+    compression: bool = False
+    """Compress the chat streams (brotli or gzip, as accepted by the client), flushing after every event."""
+
+
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(env_nested_delimiter="__", extra="ignore")
 
     llms: list[ChatOpenAI]
     safety_llm: ChatOpenAI | None = None
+    safety: SafetySettings = Field(default_factory=SafetySettings)
 
     # I can't use inmemory sqlite, as it does not persist across sessions.
     # The shared-cache mode can be used but it is discouraged.
@@ -57,8 +169,16 @@ class Settings(BaseSettings):
     """Standby database url for read only connections.
     Defaults to `db_primary_url`.
     """
+    db_pool: DBPoolSettings = Field(default_factory=DBPoolSettings)
+    conversation_write_interval: float = 2.0
+    """Seconds between the batched writes of conversation updates (`last_message_at`, generated titles).
+    It bounds how stale the conversation list can be.
+    """
 
     s3: S3Settings = Field(default_factory=S3Settings)
+    llm_http: LLMHttpSettings = Field(default_factory=LLMHttpSettings)
+    llm_cache: LLMCacheSettings = Field(default_factory=LLMCacheSettings)
+    sse: SSESettings = Field(default_factory=SSESettings)
 
     serp_api_key: str | None = None
     ipgeolocation_api_key: str | None = None
@@ -126,7 +246,13 @@ class Settings(BaseSettings):
             return None
         if not isinstance(value, dict):
             return value
-        return ChatOpenAI(**value, tags=["internal"])
+        # `ExtendedChatOpenAI` for admission control (`max_in_flight_requests`).
+        # vLLM is only known by its provider name, the safety model is not guessed.
+        provider = (value.get("metadata") or {}).get("provider") or ""
+        client_type = (
+            VLLMChatOpenAI if provider.lower() == "vllm" else ExtendedChatOpenAI
+        )
+        return client_type(**value, tags=["internal"])
 
     @model_validator(mode="after")
     def set_default_standby_url(self) -> Self:
@@ -1,18 +1,22 @@
-from .agent import AgentForStateDep, AgentStateDep, SmrChainDep
+from .agent import AgentForStateDep, AgentStateDep, SmrChainDep, StateCacheDep
 from .auth import UserIdHeaderDep, UsernameHeaderDep, EmailHeaderDep
 from .commons import uuid_or_404
 from .db import SqlalchemySessionDep, SqlalchemyROSessionDep
+from .ownership import OwnedConversationIdDep, OwnerCacheDep
 from .s3 import S3ClientDep
 
 __all__ = [
     "AgentForStateDep",
     "AgentStateDep",
     "SmrChainDep",
+    "StateCacheDep",
     "UserIdHeaderDep",
     "UsernameHeaderDep",
     "EmailHeaderDep",
     "SqlalchemySessionDep",
     "SqlalchemyROSessionDep",
+    "OwnedConversationIdDep",
+    "OwnerCacheDep",
     "S3ClientDep",
     "uuid_or_404",
 ]
@@ -2,26 +2,31 @@ from __future__ import annotations
 
 import logging
 from contextlib import asynccontextmanager
-from functools import partial
-from typing import Annotated, AsyncGenerator
+from functools import cache, partial
+from typing import Annotated, AsyncGenerator, Callable
+from uuid import UUID
 
-from fastapi import Depends, Header
+from fastapi import Depends, Header, Request, WebSocket
+from langchain_core.messages import BaseMessage
 from langchain_core.runnables import Runnable, RunnableConfig
 from langchain_core.tools import BaseTool
 from langchain_openai import ChatOpenAI
 from langgraph.checkpoint.base import BaseCheckpointSaver
 from langgraph.graph.state import CompiledStateGraph
 from langgraph.types import StateSnapshot
+from sqlalchemy import make_url
 
 from chatbot.agent import create_agent
 from chatbot.agent.smry import create_summary_agent
-from chatbot.dependencies.commons import SettingsDep
-from chatbot.dependencies.db import SqlalchemyEngineDep, get_raw_conn
+from chatbot.cache import LRUCache
+from chatbot.config import DBPoolSettings
 from chatbot.http_client import HttpClient
+from chatbot.llm_client.cache import ResponseCache
+from chatbot.metrics.db import pool_checked_out, pool_max_connections
+from chatbot.safety import create_hazard_classifier
 from chatbot.tools import BrowserTool, GeoLocationTool, SearchTool, WeatherTool
 
-
-from .commons import get_http_client
+from .commons import SettingsDep, get_http_client, get_settings
 
 
 logger = logging.getLogger(__name__)
@@ -33,6 +38,61 @@ def ModelHeader(alias: str | None = None, **kwargs):
     return Header(alias=alias, **kwargs)
 
 
+@cache
+def get_response_cache() -> ResponseCache | None:
+    """Get the response cache shared by the internal LLM calls, None if disabled."""
+    settings = get_settings().llm_cache
+    if not settings.enabled:
+        return None
+    return ResponseCache(
+        settings.maxsize, ttl=settings.ttl, max_bytes=settings.max_bytes
+    )
+
+
+ResponseCacheDep = Annotated[ResponseCache | None, Depends(get_response_cache)]
+
+
+@cache
+def get_hazard_classifier() -> Runnable | None:
+    """Get the hazard classifier shared across requests, None if no `safety_llm` configured.
+
+    It is shared so that concurrent classifications can be batched together, and its verdict cache is shared.
+    """
+    settings = get_settings()
+    if settings.safety_llm is None:
+        return None
+    verdict_cache = None
+    if settings.safety.verdict_cache_size > 0:
+        verdict_cache = LRUCache(
+            settings.safety.verdict_cache_size, ttl=settings.safety.verdict_cache_ttl
+        )
+    return create_hazard_classifier(
+        settings.safety_llm,
+        batch_window=settings.safety.batch_window,
+        max_batch_size=settings.safety.max_batch_size,
+        verdict_cache=verdict_cache,
+        max_input_tokens=settings.safety.max_input_tokens,
+    )
+
+
+HazardClassifierDep = Annotated[Runnable | None, Depends(get_hazard_classifier)]
+
+
+@cache
+def get_state_cache() -> LRUCache[UUID, list[BaseMessage]]:
+    """Get the messages of the conversations recently answered by this process.
+
+    They are the final states of the generations, kept so that post-processing (e.g.
+    feedback) does not have to read the checkpoint back. Messages are not modified
+    once generated (except their feedback), so a message found here is up to date even
+    if the conversation continued elsewhere.
+    """
+    return LRUCache(256, ttl=900)
+
+
+StateCacheDep = Annotated[LRUCache[UUID, list[BaseMessage]], Depends(get_state_cache)]
+
+
 # Cannot apply `lru_cache` to this function:
 def get_tools(
     settings: SettingsDep,
@@ -65,52 +125,115 @@ def get_tools(
 
 
 @asynccontextmanager
-async def get_checkpointer(
-    settings: SettingsDep,
-    engine: SqlalchemyEngineDep,
-) -> AsyncGenerator[BaseCheckpointSaver, None]:
-    if settings.db_primary_url.scheme.startswith("postgresql"):
+async def open_checkpointers(
+    url: str, pool: DBPoolSettings
+) -> AsyncGenerator[Callable[[], BaseCheckpointSaver], None]:
+    """Opens the connections of the checkpointers, for the lifetime of the app.
+
+    Yields a factory of checkpointers. Postgres checkpointers share a connection pool,
+    checking a connection out for each checkpoint read or write only. A checkpointer
+    serializes its operations, so every agent gets its own, they are cheap to create.
+    SQLite checkpointers share one connection, so they are all the same.
+    """
+    if url.startswith("postgresql"):
         from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+        from psycopg.rows import dict_row
+        from psycopg_pool import AsyncConnectionPool
+
+        async with AsyncConnectionPool(
+            make_url(url).set(drivername="postgresql").render_as_string(False),
+            min_size=pool.size,
+            max_size=max(pool.size + pool.max_overflow, 1),
+            timeout=pool.timeout,
+            max_lifetime=pool.recycle if pool.recycle > 0 else float("inf"),
+            check=AsyncConnectionPool.check_connection if pool.pre_ping else None,
+            # Required by `AsyncPostgresSaver`.
+            kwargs={
+                "autocommit": True,
+                "row_factory": dict_row,
+                "prepare_threshold": pool.prepare_threshold,
+            },
+        ) as conn_pool:
+            pool_checked_out.labels(engine="checkpointer").set_function(
+                lambda: (stats := conn_pool.get_stats())["pool_size"]
+                - stats["pool_available"]
+            )
+            pool_max_connections.labels(engine="checkpointer").set(conn_pool.max_size)
+            yield partial(AsyncPostgresSaver, conn_pool)
 
-        async with get_raw_conn(engine) as conn:
-            yield AsyncPostgresSaver(conn)
-
-    elif settings.db_primary_url.scheme.startswith("sqlite"):
+    elif url.startswith("sqlite"):
         from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 
-        async with get_raw_conn(engine) as conn:
-            yield AsyncSqliteSaver(conn)
+        async with AsyncSqliteSaver.from_conn_string(
+            make_url(url).database or ":memory:"
+        ) as checkpointer:
+            yield lambda: checkpointer
     else:
         from langgraph.checkpoint.memory import InMemorySaver
 
-        yield InMemorySaver()
+        checkpointer = InMemorySaver()
+        yield lambda: checkpointer
+
+
+def get_checkpointer(
+    request: Request = None, websocket: WebSocket = None
+) -> BaseCheckpointSaver:
+    """Get a checkpointer from scope.
+
+    Scope can be either request or websocket.
+    The connections of the checkpointers are opened in app lifespan.
+    """
+    scope = request or websocket
+    return scope.app.state.new_checkpointer()
+
+
+CheckpointerDep = Annotated[BaseCheckpointSaver, Depends(get_checkpointer)]
+
+
+def get_checkpointer_factory(
+    request: Request = None, websocket: WebSocket = None
+) -> Callable[[], BaseCheckpointSaver]:
+    """Get the factory of checkpointers from scope, see `open_checkpointers`."""
+    scope = request or websocket
+    return scope.app.state.new_checkpointer
+
+
+CheckpointerFactoryDep = Annotated[
+    Callable[[], BaseCheckpointSaver], Depends(get_checkpointer_factory)
+]
 
 
 @asynccontextmanager
 async def get_agent(
-    engine: SqlalchemyEngineDep,
+    new_checkpointer: Callable[[], BaseCheckpointSaver],
     tools: Annotated[list[BaseTool], Depends(get_tools)],
     settings: SettingsDep,
+    response_cache: ResponseCacheDep,
+    hazard_classifier: HazardClassifierDep,
     select_model: Annotated[str | None, ModelHeader()] = None,
 ) -> AsyncGenerator[CompiledStateGraph, None]:
     llm = settings.must_get_llm(select_model)
 
-    async with get_checkpointer(settings, engine) as checkpointer:
-        # Cannot use return here, or the connection will be closed.
-        yield create_agent(
-            llm,
-            safety_model=settings.safety_llm,
-            checkpointer=checkpointer,
-            tools=tools,
-        )
+    # A checkpointer per agent, a websocket runs several agents concurrently.
+    yield create_agent(
+        llm,
+        hazard_classifier=hazard_classifier,
+        checkpointer=new_checkpointer(),
+        tools=tools,
+        cache=response_cache,
+    )
 
 
 def get_agent_wrapper(
-    engine: SqlalchemyEngineDep,
+    new_checkpointer: CheckpointerFactoryDep,
     tools: Annotated[list[BaseTool], Depends(get_tools)],
     settings: SettingsDep,
+    response_cache: ResponseCacheDep,
+    hazard_classifier: HazardClassifierDep,
 ) -> partial[AsyncGenerator[CompiledStateGraph, None]]:
-    return partial(get_agent, engine, tools, settings)
+    return partial(
+        get_agent, new_checkpointer, tools, settings, response_cache, hazard_classifier
+    )
 
 
 AgentWrapperDep = Annotated[
@@ -118,10 +241,7 @@ AgentWrapperDep = Annotated[
 ]
 
 
-async def get_agent_for_state(
-    engine: SqlalchemyEngineDep,
-    settings: SettingsDep,
-) -> AsyncGenerator[CompiledStateGraph, None]:
+def get_agent_for_state(checkpointer: CheckpointerDep) -> CompiledStateGraph:
     """Get an agent only for accessing the state.
 
     Only the checkpointer is needed in such usecase.
@@ -130,17 +250,13 @@ async def get_agent_for_state(
     """
     # A whatever LLM.
     llm = ChatOpenAI(openai_api_key="whatever")
-    async with get_checkpointer(settings, engine) as checkpointer:
-        # Cannot use return here, or the connection will be closed.
-        yield create_agent(
-            llm,
-            checkpointer=checkpointer,
-        )
+    return create_agent(
+        llm,
+        checkpointer=checkpointer,
+    )
 
 
-AgentForStateDep = Annotated[
-    AsyncGenerator[CompiledStateGraph, None], Depends(get_agent_for_state)
-]
+AgentForStateDep = Annotated[CompiledStateGraph, Depends(get_agent_for_state)]
 
 
 # A simple wrapper when you have access to `conversation_id` in the endpoint.
@@ -166,18 +282,21 @@ AgentStateDep = Annotated[StateSnapshot, Depends(get_agent_state)]
 # So for now this function is not cached.
 def get_smry_chain(
     settings: SettingsDep,
+    response_cache: ResponseCacheDep,
     select_model: Annotated[str | None, ModelHeader()] = None,
 ) -> Runnable:
     llm = settings.must_get_llm(select_model)
 
-    return create_summary_agent(llm)
+    return create_summary_agent(llm, cache=response_cache)
 
 
 SmrChainDep = Annotated[Runnable, Depends(get_smry_chain)]
 
 
-def get_smry_chain_wrapper(settings: SettingsDep) -> partial[Runnable]:
-    return partial(get_smry_chain, settings)
+def get_smry_chain_wrapper(
+    settings: SettingsDep, response_cache: ResponseCacheDep
+) -> partial[Runnable]:
+    return partial(get_smry_chain, settings, response_cache)
 
 
 SmrChainWrapperDep = Annotated[partial[Runnable], Depends(get_smry_chain_wrapper)]
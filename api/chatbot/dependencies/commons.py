@@ -6,6 +6,8 @@ from fastapi import Depends, HTTPException, Path, Request, WebSocket
 
 from chatbot.config import Settings
 from chatbot.http_client import HttpClient
+from chatbot.notifications import NotificationHub
+from chatbot.streaming import StreamRegistry
 
 
 @cache
@@ -16,6 +18,34 @@ def get_settings() -> Settings:
 SettingsDep = Annotated[Settings, Depends(get_settings)]
 
 
+@cache
+def get_stream_registry() -> StreamRegistry | None:
+    """Get the replay buffers of the chat streams, None if resuming is disabled."""
+    settings = get_settings().sse
+    if settings.replay_max_bytes is None:
+        return None
+    return StreamRegistry(
+        settings.replay_max_streams,
+        ttl=settings.replay_ttl,
+        max_bytes=settings.replay_max_bytes,
+        abandon_timeout=settings.abandon_timeout,
+        high_water=settings.backpressure_high_water,
+        low_water=settings.backpressure_low_water,
+        policy=settings.backpressure_policy,
+    )
+
+
+StreamRegistryDep = Annotated[StreamRegistry | None, Depends(get_stream_registry)]
+
+
+@cache
+def get_notification_hub() -> NotificationHub:
+    return NotificationHub()
+
+
+NotificationHubDep = Annotated[NotificationHub, Depends(get_notification_hub)]
+
+
 def get_http_client(request: Request = None, websocket: WebSocket = None) -> HttpClient:
     """Get aiohttp session from scope.
 
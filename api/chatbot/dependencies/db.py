@@ -1,6 +1,6 @@
 from collections.abc import AsyncGenerator
-from contextlib import asynccontextmanager
 from functools import cache
+from time import perf_counter
 from typing import Annotated, Any
 
 from fastapi import Depends
@@ -10,16 +10,61 @@ from sqlalchemy.ext.asyncio import (
     async_sessionmaker,
     create_async_engine,
 )
-from sqlalchemy.pool import NullPool
-
-from chatbot.dependencies.commons import SettingsDep
+from sqlalchemy.pool import AsyncAdaptedQueuePool, ConnectionPoolEntry, NullPool
+
+from chatbot.config import DBPoolSettings
+from chatbot.dependencies.commons import SettingsDep, get_settings
+from chatbot.metrics.db import (
+    pool_checked_out,
+    pool_checkout_seconds,
+    pool_max_connections,
+)
+from chatbot.write_behind import ConversationUpdates
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """A queue pool timing its checkouts, labelled by its `logging_name`."""
+
+    def _do_get(self) -> ConnectionPoolEntry:
+        start = perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_checkout_seconds.labels(engine=self.logging_name).observe(
+                perf_counter() - start
+            )
+
+
+def create_pooled_engine(
+    url: str, pool: DBPoolSettings, name: str, **kwargs: Any
+) -> AsyncEngine:
+    """Creates an engine with a pool configured by `pool`, its metrics labelled by `name`."""
+    if url.startswith("postgresql+psycopg"):
+        kwargs["connect_args"] = {"prepare_threshold": pool.prepare_threshold}
+    if pool.size <= 0:
+        return create_async_engine(url, poolclass=NullPool, **kwargs)
+
+    engine = create_async_engine(
+        url,
+        poolclass=InstrumentedPool,
+        pool_size=pool.size,
+        max_overflow=pool.max_overflow,
+        pool_timeout=pool.timeout,
+        pool_recycle=pool.recycle,
+        pool_pre_ping=pool.pre_ping,
+        pool_logging_name=name,
+        **kwargs,
+    )
+    # `engine.pool` is replaced when the engine is disposed.
+    pool_checked_out.labels(engine=name).set_function(lambda: engine.pool.checkedout())
+    pool_max_connections.labels(engine=name).set(pool.size + pool.max_overflow)
+    return engine
 
 
 @cache
 def create_engine(settings: SettingsDep) -> AsyncEngine:
-    return create_async_engine(
-        str(settings.db_primary_url),
-        poolclass=NullPool,
+    return create_pooled_engine(
+        str(settings.db_primary_url), settings.db_pool, "primary"
     )
 
 
@@ -54,18 +99,19 @@ async def get_sqlalchemy_session(
 SqlalchemySessionDep = Annotated[AsyncSession, Depends(get_sqlalchemy_session)]
 
 
-@asynccontextmanager
-async def get_raw_conn(engine: SqlalchemyEngineDep) -> AsyncGenerator[Any, None]:
-    # See <https://docs.sqlalchemy.org/en/20/faq/connections.html#accessing-the-underlying-connection-for-an-asyncio-driver>
-    async with engine.begin() as conn:
-        # pep-249 style ConnectionFairy connection pool proxy object
-        # presents a sync interface
-        connection_fairy = await conn.get_raw_connection()
+@cache
+def get_conversation_updates() -> ConversationUpdates:
+    """Get the write-behind buffer of conversation updates, flushed by the app lifespan."""
+    settings = get_settings()
+    return ConversationUpdates(
+        create_sessionmaker(create_engine(settings)),
+        interval=settings.conversation_write_interval,
+    )
+
 
-        # the really-real innermost driver connection is available
-        # from the .driver_connection attribute
-        raw_asyncio_connection = connection_fairy.driver_connection
-        yield raw_asyncio_connection
+ConversationUpdatesDep = Annotated[
+    ConversationUpdates, Depends(get_conversation_updates)
+]
 
 
 @cache
@@ -73,10 +119,8 @@ def create_ro_engine(settings: SettingsDep) -> AsyncEngine:
     kwargs = {}
     if settings.db_standby_url.scheme.startswith("postgres"):
         kwargs["isolation_level"] = "REPEATABLE READ"
-    return create_async_engine(
-        str(settings.db_standby_url),
-        poolclass=NullPool,
-        **kwargs,
+    return create_pooled_engine(
+        str(settings.db_standby_url), settings.db_pool, "standby", **kwargs
     )
 
 
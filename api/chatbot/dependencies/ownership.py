@@ -0,0 +1,71 @@
+from functools import cache
+from typing import Annotated
+from uuid import UUID
+
+from fastapi import Depends, HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from chatbot.cache import LRUCache
+from chatbot.dependencies.auth import UserIdHeaderDep
+from chatbot.dependencies.commons import uuid_or_404
+from chatbot.dependencies.db import SqlalchemySessionMakerDep
+from chatbot.metrics.conversation import owner_cache_requests
+from chatbot.models import Conversation
+
+
+@cache
+def get_owner_cache() -> LRUCache[UUID, str]:
+    """Get the owners of the conversations recently used in this process.
+
+    The owner of a conversation never changes, so an entry is only stale once the
+    conversation is deleted. Deletions invalidate the entry in this process only, other
+    replicas may see the deleted conversation for up to `ttl` seconds.
+    """
+    return LRUCache(4096, ttl=300)
+
+
+OwnerCacheDep = Annotated[LRUCache[UUID, str], Depends(get_owner_cache)]
+
+
+async def validate_conversation_owner(
+    session_maker: async_sessionmaker[AsyncSession],
+    owner_cache: LRUCache[UUID, str],
+    conversation_id: UUID,
+    userid: str,
+) -> None:
+    """Validate that the user owns the conversation.
+
+    Raises 404 if the conversation does not exist, and 403 if it is not the user's.
+    """
+    if (owner := owner_cache.get(conversation_id)) is not None:
+        owner_cache_requests.labels(result="hit").inc()
+    else:
+        owner_cache_requests.labels(result="miss").inc()
+        async with session_maker() as session:
+            owner = await session.scalar(
+                select(Conversation.owner).where(Conversation.id == conversation_id)
+            )
+        if owner is None:
+            raise HTTPException(
+                status_code=404, detail=f"Conversation [{conversation_id}] not found."
+            )
+        owner_cache.set(conversation_id, owner)
+    if owner != userid:
+        raise HTTPException(status_code=403, detail="authorization error")
+
+
+async def get_owned_conversation_id(
+    conversation_id: Annotated[UUID, uuid_or_404("conversation_id", "Conversation")],
+    userid: UserIdHeaderDep,
+    session_maker: SqlalchemySessionMakerDep,
+    owner_cache: OwnerCacheDep,
+) -> UUID:
+    """Get the `conversation_id` path param, once validated that the user owns it."""
+    await validate_conversation_owner(
+        session_maker, owner_cache, conversation_id, userid
+    )
+    return conversation_id
+
+
+OwnedConversationIdDep = Annotated[UUID, Depends(get_owned_conversation_id)]
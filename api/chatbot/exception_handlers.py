@@ -1,10 +1,13 @@
 import logging
+import math
 
 from fastapi import FastAPI, status
 from fastapi.requests import Request
 from fastapi.responses import JSONResponse
 from sqlalchemy.exc import IntegrityError, NoResultFound
 
+from chatbot.llm_client.ratelimit import ClientRateLimitError
+
 logger = logging.getLogger(__name__)
 
 
@@ -14,6 +17,7 @@ def register_exception_handlers(app: FastAPI):
     app.add_exception_handler(ValueError, handle_value_error)
     app.add_exception_handler(PermissionError, handle_permission_error)
     app.add_exception_handler(ConnectionError, handle_connection_error)
+    app.add_exception_handler(ClientRateLimitError, handle_client_rate_limit_error)
     app.add_exception_handler(Exception, handle_generic_exception)
 
 
@@ -55,6 +59,14 @@ def handle_connection_error(request: Request, exc: ConnectionError):
     )
 
 
+def handle_client_rate_limit_error(request: Request, exc: ClientRateLimitError):
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        content={"message": "Rate limit exceeded", "detail": str(exc)},
+        headers={"Retry-After": str(math.ceil(exc.retry_after))},
+    )
+
+
 def handle_generic_exception(request: Request, exc: Exception):
     logger.exception("Unhandled exception: %s", exc)
     return JSONResponse(
@@ -1,4 +1,4 @@
-from contextlib import asynccontextmanager
+from contextlib import AsyncExitStack, asynccontextmanager
 from inspect import iscoroutinefunction
 from functools import partial
 
@@ -8,8 +8,14 @@ from fastapi import FastAPI
 from langgraph.checkpoint.base import BaseCheckpointSaver
 from requests_cache import CachedSession
 
+from chatbot.dependencies.agent import open_checkpointers
 from chatbot.dependencies.commons import get_settings
-from chatbot.dependencies.db import create_engine
+from chatbot.dependencies.db import (
+    create_engine,
+    create_ro_engine,
+    get_conversation_updates,
+)
+from chatbot.llm_client.transport import bind_http_clients, create_http_clients
 
 
 @asynccontextmanager
@@ -26,30 +32,14 @@ async def lifespan(app: FastAPI):
             await conn.run_sync(Base.metadata.create_all)
 
     # Setup langgraph checkpointer tables
-    # PostgreSQL doesn't allow CREATE INDEX CONCURRENTLY within a transaction.
+    # PostgreSQL doesn't allow CREATE INDEX CONCURRENTLY within a transaction,
+    # the connections of the checkpointers are in autocommit mode.
     # See <https://github.com/langchain-ai/langgraph/issues/2887#issuecomment-2571645296>
-    autocommit_engine = sqlalchemy_engine.execution_options(
-        isolation_level="AUTOCOMMIT"
+    exit_stack = AsyncExitStack()
+    app.state.new_checkpointer = await exit_stack.enter_async_context(
+        open_checkpointers(str(settings.db_primary_url), settings.db_pool)
     )
-    async with autocommit_engine.begin() as conn:
-        if settings.db_primary_url.scheme.startswith("postgresql"):
-            from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
-
-            connection_fairy = await conn.get_raw_connection()
-            raw_asyncio_connection = connection_fairy.driver_connection
-            checkpointer = AsyncPostgresSaver(raw_asyncio_connection)
-
-        elif settings.db_primary_url.scheme.startswith("sqlite"):
-            from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
-
-            connection_fairy = await conn.get_raw_connection()
-            raw_asyncio_connection = connection_fairy.driver_connection
-            checkpointer = AsyncSqliteSaver(raw_asyncio_connection)
-        else:
-            from langgraph.checkpoint.memory import InMemorySaver
-
-            checkpointer = InMemorySaver()
-        await maybe_setup_checkpointer(checkpointer)
+    await maybe_setup_checkpointer(app.state.new_checkpointer())
 
     app.state.http_session = CachedSession(
         expire_after=-1, ignored_parameters=["api_key", "apikey"], use_temp=True
@@ -62,10 +52,30 @@ async def lifespan(app: FastAPI):
         cache=SQLiteBackend(use_temp=True),
     )
 
+    # One pooled transport for all LLM clients, instead of one pool per client.
+    llm_http_client, llm_async_http_client = create_http_clients(
+        **settings.llm_http.model_dump()
+    )
+    for llm in [*settings.llms, settings.safety_llm]:
+        if llm is not None:
+            bind_http_clients(llm, llm_http_client, llm_async_http_client)
+    app.state.llm_http_client = llm_http_client
+    app.state.llm_async_http_client = llm_async_http_client
+
+    conversation_updates = get_conversation_updates()
+    conversation_updates.start()
+
     yield
 
+    await conversation_updates.stop()
+    # Close the pooled connections.
+    await sqlalchemy_engine.dispose()
+    await create_ro_engine(settings).dispose()
+    await exit_stack.aclose()
     app.state.http_session.close()
     await app.state.aiohttp_session.close()
+    llm_http_client.close()
+    await llm_async_http_client.aclose()
 
 
 async def maybe_setup_checkpointer(checkpointer: BaseCheckpointSaver) -> None:
@@ -2,6 +2,7 @@ from .base import ExtendedChatOpenAI
 from .factory import llm_client_factory
 from .github import GithubChatOpenAI
 from .llamacpp import llamacppChatOpenAI
+from .sglang import SGLangChatOpenAI
 from .tgi import TGIChatOpenAI
 from .vllm import VLLMChatOpenAI
 
@@ -11,6 +12,7 @@ __all__ = [
     "ExtendedChatOpenAI",
     "GithubChatOpenAI",
     "llamacppChatOpenAI",
+    "SGLangChatOpenAI",
     "TGIChatOpenAI",
     "VLLMChatOpenAI",
 ]
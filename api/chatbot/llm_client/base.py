@@ -1,5 +1,6 @@
 import logging
 import re
+from contextlib import AbstractAsyncContextManager, contextmanager, nullcontext
 from typing import Any, AsyncIterator, Iterator, Literal, TypedDict, override
 
 from langchain_core.callbacks import (
@@ -8,15 +9,28 @@ from langchain_core.callbacks import (
 )
 from langchain_core.language_models.base import LanguageModelInput
 from langchain_core.load.serializable import Serializable
-from langchain_core.messages import BaseMessage, convert_to_openai_messages
-from langchain_core.outputs import ChatGenerationChunk
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    ToolMessage,
+    convert_to_openai_messages,
+)
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
 from langchain_openai import ChatOpenAI
 from langchain_openai.chat_models.base import _construct_responses_api_payload
-from pydantic import PrivateAttr, Field
+from openai import RateLimitError
+from pydantic import PrivateAttr, Field, model_validator
+
+from chatbot.cache import LRUCache
+
+from .ratelimit import AdaptiveRateLimiter
+from .scheduler import AdmissionScheduler, Priority
 
 
 logger = logging.getLogger(__name__)
 
+CONVERSION_CACHE_SIZE = 4096
+
 
 class MessageChunk(TypedDict):
     data: str
@@ -181,6 +195,25 @@ class StreamThinkingProcessor(Serializable):
 
 class ExtendedChatOpenAI(ChatOpenAI):
     thinking_processor: StreamThinkingProcessor | None = None
+    max_in_flight_requests: int | None = None
+    """Maximum number of concurrent requests sent to the model, None for no limit.
+    Exceeding requests are queued by priority, see `chatbot.llm_client.scheduler.Priority`.
+    """
+
+    requests_per_minute: float | None = None
+    """Seed rate of the client side rate limiter, None for unlimited until rate limited by the backend."""
+    max_rate_limit_wait: float = 30.0
+    """Seconds a request may be delayed by the client side rate limiter before being rejected."""
+
+    _scheduler: AdmissionScheduler | None = PrivateAttr(default=None)
+
+    _conversion_cache: LRUCache[tuple[str, int], list[dict]] = PrivateAttr(
+        default_factory=lambda: LRUCache(CONVERSION_CACHE_SIZE)
+    )
+    """Converted OpenAI messages, keyed by message id and content version.
+    History messages are converted on every token count and again for the request payload,
+    this cache makes sure each of them is only converted once.
+    """
 
     @override
     @classmethod
@@ -188,6 +221,25 @@ class ExtendedChatOpenAI(ChatOpenAI):
         """Get the namespace of the langchain object."""
         return ["chatbot", "llm", "client"]
 
+    @model_validator(mode="after")
+    def create_scheduler(self) -> "ExtendedChatOpenAI":
+        # Copies of the client (e.g. `model_copy`) share the same scheduler.
+        if self.max_in_flight_requests is not None:
+            self._scheduler = AdmissionScheduler(
+                self.max_in_flight_requests, model=self.model_name
+            )
+        return self
+
+    @model_validator(mode="after")
+    def create_rate_limiter(self) -> "ExtendedChatOpenAI":
+        if self.rate_limiter is None:
+            self.rate_limiter = AdaptiveRateLimiter(
+                self.requests_per_minute,
+                max_wait=self.max_rate_limit_wait,
+                model=self.model_name,
+            )
+        return self
+
     @override
     def _stream(
         self,
@@ -198,10 +250,11 @@ class ExtendedChatOpenAI(ChatOpenAI):
     ) -> Iterator[ChatGenerationChunk]:
         if self.thinking_processor:
             self.thinking_processor.reset()
-        for chunk in super()._stream(
-            messages, stop=stop, run_manager=run_manager, **kwargs
-        ):
-            yield self._process(chunk)
+        with self._observe_rate_limit():
+            for chunk in super()._stream(
+                messages, stop=stop, run_manager=run_manager, **kwargs
+            ):
+                yield self._process(chunk)
 
     @override
     async def _astream(
@@ -213,10 +266,49 @@ class ExtendedChatOpenAI(ChatOpenAI):
     ) -> AsyncIterator[ChatGenerationChunk]:
         if self.thinking_processor:
             self.thinking_processor.reset()
-        async for chunk in super()._astream(
-            messages, stop=stop, run_manager=run_manager, **kwargs
-        ):
-            yield self._process(chunk)
+        async with self._admit(run_manager):
+            with self._observe_rate_limit():
+                async for chunk in super()._astream(
+                    messages, stop=stop, run_manager=run_manager, **kwargs
+                ):
+                    yield self._process(chunk)
+
+    @override
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        async with self._admit(run_manager):
+            with self._observe_rate_limit():
+                return await super()._agenerate(
+                    messages, stop=stop, run_manager=run_manager, **kwargs
+                )
+
+    def _admit(
+        self, run_manager: AsyncCallbackManagerForLLMRun | None
+    ) -> AbstractAsyncContextManager[None]:
+        """Admission control of async requests, the priority is read from the run metadata."""
+        if self._scheduler is None:
+            return nullcontext()
+        metadata = run_manager.metadata if run_manager else None
+        return self._scheduler.admit(Priority.from_metadata(metadata))
+
+    @contextmanager
+    def _observe_rate_limit(self) -> Iterator[None]:
+        """Feeds the outcome of a request back to the adaptive rate limiter."""
+        limiter = self.rate_limiter
+        if not isinstance(limiter, AdaptiveRateLimiter):
+            yield
+            return
+        try:
+            yield
+        except RateLimitError as e:
+            limiter.on_rate_limited(e.response.headers)
+            raise
+        limiter.on_success()
 
     @override
     def _get_request_payload(
@@ -252,10 +344,14 @@ class ExtendedChatOpenAI(ChatOpenAI):
             payload["max_completion_tokens"] = payload.pop("max_tokens")
 
         # Mutate system message role to "developer" for o-series models
+        # NOTE: messages are copied rather than mutated, as they may be shared with the conversion cache.
         if self.model_name and re.match(r"^o\d", self.model_name):
-            for message in payload.get("messages", []):
-                if message["role"] == "system":
-                    message["role"] = "developer"
+            payload["messages"] = [
+                message | {"role": "developer"}
+                if message["role"] == "system"
+                else message
+                for message in payload.get("messages", [])
+            ]
 
         # endsection super
 
@@ -303,15 +399,41 @@ class ExtendedChatOpenAI(ChatOpenAI):
 
     def convert_messages(self, messages: list[BaseMessage]) -> list[dict]:
         """Convert Langchain messages to OpenAI messages."""
-        # Use `convert_to_openai_messages` instead of `_convert_message_to_dict`
-        oai_messages = convert_to_openai_messages(messages)
-        zipped_messages = zip(oai_messages, messages)
-
-        patched_messages = [
-            self.patch_content(oai_message, lc_message)
-            for oai_message, lc_message in zipped_messages
+        # Bind to local, accessing a pydantic private attribute is not free.
+        cache = self._conversion_cache
+        oai_messages = [
+            oai_message
+            for message in messages
+            for oai_message in self._convert_message(message, cache)
         ]
-        return self._truncate_multi_modal_contents(patched_messages)
+        return self._truncate_multi_modal_contents(oai_messages)
+
+    def _convert_message(
+        self,
+        message: BaseMessage,
+        cache: LRUCache[tuple[str, int], list[dict]],
+    ) -> list[dict]:
+        """Convert a Langchain message to OpenAI message(s), memoized by message id and content version.
+
+        The returned messages are shared with the cache and must not be mutated.
+        """
+        # Messages without id (e.g. the system prompt rendered per request) are not worth caching.
+        if message.id is None:
+            return self._do_convert_message(message)
+
+        key = (message.id, content_version(message))
+        if (oai_messages := cache.get(key)) is None:
+            oai_messages = self._do_convert_message(message)
+            cache.set(key, oai_messages)
+        return oai_messages
+
+    def _do_convert_message(self, message: BaseMessage) -> list[dict]:
+        # Use `convert_to_openai_messages` instead of `_convert_message_to_dict`
+        # A single message may be converted to multiple OpenAI messages (e.g. tool results).
+        oai_messages = convert_to_openai_messages([message])
+        if oai_messages:
+            oai_messages[0] = self.patch_content(oai_messages[0], message)
+        return oai_messages
 
     def _truncate_multi_modal_contents(self, messages: list[dict]) -> list[dict]:
         """Limit the number of multimodal content in the messages.
@@ -347,30 +469,34 @@ class ExtendedChatOpenAI(ChatOpenAI):
 
         # The goal is to keep the latest multimodal content in the messages.
         # So I reversly iterate the messages and filter out the multimodal content
+        # NOTE: messages are copied rather than mutated, as they may be shared with the conversion cache.
+        truncated = []
         for message in reversed(messages):
             content = message["content"]
             if not isinstance(content, list):
+                truncated.append(message)
                 continue
 
             # Same here, I want to keep the latest multimodal content in the message.
-            for i in range(len(content) - 1, -1, -1):
-                part = content[i]
-                if not isinstance(part, dict):
-                    continue
-
-                part_type = part.get("type")
-                if part_type == "image_url":
-                    if current_images < limit_image_per_prompt:
+            kept = []
+            for part in reversed(content):
+                if isinstance(part, dict):
+                    part_type = part.get("type")
+                    if part_type == "image_url":
+                        if current_images >= limit_image_per_prompt:
+                            continue
                         current_images += 1
-                    else:
-                        del content[i]
-                elif part_type == "video_url":
-                    if current_videos < limit_video_per_prompt:
+                    elif part_type == "video_url":
+                        if current_videos >= limit_video_per_prompt:
+                            continue
                         current_videos += 1
-                    else:
-                        del content[i]
+                kept.append(part)
+
+            if len(kept) < len(content):
+                message = message | {"content": kept[::-1]}
+            truncated.append(message)
 
-        return messages
+        return truncated[::-1]
 
     def patch_content(self, oai_message: dict, lc_message: BaseMessage) -> dict:
         if (raw_content := lc_message.additional_kwargs.get("raw_content")) is not None:
@@ -385,6 +511,56 @@ class ExtendedChatOpenAI(ChatOpenAI):
         return oai_message
 
 
+def content_version(message: BaseMessage) -> int:
+    """A cheap fingerprint of the parts of a message that affect its OpenAI conversion.
+
+    Checkpointed messages do not change except for `feedback`, which does not affect the conversion.
+    So this only guards against an id being reused with different content, and must stay much
+    cheaper than the conversion itself. Hashing strings is done in C.
+    """
+    content = message.content
+    if not isinstance(content, str):
+        content = tuple(_part_version(part) for part in content)
+    additional_kwargs = message.additional_kwargs
+    attachments = tuple(
+        attachment.get("url")
+        for attachment in additional_kwargs.get("attachments") or ()
+    )
+    # Avoid `getattr` with default, missing attributes are slow on pydantic models.
+    if isinstance(message, AIMessage):
+        # `args` is a dict, `repr` makes it hashable and is still done in C.
+        extra = tuple(
+            (tool_call["id"], tool_call["name"], repr(tool_call["args"]))
+            for tool_call in message.tool_calls
+        )
+    elif isinstance(message, ToolMessage):
+        extra = message.tool_call_id
+    else:
+        extra = None
+    return hash(
+        (
+            message.type,
+            content,
+            additional_kwargs.get("raw_content"),
+            attachments,
+            extra,
+        )
+    )
+
+
+def _part_version(part: str | dict) -> Any:
+    """The fingerprint of a content part: its text, or the url (or data) of its media."""
+    if not isinstance(part, dict):
+        return part
+    if (text := part.get("text") or part.get("thinking")) is not None:
+        return text
+    if (image_url := part.get("image_url")) is not None:
+        # OpenAI format, `image_url` is either a dict or the url itself.
+        return image_url.get("url") if isinstance(image_url, dict) else image_url
+    # LangChain standard format.
+    return part.get("url") or part.get("data") or part.get("type")
+
+
 def attach_attachments(content: str | list[dict[str, Any]], attachments: list) -> list:
     """Convert and append the attachments into content to be compatible with OpenAI's Chat API."""
 
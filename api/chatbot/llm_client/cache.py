@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import hashlib
+from typing import TYPE_CHECKING, Any
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumps
+
+from chatbot.cache import LRUCache
+from chatbot.metrics.llm import (
+    response_cache_bytes,
+    response_cache_entries,
+    response_cache_requests,
+)
+
+if TYPE_CHECKING:
+    from langchain_core.language_models import BaseChatModel
+
+
+class ResponseCache(BaseCache):
+    """An in-process LRU + TTL cache of LLM responses.
+
+    Meant for deterministic-ish internal calls (title summarization, tool picking)
+    that are often repeated on identical inputs.
+    Entries are keyed by the llm string (model name and call parameters) and the
+    fully rendered prompt, both hashed so the keys stay small.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        *,
+        ttl: float | None = 3600,
+        max_bytes: int | None = 16 * 1024 * 1024,
+    ):
+        self._cache: LRUCache[str, RETURN_VAL_TYPE] = LRUCache(
+            maxsize, ttl=ttl, max_bytes=max_bytes
+        )
+        response_cache_bytes.set_function(lambda: self.nbytes)
+        response_cache_entries.set_function(lambda: self.entries)
+
+    def lookup(self, prompt: str, llm_string: str) -> RETURN_VAL_TYPE | None:
+        value = self._cache.get(_make_key(prompt, llm_string))
+        response_cache_requests.labels(result="miss" if value is None else "hit").inc()
+        return value
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        # The serialized size is a good enough estimation of the memory usage.
+        self._cache.set(
+            _make_key(prompt, llm_string), return_val, size=len(dumps(return_val))
+        )
+
+    def clear(self, **kwargs: Any) -> None:
+        self._cache.clear()
+
+    # It's in memory, no need to run in an executor.
+    async def alookup(self, prompt: str, llm_string: str) -> RETURN_VAL_TYPE | None:
+        return self.lookup(prompt, llm_string)
+
+    async def aupdate(
+        self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE
+    ) -> None:
+        self.update(prompt, llm_string, return_val)
+
+    async def aclear(self, **kwargs: Any) -> None:
+        self.clear()
+
+    # NOTE: Do not define `__len__`, langchain checks the truthiness of the cache.
+    @property
+    def entries(self) -> int:
+        return len(self._cache)
+
+    @property
+    def nbytes(self) -> int:
+        return self._cache.nbytes
+
+
+def with_response_cache(
+    chat_model: BaseChatModel, cache: BaseCache | None
+) -> BaseChatModel:
+    """Returns a copy of `chat_model` that caches its responses in `cache`.
+
+    The model is returned as is if `cache` is None.
+    """
+    if cache is None:
+        return chat_model
+    return chat_model.model_copy(update={"cache": cache})
+
+
+def _make_key(prompt: str, llm_string: str) -> str:
+    return hashlib.sha256(f"{llm_string}\0{prompt}".encode()).hexdigest()
@@ -7,6 +7,7 @@ from requests.exceptions import HTTPError
 from .base import ExtendedChatOpenAI
 from .github import GithubChatOpenAI
 from .llamacpp import llamacppChatOpenAI
+from .sglang import SGLangChatOpenAI
 from .tgi import TGIChatOpenAI
 from .vllm import VLLMChatOpenAI
 
@@ -48,6 +49,8 @@ def _get_client_type_by_name(provider_name: str) -> type[ExtendedChatOpenAI] | N
             return TGIChatOpenAI
         case "llamacpp":
             return llamacppChatOpenAI
+        case "sglang":
+            return SGLangChatOpenAI
         case _:
             return None
 
@@ -102,8 +105,7 @@ def guess_provider(base_url: str, **client_kwargs) -> ExtendedChatOpenAI:
         resp.raise_for_status()
         data = resp.json()
         logger.info("Provider has `/get_server_info` endpoint, assuming it's SGLang")
-        # TODO: implement SGLang provider
-        return ExtendedChatOpenAI(base_url=base_url, **client_kwargs)
+        return SGLangChatOpenAI(base_url=base_url, server_info=data, **client_kwargs)
     except HTTPError:
         pass
 
@@ -129,6 +131,11 @@ def guess_provider(base_url: str, **client_kwargs) -> ExtendedChatOpenAI:
             return VLLMChatOpenAI(
                 base_url=base_url, models_meta=models_meta, **client_kwargs
             )
+        case "sglang":
+            models_meta = {model["id"]: model for model in models}
+            return SGLangChatOpenAI(
+                base_url=base_url, models_meta=models_meta, **client_kwargs
+            )
         case _:
             logger.warning(
                 "Unknown provider %s, falling back to Default client",
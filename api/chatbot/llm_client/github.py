@@ -8,11 +8,20 @@ from langchain_core.messages import BaseMessage
 from langchain_core.tools import BaseTool
 from langchain_openai.chat_models.base import _count_image_tokens, _url_to_size
 
+from chatbot.cache import LRUCache
+from chatbot.utils import is_valid_positive_int
+
 from .base import ExtendedChatOpenAI
 
 
 logger = logging.getLogger(__name__)
 
+IMAGE_SIZE_CACHE_SIZE = 1024
+IMAGE_SIZE_RETRY_AFTER = 60
+"""Seconds before the size of an image that failed to download is fetched again."""
+MAX_IMAGE_DIMENSION = 8192
+"""Recorded image dimensions are clamped to this, images are downscaled well below it anyway."""
+
 
 class GithubChatOpenAI(ExtendedChatOpenAI):
     models_meta: dict[str, Any] | None = None
@@ -66,6 +75,7 @@ class GithubChatOpenAI(ExtendedChatOpenAI):
                 " for information on how messages are converted to tokens."
             )
         num_tokens = 0
+        image_sizes = _collect_image_sizes(messages)
         oai_messages = self.convert_messages(messages)
         for message in oai_messages:
             num_tokens += tokens_per_message
@@ -85,7 +95,8 @@ class GithubChatOpenAI(ExtendedChatOpenAI):
                             if val["image_url"].get("detail") == "low":
                                 num_tokens += 85
                             else:
-                                image_size = _url_to_size(val["image_url"]["url"])
+                                url = val["image_url"]["url"]
+                                image_size = image_sizes.get(url) or url_to_size(url)
                                 if not image_size:
                                     continue
                                 num_tokens += _count_image_tokens(*image_size)
@@ -129,3 +140,54 @@ class GithubChatOpenAI(ExtendedChatOpenAI):
     def __hash__(self):
         # I use cache on `self` and cache doesn't work with mutable objects.
         return self.model_dump_json().__hash__()
+
+
+def _collect_image_sizes(messages: list[BaseMessage]) -> dict[str, tuple[int, int]]:
+    """Collect the image dimensions recorded in the attachments of the messages, keyed by url.
+
+    They are recorded by the server when the message is received. Still, invalid dimensions
+    are ignored (the image is downloaded instead), and large ones are clamped to
+    `MAX_IMAGE_DIMENSION`.
+    """
+    image_sizes = {}
+    for message in messages:
+        for attachment in message.additional_kwargs.get("attachments") or []:
+            width, height = attachment.get("width"), attachment.get("height")
+            if (
+                is_valid_positive_int(width)
+                and is_valid_positive_int(height)
+                and (url := attachment.get("url"))
+            ):
+                image_sizes[url] = (
+                    min(width, MAX_IMAGE_DIMENSION),
+                    min(height, MAX_IMAGE_DIMENSION),
+                )
+    return image_sizes
+
+
+def url_to_size(url: str) -> tuple[int, int] | None:
+    """Get the dimensions of an image url, downloading each remote image at most once."""
+    if url.startswith("data:"):
+        # Nothing to download, and I don't want to keep large data urls as cache keys.
+        return _url_to_size(url)
+    return _remote_url_to_size(url)
+
+
+_image_sizes: LRUCache[str, tuple[int, int]] = LRUCache(IMAGE_SIZE_CACHE_SIZE)
+# Failures are remembered for a while, otherwise a broken url would be fetched on every count.
+# But not for good, a transient error would make the image count as 0 tokens forever.
+_failed_urls: LRUCache[str, bool] = LRUCache(
+    IMAGE_SIZE_CACHE_SIZE, ttl=IMAGE_SIZE_RETRY_AFTER
+)
+
+
+def _remote_url_to_size(url: str) -> tuple[int, int] | None:
+    if (size := _image_sizes.get(url)) is not None:
+        return size
+    if _failed_urls.get(url):
+        return None
+    if (size := _url_to_size(url)) is None:
+        _failed_urls.set(url, True)
+    else:
+        _image_sizes.set(url, size)
+    return size
@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Mapping
+
+from langchain_core.rate_limiters import BaseRateLimiter
+
+from chatbot.metrics.llm import rate_limiter_rate, rate_limiter_rejections
+
+
+logger = logging.getLogger(__name__)
+
+MIN_REQUESTS_PER_MINUTE = 1.0
+DEFAULT_BURST_SECONDS = 10.0
+"""The default bucket capacity, in seconds worth of requests."""
+RECOVERY_STEP = 0.05
+"""Fraction of the ceiling rate regained after each successful request."""
+
+
+class ClientRateLimitError(Exception):
+    """The request was rejected by the client side rate limiter without being sent."""
+
+    def __init__(self, model: str, retry_after: float):
+        super().__init__(
+            f"Rate limit of {model} exceeded, retry after {retry_after:.1f}s"
+        )
+        self.model = model
+        self.retry_after = retry_after
+
+
+class AdaptiveRateLimiter(BaseRateLimiter):
+    """A token bucket rate limiter that learns from rate limit responses.
+
+    The bucket is seeded with `requests_per_minute` (None means unlimited until
+    the backend says otherwise). When the backend responds with 429:
+
+    - no request is sent until `Retry-After` (or the `x-ratelimit-reset-requests` header) passes.
+    - the rate is halved, or learned from the `x-ratelimit-limit-requests` header if unlimited.
+
+    Every successful request then regains a bit of the rate, up to the seeded (or learned) ceiling.
+
+    Requests that would wait longer than `max_wait` seconds are rejected with
+    `ClientRateLimitError` instead.
+    One instance is shared by all coroutines (and threads) using the same model.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float | None = None,
+        *,
+        burst: int | None = None,
+        max_wait: float = 30.0,
+        model: str = "",
+    ):
+        self.ceiling = requests_per_minute
+        self.rate = requests_per_minute
+        self.burst = burst
+        self.max_wait = max_wait
+        self.model = model
+
+        self._tokens = float(self._capacity)
+        self._last_refill = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+        rate_limiter_rate.labels(model=model).set_function(lambda: self.rate or 0)
+
+    @property
+    def _capacity(self) -> float:
+        if self.burst is not None:
+            return self.burst
+        if self.rate is None:
+            return 1
+        return max(1.0, self.rate / 60 * DEFAULT_BURST_SECONDS)
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        if (wait := self._reserve(blocking)) is None:
+            return False
+        if wait > 0:
+            time.sleep(wait)
+        return True
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        if (wait := self._reserve(blocking)) is None:
+            return False
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return True
+
+    def _reserve(self, blocking: bool) -> float | None:
+        """Takes a token, returns the seconds to wait before sending the request.
+
+        Returns None if the request would have to wait while not `blocking`.
+        Raises `ClientRateLimitError` if the request would wait longer than `max_wait`.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            wait = max(self._blocked_until - now, 0.0)
+            if self.rate is not None and self._tokens < 1:
+                wait = max(wait, (1 - self._tokens) / (self.rate / 60))
+            if wait > 0 and not blocking:
+                return None
+            if wait > self.max_wait:
+                rate_limiter_rejections.labels(model=self.model).inc()
+                raise ClientRateLimitError(self.model, wait)
+            # The token may be borrowed, later requests wait for it to be paid back.
+            self._tokens -= 1
+            return wait
+
+    def _refill(self, now: float) -> None:
+        if self.rate is None:
+            self._tokens = self._capacity
+        else:
+            elapsed = now - self._last_refill
+            self._tokens = min(self._capacity, self._tokens + elapsed * self.rate / 60)
+        self._last_refill = now
+
+    def on_rate_limited(self, headers: Mapping[str, str] | None = None) -> None:
+        """Tightens the limiter after a 429 response."""
+        headers = headers or {}
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if (retry_after := _get_retry_after(headers)) is not None:
+                self._blocked_until = max(self._blocked_until, now + retry_after)
+
+            if self.rate is not None:
+                self.rate = max(self.rate / 2, MIN_REQUESTS_PER_MINUTE)
+            elif limit := _parse_float(headers.get("x-ratelimit-limit-requests")):
+                # Assume the limit is per minute, as OpenAI's.
+                self.rate = self.ceiling = max(limit, MIN_REQUESTS_PER_MINUTE)
+            self._tokens = min(self._tokens, 0.0)
+            logger.warning(
+                "Rate limited by %s, retry after %s seconds, rate now %s requests per minute",
+                self.model,
+                retry_after,
+                self.rate,
+            )
+
+    def on_success(self) -> None:
+        """Regains some of the rate after a successful request."""
+        if self.rate is None or self.ceiling is None or self.rate >= self.ceiling:
+            return
+        with self._lock:
+            self.rate = min(self.rate + self.ceiling * RECOVERY_STEP, self.ceiling)
+
+
+def _get_retry_after(headers: Mapping[str, str]) -> float | None:
+    """Seconds to wait according to the rate limit headers, None if not present."""
+    if (retry_after_ms := _parse_float(headers.get("retry-after-ms"))) is not None:
+        return retry_after_ms / 1000
+    if (retry_after := headers.get("retry-after")) is not None:
+        if (seconds := _parse_float(retry_after)) is not None:
+            return seconds
+        try:
+            return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0)
+        except (TypeError, ValueError):
+            pass
+    if (reset := headers.get("x-ratelimit-reset-requests")) is not None:
+        return _parse_duration(reset)
+    return None
+
+
+_DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def _parse_duration(value: str) -> float | None:
+    """Parses durations like "1s", "6m0s" or "20ms" as used by OpenAI's rate limit headers."""
+    if (seconds := _parse_float(value)) is not None:
+        return seconds
+    parts = _DURATION_PATTERN.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+
+def _parse_float(value: str | None) -> float | None:
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from time import perf_counter
+from typing import Any, AsyncIterator
+
+from chatbot.metrics.llm import (
+    scheduler_in_flight,
+    scheduler_queue_depth,
+    scheduler_wait_seconds,
+)
+
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_METADATA_KEY = "llm_priority"
+"""The runnable metadata key to set the priority of an LLM call, e.g.
+`chain.with_config(metadata={PRIORITY_METADATA_KEY: Priority.SAFETY.label})`.
+"""
+
+
+class Priority(IntEnum):
+    """Priority classes of LLM calls, lower values are admitted first."""
+
+    CHAT = 0
+    """Interactive chat, someone is waiting for the answer."""
+    SAFETY = 1
+    TOOL_PICKER = 2
+    SUMMARIZATION = 3
+
+    @property
+    def label(self) -> str:
+        return self.name.lower()
+
+    @classmethod
+    def from_metadata(cls, metadata: dict[str, Any] | None) -> Priority:
+        """Gets the priority from runnable metadata, defaults to `CHAT`."""
+        value = (metadata or {}).get(PRIORITY_METADATA_KEY)
+        if value is None:
+            return cls.CHAT
+        if isinstance(value, cls):
+            return value
+        try:
+            return cls[str(value).upper()]
+        except KeyError:
+            logger.warning("Unknown LLM priority %s, using %s", value, cls.CHAT.label)
+            return cls.CHAT
+
+
+class AdmissionScheduler:
+    """Limits the number of in-flight requests to a model.
+
+    Requests exceeding the limit wait in a priority queue, and are admitted by
+    priority first, then in arrival order.
+
+    The scheduler is not thread-safe, it must only be used within one event loop.
+    """
+
+    def __init__(self, max_in_flight: int, model: str = ""):
+        if max_in_flight <= 0:
+            raise ValueError(f"max_in_flight must be positive, got {max_in_flight}")
+        self.max_in_flight = max_in_flight
+        self.model = model
+        self.in_flight = 0
+        # (priority, sequence, future)
+        self._waiters: list[tuple[Priority, int, asyncio.Future[None]]] = []
+        self._sequence = itertools.count()
+        scheduler_in_flight.labels(model=model).set_function(lambda: self.in_flight)
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for *_, future in self._waiters if not future.done())
+
+    @asynccontextmanager
+    async def admit(self, priority: Priority = Priority.CHAT) -> AsyncIterator[None]:
+        """Waits for a free slot and holds it for the duration of the context."""
+        await self._acquire(priority)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, priority: Priority) -> None:
+        start = perf_counter()
+        if self.in_flight < self.max_in_flight and not self.queue_depth:
+            self.in_flight += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+            depth = scheduler_queue_depth.labels(
+                model=self.model, priority=priority.label
+            )
+            depth.inc()
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # The slot was handed over right before the cancellation, pass it on.
+                    self._release()
+                raise
+            finally:
+                depth.dec()
+        scheduler_wait_seconds.labels(
+            model=self.model, priority=priority.label
+        ).observe(perf_counter() - start)
+
+    def _release(self) -> None:
+        # Hand the slot over to the first waiter that is still waiting.
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.in_flight -= 1
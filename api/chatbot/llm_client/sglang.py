@@ -0,0 +1,127 @@
+import logging
+from functools import cache
+from typing import Any, override
+from urllib.parse import urljoin
+
+from httpx import Client
+from langchain_core.messages import BaseMessage
+
+from chatbot.utils import is_valid_positive_int
+
+from .base import ExtendedChatOpenAI
+
+
+logger = logging.getLogger(__name__)
+
+
+class SGLangChatOpenAI(ExtendedChatOpenAI):
+    server_info: dict[str, Any] | None = None
+    models_meta: dict[str, Any] | None = None
+
+    tokens_per_message: int = 4
+    """Approximate number of tokens the chat template adds around each message.
+    SGLang's tokenize API does not apply the chat template, so this is added on top of the content tokens.
+    """
+
+    # Note on caching:
+    # Using `@functools.cache` or `@functools.lru_cache` on methods can prevent instance GC.
+    # See <https://rednafi.com/python/lru_cache_on_methods/> for details.
+    # This is acceptable here as client instances (one per LLM) live for the app's lifespan.
+    # Also note that standard functools caches do not support async methods.
+    # Since I want to apply caching here, async is not used for this method.
+    @cache
+    def get_context_length(self) -> int:
+        if self.server_info is None:
+            self._fetch_server_info()
+
+        # `context_length` is only set when the server is launched with `--context-length`.
+        max_model_len = self.server_info.get("context_length")
+        if is_valid_positive_int(max_model_len):
+            return max_model_len
+
+        # Otherwise it's derived from the model config, which is reported in `/v1/models`.
+        if self.models_meta is None:
+            self._fetch_models_meta()
+        model_info = self.models_meta.get(self.model_name) or {}
+        max_model_len = model_info.get("max_model_len")
+
+        # Should not happen, for type hint only.
+        assert max_model_len is not None, (
+            f"Model {self.model_name} does not have a max_context_length."
+        )
+        return max_model_len
+
+    @override
+    def get_num_tokens_from_messages(
+        self, messages: list[BaseMessage], **kwargs
+    ) -> int:
+        # Use `list` to create a copy of the messages to avoid modifying the original list
+        messages = list(messages)
+
+        oai_messages = self.convert_messages(messages)
+        texts = [_get_text(message) for message in oai_messages]
+
+        url = urljoin(self.openai_api_base, "/v1/tokenize")
+        http_client: Client = self.http_client or self.root_client._client
+        resp = http_client.post(
+            url,
+            json={
+                "model": self.model_name,
+                "prompt": texts,
+                "add_special_tokens": False,
+            },
+        ).raise_for_status()
+        data = resp.json()
+        counts = data["count"]
+        if isinstance(counts, int):
+            counts = [counts]
+        return sum(counts) + self.tokens_per_message * len(oai_messages)
+
+    def _fetch_server_info(self) -> None:
+        """Fetches server information."""
+        http_client: Client = self.http_client or self.root_client._client
+        resp = http_client.get(
+            urljoin(self.openai_api_base, "/get_server_info")
+        ).raise_for_status()
+        self.server_info = resp.json()
+
+    def _fetch_models_meta(self) -> None:
+        http_client: Client = self.http_client or self.root_client._client
+        resp = http_client.get(
+            urljoin(self.openai_api_base, "/v1/models")
+        ).raise_for_status()
+        data = resp.json()
+        models = data.get("data", [])
+        self.models_meta = {model["id"]: model for model in models}
+
+    def __hash__(self):
+        # I use cache on `self` and cache doesn't work with mutable objects.
+        return self.model_dump_json().__hash__()
+
+
+def _get_text(oai_message: dict[str, Any]) -> str:
+    """Concatenate the text parts of an OpenAI message, including the tool calls."""
+    content = oai_message.get("content")
+    if isinstance(content, str):
+        parts = [content]
+    elif isinstance(content, list):
+        parts = []
+        for part in content:
+            if isinstance(part, str):
+                parts.append(part)
+            elif part.get("type") == "text":
+                parts.append(part["text"])
+            else:
+                logger.debug(
+                    "Token counts for %s inputs are not supported. Ignoring.",
+                    part.get("type"),
+                )
+    else:
+        parts = []
+
+    for tool_call in oai_message.get("tool_calls") or []:
+        function = tool_call.get("function", {})
+        parts.append(function.get("name", ""))
+        parts.append(function.get("arguments", ""))
+
+    return "\n".join(parts)
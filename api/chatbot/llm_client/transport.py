@@ -0,0 +1,96 @@
+import logging
+
+import httpx
+from langchain_openai.chat_models.base import BaseChatOpenAI
+
+from chatbot.metrics.llm import http_pool_connections, http_pool_queued_requests
+
+
+logger = logging.getLogger(__name__)
+
+
+def create_http_clients(
+    *,
+    max_connections: int,
+    max_keepalive_connections: int,
+    keepalive_expiry: float,
+    http2: bool,
+    timeout: float,
+) -> tuple[httpx.Client, httpx.AsyncClient]:
+    """Create the sync and async HTTP clients shared by all LLM clients.
+
+    The async client carries the chat completion traffic. The sync client is used
+    by the auxiliary calls (tokenize, server info, etc.), which are invoked from
+    `trim_messages` and therefore cannot be async.
+
+    Both clients are instrumented with pool utilisation metrics.
+    `timeout` replaces the 5 seconds default of httpx, which is far too short for an LLM.
+    """
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive_connections,
+        keepalive_expiry=keepalive_expiry,
+    )
+    transport = httpx.HTTPTransport(limits=limits, http2=http2)
+    async_transport = httpx.AsyncHTTPTransport(limits=limits, http2=http2)
+    instrument_pool(transport, "sync")
+    instrument_pool(async_transport, "async")
+    return (
+        httpx.Client(transport=transport, timeout=timeout),
+        httpx.AsyncClient(transport=async_transport, timeout=timeout),
+    )
+
+
+def bind_http_clients(
+    llm: BaseChatOpenAI,
+    http_client: httpx.Client,
+    http_async_client: httpx.AsyncClient,
+) -> None:
+    """Rebind the OpenAI SDK clients of an already constructed LLM client onto the shared HTTP clients.
+
+    LLM clients are constructed when the settings are validated, which happens before the
+    app lifespan starts, so the shared clients cannot be passed to the constructor.
+    """
+    llm.http_client = http_client
+    llm.http_async_client = http_async_client
+    if llm.root_client is not None:
+        llm.root_client = llm.root_client.with_options(http_client=http_client)
+        llm.client = llm.root_client.chat.completions
+    if llm.root_async_client is not None:
+        llm.root_async_client = llm.root_async_client.with_options(
+            http_client=http_async_client
+        )
+        llm.async_client = llm.root_async_client.chat.completions
+    logger.info("LLM client %s bound to the shared HTTP transport.", llm.model_name)
+
+
+def instrument_pool(
+    transport: httpx.HTTPTransport | httpx.AsyncHTTPTransport, client: str
+) -> None:
+    """Expose the connection pool utilisation of `transport` as prometheus gauges.
+
+    Skipped if the httpx (or httpcore) version at hand does not have the private attributes.
+    """
+    # httpx does not expose the underlying httpcore pool publicly.
+    pool = getattr(transport, "_pool", None)
+    if pool is None or not hasattr(pool, "connections"):
+        logger.warning("Cannot find the connection pool of the %s transport.", client)
+        return
+
+    def count_connections(idle: bool) -> int:
+        return sum(1 for conn in pool.connections if conn.is_idle() == idle)
+
+    http_pool_connections.labels(client=client, state="active").set_function(
+        lambda: count_connections(idle=False)
+    )
+    http_pool_connections.labels(client=client, state="idle").set_function(
+        lambda: count_connections(idle=True)
+    )
+
+    if not hasattr(pool, "_requests"):
+        return
+
+    def count_queued_requests() -> int:
+        return sum(1 for request in pool._requests if request.is_queued())
+
+    http_pool_queued_requests.labels(client=client).set_function(count_queued_requests)
@@ -1,11 +1,14 @@
+import asyncio
+from contextlib import nullcontext
 from functools import cache
 from typing import Any, override
 from urllib.parse import urljoin
 
-from httpx import Client
+from httpx import AsyncClient, Client
 from langchain_core.messages import BaseMessage
 
 from .base import ExtendedChatOpenAI
+from .scheduler import Priority
 
 
 class VLLMChatOpenAI(ExtendedChatOpenAI):
@@ -49,6 +52,59 @@ class VLLMChatOpenAI(ExtendedChatOpenAI):
         data = resp.json()
         return data["count"]
 
+    async def abatch_complete(
+        self,
+        conversations: list[list[BaseMessage]],
+        *,
+        priority: Priority = Priority.CHAT,
+        **kwargs: Any,
+    ) -> list[str]:
+        """Completes several conversations with one `/v1/completions` request.
+
+        The chat completions API takes one conversation per request. Instead, every
+        conversation is rendered with the chat template of the model by the tokenize API,
+        and the token ids are sent together as the prompts of a single completion request,
+        which is admitted once with `priority`. `kwargs` are added to its payload.
+
+        Returns:
+            The completion text of each conversation, in order.
+        """
+        http_client: AsyncClient = (
+            self.http_async_client or self.root_async_client._client
+        )
+
+        async def tokenize(messages: list[BaseMessage]) -> list[int]:
+            resp = await http_client.post(
+                urljoin(self.openai_api_base, "/tokenize"),
+                json={
+                    "model": self.model_name,
+                    "messages": self.convert_messages(messages),
+                    "add_generation_prompt": True,
+                },
+            )
+            return resp.raise_for_status().json()["tokens"]
+
+        # Tokenizing does not touch the GPU, only the completion is worth batching.
+        prompts = await asyncio.gather(*map(tokenize, conversations))
+
+        if self.rate_limiter is not None:
+            await self.rate_limiter.aacquire()
+        admission = (
+            self._scheduler.admit(priority)
+            if self._scheduler is not None
+            else nullcontext()
+        )
+        async with admission:
+            resp = await http_client.post(
+                urljoin(self.openai_api_base, "/v1/completions"),
+                json={"model": self.model_name, "prompt": prompts, **kwargs},
+            )
+        choices = resp.raise_for_status().json()["choices"]
+        texts = [""] * len(conversations)
+        for choice in choices:
+            texts[choice["index"]] = choice["text"]
+        return texts
+
     def _fetch_models_meta(self) -> None:
         http_client: Client = self.http_client or self.root_client._client
         resp = http_client.get(
@@ -22,8 +22,10 @@ from .routers import (
     conv_router,
     files_router,
     message_router,
+    notification_router,
     probes_router,
     share_router,
+    websocket_router,
 )
 
 logger = logging.getLogger(__name__)
@@ -47,8 +49,10 @@ app.include_router(chat_router, prefix="/api", tags=["chat"])
 app.include_router(conv_router, prefix="/api", tags=["conversation"])
 app.include_router(files_router, prefix="/api", tags=["files"])
 app.include_router(message_router, prefix="/api", tags=["messages"])
+app.include_router(notification_router, prefix="/api", tags=["notifications"])
 app.include_router(probes_router, prefix="/api", tags=["probes"])
 app.include_router(share_router, prefix="/api", tags=["share"])
+app.include_router(websocket_router, prefix="/api", tags=["chat"])
 
 
 add_pagination(app)
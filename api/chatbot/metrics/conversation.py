@@ -0,0 +1,12 @@
+from prometheus_client import Counter, Histogram
+
+owner_cache_requests = Counter(
+    "conversation_owner_cache_requests",
+    "Number of lookups in the conversation owner cache",
+    ["result"],
+)
+update_batch_size = Histogram(
+    "conversation_update_batch_size",
+    "Number of conversations updated per write-behind batch",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+)
@@ -0,0 +1,18 @@
+from prometheus_client import Gauge, Histogram
+
+pool_checkout_seconds = Histogram(
+    "db_pool_checkout_seconds",
+    "Time to check out a database connection, waiting for one or connecting included",
+    ["engine"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+pool_checked_out = Gauge(
+    "db_pool_checked_out",
+    "Number of database connections in use",
+    ["engine"],
+)
+pool_max_connections = Gauge(
+    "db_pool_max_connections",
+    "Maximum number of database connections, pool size plus overflow",
+    ["engine"],
+)
@@ -1,4 +1,4 @@
-from prometheus_client import Counter
+from prometheus_client import Counter, Gauge, Histogram
 
 input_tokens = Counter(
     "input_tokens", "Number of input tokens to the LLM", ["user_id", "model_name"]
@@ -8,3 +8,55 @@ output_tokens = Counter(
     "Number of tokens generated by the LLM",
     ["user_id", "model_name"],
 )
+
+http_pool_connections = Gauge(
+    "llm_http_pool_connections",
+    "Number of connections in the HTTP pool shared by the LLM clients",
+    ["client", "state"],
+)
+http_pool_queued_requests = Gauge(
+    "llm_http_pool_queued_requests",
+    "Number of requests waiting for a connection from the HTTP pool shared by the LLM clients",
+    ["client"],
+)
+response_cache_requests = Counter(
+    "llm_response_cache_requests",
+    "Number of lookups in the LLM response cache",
+    ["result"],
+)
+response_cache_bytes = Gauge(
+    "llm_response_cache_bytes",
+    "Estimated size of the entries in the LLM response cache",
+)
+response_cache_entries = Gauge(
+    "llm_response_cache_entries",
+    "Number of entries in the LLM response cache",
+)
+
+scheduler_in_flight = Gauge(
+    "llm_scheduler_in_flight_requests",
+    "Number of admitted in-flight requests to the LLM",
+    ["model"],
+)
+scheduler_queue_depth = Gauge(
+    "llm_scheduler_queue_depth",
+    "Number of requests waiting for admission to the LLM",
+    ["model", "priority"],
+)
+scheduler_wait_seconds = Histogram(
+    "llm_scheduler_wait_seconds",
+    "Time requests waited for admission to the LLM",
+    ["model", "priority"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+
+rate_limiter_rate = Gauge(
+    "llm_rate_limiter_requests_per_minute",
+    "Current rate allowed by the client side rate limiter of the LLM, 0 if unlimited",
+    ["model"],
+)
+rate_limiter_rejections = Counter(
+    "llm_rate_limiter_rejections",
+    "Number of requests rejected by the client side rate limiter of the LLM",
+    ["model"],
+)
@@ -0,0 +1,18 @@
+from prometheus_client import Counter, Histogram
+
+batch_size = Histogram(
+    "safety_batch_size",
+    "Number of distinct inputs classified per safety batch",
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+batch_delay_seconds = Histogram(
+    "safety_batch_delay_seconds",
+    "Latency added by waiting for the safety batch to be dispatched",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1),
+)
+
+verdict_cache_requests = Counter(
+    "safety_verdict_cache_requests",
+    "Number of lookups in the safety verdict cache",
+    ["result"],
+)
@@ -0,0 +1,49 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+replay_buffer_bytes = Gauge(
+    "sse_replay_buffer_bytes",
+    "Total size of the events kept for resuming chat streams",
+)
+buffered_bytes = Gauge(
+    "sse_buffered_bytes",
+    "Total size of the chat stream events not sent to their slowest client yet",
+)
+stream_buffered_bytes = Histogram(
+    "sse_stream_buffered_bytes",
+    "Peak size of the events not sent to the slowest client yet, per chat stream",
+    buckets=(1024, 4096, 16384, 65536, 262144, 1048576),
+)
+backpressure_events = Counter(
+    "sse_backpressure_events",
+    "Number of times a chat stream fell behind its high-water mark",
+    ["policy"],
+)
+stream_resumes = Counter(
+    "sse_stream_resumes",
+    "Number of chat stream resume attempts",
+    ["result"],
+)
+aborted_generations = Counter(
+    "chat_aborted_generations",
+    "Number of generations aborted because the client disconnected",
+)
+tokens_saved = Counter(
+    "chat_tokens_saved",
+    "Estimated output tokens not generated thanks to aborting generations",
+)
+uncompressed_bytes = Counter(
+    "sse_uncompressed_bytes",
+    "Size of the compressed server-sent events before compression",
+    ["encoding"],
+)
+compressed_bytes = Counter(
+    "sse_compressed_bytes",
+    "Size of the compressed server-sent events after compression",
+    ["encoding"],
+)
+compression_seconds = Histogram(
+    "sse_compression_seconds",
+    "Time spent compressing the server-sent events of a stream",
+    ["encoding"],
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1),
+)
@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import defaultdict
+from typing import AsyncIterator, Awaitable, Callable
+
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationHub:
+    """Publishes notifications (e.g. generated titles) to the connected clients of a user.
+
+    Unlike the events of a generation, notifications are not kept: they are dropped if
+    the user has no client connected, or if a client has `queue_size` notifications
+    pending.
+    Notifications only reach the clients connected to this process.
+    The hub is not thread-safe, it must only be used within one event loop.
+    """
+
+    def __init__(self, queue_size: int = 16):
+        self.queue_size = queue_size
+        self._subscribers: defaultdict[str, set[asyncio.Queue[str]]] = defaultdict(set)
+
+    def publish(self, userid: str, data: str) -> None:
+        for queue in self._subscribers.get(userid, ()):
+            try:
+                queue.put_nowait(data)
+            except asyncio.QueueFull:
+                logger.warning("Notification queue of %s full, dropping", userid)
+
+    async def subscribe(
+        self,
+        userid: str,
+        *,
+        is_disconnected: Callable[[], Awaitable[bool]] | None = None,
+        poll_interval: float = 1.0,
+    ) -> AsyncIterator[str]:
+        """Yields the notifications of `userid` until cancelled or disconnected.
+
+        `is_disconnected` is polled every `poll_interval` seconds while waiting.
+        """
+        queue: asyncio.Queue[str] = asyncio.Queue(self.queue_size)
+        self._subscribers[userid].add(queue)
+        try:
+            while True:
+                if is_disconnected is None:
+                    yield await queue.get()
+                    continue
+                try:
+                    yield await asyncio.wait_for(queue.get(), poll_interval)
+                except TimeoutError:
+                    if await is_disconnected():
+                        return
+        finally:
+            self._subscribers[userid].discard(queue)
+            if not self._subscribers[userid]:
+                del self._subscribers[userid]
@@ -2,14 +2,18 @@ from .chat import router as chat_router
 from .conversation import router as conv_router
 from .files import router as files_router
 from .message import router as message_router
+from .notification import router as notification_router
 from .probes import router as probes_router
 from .share import router as share_router
+from .websocket import router as websocket_router
 
 __all__ = [
     "chat_router",
     "conv_router",
     "files_router",
     "message_router",
+    "notification_router",
     "probes_router",
     "share_router",
+    "websocket_router",
 ]
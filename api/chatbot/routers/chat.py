@@ -1,187 +1,545 @@
+import asyncio
 import logging
+from collections.abc import AsyncGenerator, AsyncIterator
+from contextlib import aclosing
 from functools import partial
 from typing import Annotated, Any
 from uuid import UUID
 
 from fastapi import (
     APIRouter,
-    BackgroundTasks,
+    Header,
     HTTPException,
     Request,
 )
 from fastapi.responses import StreamingResponse
-from langchain_core.messages import AIMessage, BaseMessage
-from langchain_core.messages.ai import UsageMetadata
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.messages.ai import UsageMetadata, add_ai_message_chunks
+from langchain_core.messages.utils import count_tokens_approximately
 from langchain_core.runnables import Runnable, RunnableConfig
+from langchain_core.runnables.config import run_in_executor
 from langgraph.graph.state import CompiledStateGraph
 from openai import RateLimitError
-from sqlalchemy import update
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from pydantic_core import to_json
 
-from chatbot.dependencies import UserIdHeaderDep, uuid_or_404
-from chatbot.dependencies.agent import AgentWrapperDep, SmrChainWrapperDep
-from chatbot.dependencies.db import SqlalchemySessionMakerDep
+from chatbot.compression import compress_stream, negotiate_encoding
+from chatbot.config import Settings
+from chatbot.dependencies import OwnedConversationIdDep, UserIdHeaderDep
+from chatbot.dependencies.agent import (
+    AgentWrapperDep,
+    SmrChainWrapperDep,
+    StateCacheDep,
+)
+from chatbot.dependencies.commons import (
+    NotificationHubDep,
+    SettingsDep,
+    StreamRegistryDep,
+)
+from chatbot.dependencies.db import ConversationUpdatesDep
+from chatbot.llm_client.github import url_to_size
+from chatbot.llm_client.ratelimit import ClientRateLimitError
 from chatbot.metrics.llm import input_tokens, output_tokens
-from chatbot.models import Conversation
+from chatbot.metrics.streaming import (
+    aborted_generations,
+    stream_resumes,
+    tokens_saved,
+)
+from chatbot.notifications import NotificationHub
 from chatbot.schemas import (
     ChatMessage,
     ErrorMessage,
     InfoMessage,
     HumanChatMessage,
 )
+from chatbot.cache import LRUCache
+from chatbot.streaming import (
+    ReplayBuffer,
+    StreamRegistry,
+    capture_values,
+    coalesce_chunks,
+    coalesce_while,
+)
 from chatbot.utils import get_client_ip, utcnow
+from chatbot.write_behind import ConversationUpdates
 
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/conversations/{conversation_id}/messages")
 
+STREAM_VERSION_HEADER = "X-Stream-Version"
+"""Request header selecting the wire format of `chat_stream`, echoed in the response.
+
+- "1" (default): every event is a full `ChatMessage`.
+- "2": only the first chunk of a message carries the envelope, see `DeltaChunkEncoder`.
+"""
+
 
 @router.post("")
 async def chat_stream(
-    conversation_id: Annotated[UUID, uuid_or_404("conversation_id", "Conversation")],
+    conversation_id: OwnedConversationIdDep,
     message: HumanChatMessage,
     request: Request,
     userid: UserIdHeaderDep,
     agent_wrapper: AgentWrapperDep,
     smry_chain_wrapper: SmrChainWrapperDep,
-    session_maker: SqlalchemySessionMakerDep,
-    background_tasks: BackgroundTasks,
+    conversation_updates: ConversationUpdatesDep,
+    settings: SettingsDep,
+    stream_registry: StreamRegistryDep,
+    notification_hub: NotificationHubDep,
+    state_cache: StateCacheDep,
 ):
-    """HTTP streaming endpoint for chat interactions using Server-Sent Events."""
+    """HTTP streaming endpoint for chat interactions using Server-Sent Events.
+
+    The events are numbered. If resuming is enabled, the generation carries on for a
+    while when the client disconnects, see `resume_stream`. Otherwise (or if nobody
+    resumes it), the generation is aborted and the partial answer is saved.
+    """
+
+    stream_version = request.headers.get(STREAM_VERSION_HEADER, "1")
+    if stream_version == "2":
+        encoder = DeltaChunkEncoder(parent_id=message.id)
+    else:
+        stream_version = "1"
+        encoder = ChunkEncoder(parent_id=message.id)
+    headers = {
+        "Cache-Control": "no-cache",
+        "Connection": "keep-alive",
+        "X-Accel-Buffering": "no",  # Disable nginx buffering for real-time streaming
+        STREAM_VERSION_HEADER: stream_version,
+    }
+    buffer = start_generation(
+        conversation_id,
+        message,
+        userid=userid,
+        client_ip=get_client_ip(request),
+        encoder=encoder,
+        agent_wrapper=agent_wrapper,
+        smry_chain_wrapper=smry_chain_wrapper,
+        conversation_updates=conversation_updates,
+        settings=settings,
+        stream_registry=stream_registry,
+        notification_hub=notification_hub,
+        state_cache=state_cache,
+        headers=headers,
+    )
+    return event_stream_response(
+        buffer.subscribe(is_disconnected=request.is_disconnected),
+        request,
+        settings,
+        headers,
+    )
+
+
+@router.get("/{message_id}/stream")
+async def resume_stream(
+    conversation_id: OwnedConversationIdDep,
+    message_id: str,
+    request: Request,
+    settings: SettingsDep,
+    stream_registry: StreamRegistryDep,
+    last_event_id: Annotated[int, Header()] = 0,
+):
+    """Resumes the stream of the generation started by `message_id` after `Last-Event-ID`.
+
+    Responds 404 if the generation is not kept (anymore), and 410 if the events after
+    `Last-Event-ID` were evicted, in both cases the client should reload the conversation.
+    """
+    if (
+        stream_registry is None
+        or (buffer := stream_registry.get(conversation_id, message_id)) is None
+    ):
+        stream_resumes.labels(result="not_found").inc()
+        raise HTTPException(status_code=404, detail="Stream not found.")
+    if not buffer.retains(last_event_id):
+        stream_resumes.labels(result="evicted").inc()
+        raise HTTPException(status_code=410, detail="Stream events evicted.")
+
+    stream_resumes.labels(result="resumed").inc()
+    return event_stream_response(
+        buffer.subscribe(last_event_id, is_disconnected=request.is_disconnected),
+        request,
+        settings,
+        buffer.headers,
+    )
+
+
+def event_stream_response(
+    events: AsyncIterator[str],
+    request: Request,
+    settings: Settings,
+    headers: dict[str, str],
+) -> StreamingResponse:
+    """Responds with server-sent events, compressed if enabled and accepted by the client."""
+    if settings.sse.compression and (
+        encoding := negotiate_encoding(request.headers.get("accept-encoding"))
+    ):
+        return StreamingResponse(
+            compress_stream(events, encoding),
+            media_type="text/event-stream",
+            headers=headers | {"Content-Encoding": encoding, "Vary": "Accept-Encoding"},
+        )
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers=headers,
+    )
+
+
+class ChunkEncoder:
+    """Encodes streamed messages to the JSON of `ChatMessage`.
 
-    await validate_conversation_owner(session_maker, conversation_id, userid)
+    The output is the same as `ChatMessage.from_lc(msg, parent_id=parent_id).model_dump_json()`,
+    but `AIMessageChunk`s are written directly, without deep-copying `additional_kwargs`
+    and validating a model for every chunk. The envelope (parent id and message id) is
+    only encoded once per message.
+    """
+
+    # `additional_kwargs` keys that `ChatMessage.from_lc` lifts to fields.
+    LIFTED_KWARGS = frozenset(
+        {"type", "sent_at", "parent_id", "feedback", "attachments"}
+    )
+
+    def __init__(self, parent_id: str | None = None):
+        self.parent_id = parent_id
+        self._envelope_head = (
+            '{"id":'
+            if parent_id is None
+            else f'{{"parent_id":{to_json(parent_id).decode()},"id":'
+        )
+        self._message_id: str | None = None
+        self._envelope = ""
+
+    def encode(self, msg: BaseMessage) -> str:
+        if not self._is_plain_chunk(msg):
+            return ChatMessage.from_lc(msg, parent_id=self.parent_id).model_dump_json()
+
+        if msg.id != self._message_id:
+            self._message_id = msg.id
+            self._envelope = (
+                f'{self._envelope_head}{to_json(msg.id).decode()},"content":'
+            )
+        # `pydantic_core.to_json` is the serializer behind `model_dump_json`.
+        return (
+            f"{self._envelope}{to_json(msg.content).decode()}"
+            f',"type":"AIMessageChunk","additional_kwargs":'
+            f"{to_json(msg.additional_kwargs).decode()}}}"
+        )
+
+    def _is_plain_chunk(self, msg: BaseMessage) -> bool:
+        """Whether `msg` is a chunk whose fields map one to one to `ChatMessage`."""
+        return (
+            isinstance(msg, AIMessageChunk)
+            and msg.id is not None
+            and msg.name is None
+            and self.LIFTED_KWARGS.isdisjoint(msg.additional_kwargs)
+        )
+
+
+class DeltaChunkEncoder(ChunkEncoder):
+    """Encodes streamed messages in the delta-only (v2) wire format.
+
+    The first chunk of a message is sent as in v1, carrying the envelope (parent id,
+    message id, type, sent at). The following chunks of the same message only carry
+    the content delta, with the content part indexes, and the `additional_kwargs`
+    delta if there is any:
+
+        {"c": [{"type": "text", "text": " world", "index": 1}]}
+        {"c": "", "k": {"tool_calls": [...]}}
+
+    Events without a `type` are deltas of the last message that had one.
+    `raw_content` is not sent, it is only used by the server to replay the
+    model output.
+    """
+
+    SERVER_KWARGS = frozenset({"raw_content"})
+
+    def encode(self, msg: BaseMessage) -> str:
+        if not self._is_plain_chunk(msg):
+            self._message_id = None
+            return super().encode(msg)
+
+        kwargs = msg.additional_kwargs
+        if not self.SERVER_KWARGS.isdisjoint(kwargs):
+            kwargs = {k: v for k, v in kwargs.items() if k not in self.SERVER_KWARGS}
+        if msg.id != self._message_id:
+            # The envelope.
+            return super().encode(msg.model_copy(update={"additional_kwargs": kwargs}))
+
+        delta = f'{{"c":{to_json(msg.content).decode()}'
+        if kwargs:
+            delta += f',"k":{to_json(kwargs).decode()}'
+        return delta + "}"
+
+
+class PartialAnswer:
+    """Tracks the answer being streamed, to save it if the generation is aborted."""
+
+    average_tokens = 0.0
+    """Moving average of the output tokens of complete answers, shared by all instances."""
+    SMOOTHING = 0.05
+
+    def __init__(self):
+        self.chunks: list[AIMessageChunk] = []
+        """Chunks of the last message generated by the chatbot."""
+        self.output_tokens = 0
+        """Output tokens of the finished LLM calls, e.g. the ones calling tools."""
+
+    def add(self, msg: BaseMessage, metadata: dict[str, Any]) -> None:
+        if isinstance(msg, AIMessage) and msg.usage_metadata is not None:
+            self.output_tokens += msg.usage_metadata["output_tokens"]
+        if (
+            not isinstance(msg, AIMessageChunk)
+            or metadata.get("langgraph_node") != "chatbot"
+        ):
+            return
+        if self.chunks and self.chunks[0].id != msg.id:
+            self.chunks = []
+        self.chunks.append(msg)
+
+    def to_message(self) -> AIMessage | None:
+        """The last message generated so far, None if there is none or it is complete."""
+        if not self.chunks:
+            return None
+        merged = add_ai_message_chunks(self.chunks[0], *self.chunks[1:])
+        if merged.usage_metadata is not None:
+            return None  # Complete, it should be saved already.
+        # Drop partial tool calls, they cannot be run.
+        return AIMessage(
+            id=merged.id,
+            content=merged.content,
+            additional_kwargs={
+                k: v for k, v in merged.additional_kwargs.items() if k != "tool_calls"
+            },
+            response_metadata={"finish_reason": "cancelled"},
+        )
+
+    def complete(self) -> None:
+        cls = type(self)
+        cls.average_tokens += (self.output_tokens - cls.average_tokens) * cls.SMOOTHING
+
+    def tokens_saved(self) -> float:
+        """Estimates the output tokens not generated, by the average of complete answers."""
+        generated = self.output_tokens
+        if (partial := self.to_message()) is not None:
+            generated += count_tokens_approximately([partial])
+        return max(self.average_tokens - generated, 0)
+
+
+async def save_partial_answer(
+    agent: CompiledStateGraph,
+    runnable_config: RunnableConfig,
+    message: HumanChatMessage,
+    answer: PartialAnswer,
+) -> None:
+    """Saves the answer generated until the generation was aborted."""
+    if (partial := answer.to_message()) is None:
+        return
+    try:
+        # The input may not be saved yet, it's replaced if it is.
+        await agent.aupdate_state(
+            runnable_config,
+            {"messages": [message.to_lc(), partial]},
+            as_node="chatbot",
+        )
+    except Exception:
+        logger.exception("Failed to save the partial answer %s", partial.id)
+
+
+def record_image_sizes(message: HumanChatMessage) -> None:
+    """Records the dimensions of the image attachments, replacing the ones sent by the client.
+
+    They are saved with the message, to count the image tokens without downloading the
+    images again. The client cannot be trusted with them, e.g. claiming 1x1 would
+    under-count the tokens and defeat the trimming.
+    This downloads the images, so it must not run on the event loop.
+    """
+    for attachment in message.attachments or []:
+        attachment.pop("width", None)
+        attachment.pop("height", None)
+        if not (attachment.get("mimetype") or "").startswith("image/"):
+            continue
+        if (size := url_to_size(attachment["url"])) is not None:
+            attachment["width"], attachment["height"] = size
+
+
+def start_generation(
+    conversation_id: UUID,
+    message: HumanChatMessage,
+    *,
+    userid: str,
+    client_ip: str | None,
+    encoder: ChunkEncoder,
+    agent_wrapper: partial[AsyncGenerator[CompiledStateGraph, None]],
+    smry_chain_wrapper: partial[Runnable],
+    conversation_updates: ConversationUpdates,
+    settings: Settings,
+    stream_registry: StreamRegistry | None,
+    notification_hub: NotificationHub,
+    state_cache: LRUCache[UUID, list[BaseMessage]] | None = None,
+    headers: dict[str, str] | None = None,
+) -> ReplayBuffer:
+    """Starts answering `message` in the background.
+
+    Returns the buffer to subscribe to, its events are the encoded messages, without
+    any transport framing. The caller must have validated the conversation owner.
+    If the message requires summarization, the title is generated concurrently and
+    published to `notification_hub`.
+    The final messages of the conversation are kept in `state_cache`.
+    """
     selected_model = message.additional_kwargs.get("model_name")
     runnable_config: RunnableConfig = {
         "run_name": "chat",
         "metadata": {
             "conversation_id": conversation_id,
             "userid": userid,
-            "client_ip": get_client_ip(request),
+            "client_ip": client_ip,
         },
         "configurable": {"thread_id": conversation_id},
     }
 
+    if message.additional_kwargs and message.additional_kwargs.get(
+        "require_summarization", False
+    ):
+        start_title_generation(
+            conversation_id,
+            message,
+            userid=userid,
+            smry_chain_wrapper=smry_chain_wrapper,
+            selected_model=selected_model,
+            runnable_config=runnable_config,
+            conversation_updates=conversation_updates,
+            notification_hub=notification_hub,
+        )
+
     async def generate_stream():
         try:
+            await run_in_executor(runnable_config, record_image_sizes, message)
             async with agent_wrapper(selected_model) as agent:
-                async for msg, metadata in agent.astream(
-                    input={"messages": [message.to_lc()]},
-                    config=runnable_config,
-                    stream_mode="messages",
-                    durability="async",
-                ):
-                    if "internal" in metadata.get("tags", []):
-                        continue  # Skip internal messages.
-
-                    _msg = ChatMessage.from_lc(
-                        msg,
-                        parent_id=message.id,
+                final_state: dict[str, Any] = {}
+                stream = capture_values(
+                    agent.astream(
+                        input={"messages": [message.to_lc()]},
+                        config=runnable_config,
+                        stream_mode=["messages", "values"],
+                        durability="async",
+                    ),
+                    on_values=final_state.update,
+                )
+                if settings.sse.coalesce_interval:
+                    stream = coalesce_chunks(
+                        stream,
+                        interval=settings.sse.coalesce_interval,
+                        max_bytes=settings.sse.coalesce_max_bytes,
                     )
+                if settings.sse.backpressure_policy == "coalesce":
+                    stream = coalesce_while(stream, lambda: buffer.congested)
+                answer = PartialAnswer()
+                try:
+                    # Close the stream explicitly, so that the upstream LLM stream is closed as soon as possible.
+                    async with aclosing(stream):
+                        async for msg, metadata in stream:
+                            if "internal" in metadata.get("tags", []):
+                                continue  # Skip internal messages.
 
-                    # Send as Server-Sent Event
-                    sse_data = f"data: {_msg.model_dump_json()}\n\n"
-                    yield sse_data
-
-                    if (
-                        isinstance(msg, AIMessage)
-                        and (usage_metadata := msg.usage_metadata) is not None
-                    ):
-                        update_usage_metrics(
-                            userid,
-                            msg.response_metadata,
-                            usage_metadata,
-                        )
-
-                background_tasks.add_task(
-                    update_conv,
-                    session_maker,
-                    conversation_id,
-                    last_message_at=utcnow(),
-                )
+                            yield encoder.encode(msg)
 
-                # summarize if required
-                if message.additional_kwargs and message.additional_kwargs.get(
-                    "require_summarization", False
-                ):
-                    title = await generate_conversation_title(
-                        agent=agent,
-                        smry_chain_wrapper=smry_chain_wrapper,
-                        selected_model=selected_model,
-                        runnable_config=runnable_config,
-                    )
-                    if title:
-                        background_tasks.add_task(
-                            update_conv,
-                            session_maker,
-                            conversation_id,
-                            title=title,
-                        )
-
-                        info_message = InfoMessage(
-                            content={
-                                "type": "title-generated",
-                                "payload": title,
-                            },
-                        )
-                        # Send title update as SSE
-                        sse_data = f"data: {info_message.model_dump_json()}\n\n"
-                        yield sse_data
-
-        except RateLimitError:
+                            answer.add(msg, metadata)
+                            if (
+                                isinstance(msg, AIMessage)
+                                and (usage_metadata := msg.usage_metadata) is not None
+                            ):
+                                update_usage_metrics(
+                                    userid,
+                                    msg.response_metadata,
+                                    usage_metadata,
+                                )
+                except asyncio.CancelledError:
+                    # Nobody is listening anymore.
+                    aborted_generations.inc()
+                    tokens_saved.inc(answer.tokens_saved())
+                    await save_partial_answer(agent, runnable_config, message, answer)
+                    conversation_updates.add(conversation_id, last_message_at=utcnow())
+                    raise
+                answer.complete()
+                if state_cache is not None and "messages" in final_state:
+                    state_cache.set(conversation_id, final_state["messages"])
+                conversation_updates.add(conversation_id, last_message_at=utcnow())
+
+        except (RateLimitError, ClientRateLimitError):
             err_message = ErrorMessage(
                 content="Rate limit exceeded. Please try again later.",
             )
-            sse_data = f"data: {err_message.model_dump_json()}\n\n"
-            yield sse_data
+            yield err_message.model_dump_json()
         except Exception as e:  # noqa: BLE001
             logger.exception("Something goes wrong: %s", e)
             err_message = ErrorMessage(
                 content="An error occurred while processing your request.",
             )
-            sse_data = f"data: {err_message.model_dump_json()}\n\n"
-            yield sse_data
+            yield err_message.model_dump_json()
 
-    return StreamingResponse(
-        generate_stream(),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no",  # Disable nginx buffering for real-time streaming
-        },
-    )
+    if stream_registry is None:
+        # Not resumable, events are only kept until sent.
+        buffer = ReplayBuffer(
+            message.id,
+            headers=headers,
+            keep_sent=False,
+            high_water=settings.sse.backpressure_high_water,
+            low_water=settings.sse.backpressure_low_water,
+            policy=settings.sse.backpressure_policy,
+        )
+    else:
+        buffer = stream_registry.create(conversation_id, message.id, headers=headers)
+    buffer.start(generate_stream())
+    return buffer
 
 
-async def validate_conversation_owner(
-    session_maker: async_sessionmaker[AsyncSession],
-    conversation_id: UUID,
-    userid: str,
-) -> Conversation:
-    """Validate that the user owns the conversation."""
-    async with session_maker() as session:
-        conv: Conversation = await session.get(Conversation, conversation_id)
-    if conv.owner != userid:
-        raise HTTPException(status_code=403, detail="authorization error")
-    return conv
+_title_jobs: set[asyncio.Task] = set()
+"""Keeps references to the running title generations."""
 
 
-async def generate_conversation_title(
-    agent: CompiledStateGraph,
+def start_title_generation(
+    conversation_id: UUID,
+    message: HumanChatMessage,
+    *,
+    userid: str,
     smry_chain_wrapper: partial[Runnable],
-    selected_model: str,
+    selected_model: str | None,
     runnable_config: RunnableConfig,
-):
-    """Generate a title for the conversation."""
-    state = await agent.aget_state(runnable_config)
-    msgs: list[BaseMessage] = state.values.get("messages", [])
-
-    smry_chain = smry_chain_wrapper(selected_model)
-    title_raw: str = await smry_chain.ainvoke(
-        input={"messages": msgs},
-        config=runnable_config,
-    )
-    return title_raw.strip('"')
+    conversation_updates: ConversationUpdates,
+    notification_hub: NotificationHub,
+) -> None:
+    """Generates the title of the conversation from its first message, in the background.
+
+    It does not wait for the answer, nor hold the stream or the checkpointer.
+    """
+
+    async def generate_title() -> None:
+        try:
+            smry_chain = smry_chain_wrapper(selected_model)
+            title_raw: str = await smry_chain.ainvoke(
+                input={"messages": [message.to_lc()]},
+                config=runnable_config,
+            )
+            if not (title := title_raw.strip('"')):
+                return
+            conversation_updates.add(conversation_id, title=title)
+        except Exception:
+            logger.exception("Failed to generate the title of %s", conversation_id)
+            return
+
+        info_message = InfoMessage(
+            content={
+                "type": "title-generated",
+                "payload": title,
+                "conversation_id": str(conversation_id),
+            },
+        )
+        notification_hub.publish(userid, info_message.model_dump_json())
+
+    task = asyncio.create_task(generate_title())
+    _title_jobs.add(task)
+    task.add_done_callback(_title_jobs.discard)
 
 
 def update_usage_metrics(
@@ -201,19 +559,3 @@ def update_usage_metrics(
         user_id=userid,
         model_name=model_name,
     ).inc(usage_metadata["output_tokens"])
-
-
-async def update_conv(
-    session_maker: async_sessionmaker[AsyncSession],
-    conv_id: UUID,
-    **fields: Any,
-) -> None:
-    """Update arbitrary fields of a conversation."""
-    if not fields:
-        return  # nothing to update
-
-    async with session_maker() as session:
-        await session.execute(
-            update(Conversation).where(Conversation.id == conv_id).values(**fields)
-        )
-        await session.commit()
@@ -11,12 +11,14 @@ from uuid import UUID
 
 from chatbot.dependencies import (
     AgentStateDep,
+    OwnerCacheDep,
     SmrChainDep,
     SqlalchemyROSessionDep,
     SqlalchemySessionDep,
     UserIdHeaderDep,
     uuid_or_404,
 )
+from chatbot.dependencies.db import ConversationUpdatesDep
 from chatbot.models import Conversation as ORMConversation
 from chatbot.schemas import (
     ChatMessage,
@@ -52,8 +54,10 @@ async def get_conversation(
     userid: UserIdHeaderDep,
     session: SqlalchemyROSessionDep,
     agent_state: AgentStateDep,
+    owner_cache: OwnerCacheDep,
 ) -> ConversationDetail:
     conv: ORMConversation = await session.get_one(ORMConversation, conversation_id)
+    owner_cache.set(conv.id, conv.owner)
     if conv.owner != userid:
         raise HTTPException(status_code=403, detail="authorization error")
 
@@ -70,10 +74,12 @@ async def create_conversation(
     payload: CreateConversation,
     userid: UserIdHeaderDep,
     session: SqlalchemySessionDep,
+    owner_cache: OwnerCacheDep,
 ) -> ConversationDetail:
     conv = ORMConversation(title=payload.title, owner=userid)
     session.add(conv)
     await session.commit()
+    owner_cache.set(conv.id, conv.owner)
     return conv
 
 
@@ -83,6 +89,7 @@ async def update_conversation(
     payload: UpdateConversation,
     userid: UserIdHeaderDep,
     session: SqlalchemySessionDep,
+    conversation_updates: ConversationUpdatesDep,
 ) -> ConversationDetail:
     conv: ORMConversation = await session.get_one(ORMConversation, conversation_id)
     if conv.owner != userid:
@@ -90,6 +97,8 @@ async def update_conversation(
 
     if payload.title is not None:
         conv.title = payload.title
+        # Or a generated title written behind would override it.
+        conversation_updates.discard(conversation_id, "title")
     if payload.pinned is not None:
         conv.pinned = payload.pinned
     await session.commit()
@@ -101,6 +110,7 @@ async def delete_conversation(
     conversation_id: str,
     userid: UserIdHeaderDep,
     session: SqlalchemySessionDep,
+    owner_cache: OwnerCacheDep,
 ) -> None:
     try:
         conv_uuid = UUID(conversation_id)
@@ -114,6 +124,7 @@ async def delete_conversation(
         raise HTTPException(status_code=403, detail="authorization error")
     await session.delete(conv)
     await session.commit()
+    owner_cache.pop(conv_uuid)
 
 
 @router.post("/{conversation_id}/summarization", status_code=201)
@@ -123,6 +134,7 @@ async def summarize(
     session: SqlalchemyROSessionDep,
     agent_state: AgentStateDep,
     smry_chain: SmrChainDep,
+    conversation_updates: ConversationUpdatesDep,
 ) -> dict[str, str]:
     conv: ORMConversation = await session.get_one(ORMConversation, conversation_id)
     if conv.owner != userid:
@@ -142,5 +154,6 @@ async def summarize(
     )
     title = title_raw.strip('"')
     conv.title = title
+    conversation_updates.discard(conversation_id, "title")
     await session.commit()
     return {"title": title}
@@ -1,19 +1,13 @@
-from typing import TYPE_CHECKING, Annotated
-from uuid import UUID
-
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter
+from langchain_core.messages import BaseMessage
 from langchain_core.runnables import RunnableConfig
+from langgraph.graph.state import CompiledStateGraph
 
 from chatbot.dependencies import (
     AgentForStateDep,
-    SqlalchemyROSessionDep,
-    UserIdHeaderDep,
-    uuid_or_404,
+    OwnedConversationIdDep,
+    StateCacheDep,
 )
-from chatbot.models import Conversation as ORMConversation
-
-if TYPE_CHECKING:
-    from langchain_core.messages import BaseMessage
 
 router = APIRouter(prefix="/conversations/{conversation_id}/messages")
 
@@ -21,23 +15,15 @@ router = APIRouter(prefix="/conversations/{conversation_id}/messages")
 # TODO: merge thumbup and thumbdown into one endpoint called feedback?
 @router.put("/{message_id}/thumbup")
 async def thumbup(
-    conversation_id: Annotated[UUID, uuid_or_404("conversation_id", "Conversation")],
+    conversation_id: OwnedConversationIdDep,
     message_id: str,
-    userid: UserIdHeaderDep,
-    session: SqlalchemyROSessionDep,
     agent: AgentForStateDep,
+    state_cache: StateCacheDep,
 ) -> None:
-    conv: ORMConversation = await session.get_one(ORMConversation, conversation_id)
-    if conv.owner != userid:
-        raise HTTPException(status_code=403, detail="authorization error")
-
     config: RunnableConfig = {"configurable": {"thread_id": conversation_id}}
-    state = await agent.aget_state(config)
-
-    # There should be only one message with the given id
-    messages: list[BaseMessage] = [
-        message for message in state.values["messages"] if message.id == message_id
-    ]
+    messages = await find_messages(
+        agent, config, state_cache.get(conversation_id), message_id
+    )
     for message in messages:
         message.additional_kwargs["feedback"] = "thumbup"
 
@@ -49,23 +35,15 @@ async def thumbup(
 
 @router.put("/{message_id}/thumbdown")
 async def thumbdown(
-    conversation_id: Annotated[UUID, uuid_or_404("conversation_id", "Conversation")],
+    conversation_id: OwnedConversationIdDep,
     message_id: str,
-    userid: UserIdHeaderDep,
-    session: SqlalchemyROSessionDep,
     agent: AgentForStateDep,
+    state_cache: StateCacheDep,
 ) -> None:
-    conv: ORMConversation = await session.get_one(ORMConversation, conversation_id)
-    if conv.owner != userid:
-        raise HTTPException(status_code=403, detail="authorization error")
-
     config: RunnableConfig = {"configurable": {"thread_id": conversation_id}}
-    state = await agent.aget_state(config)
-
-    # There should be only one message with the given id
-    messages: list[BaseMessage] = [
-        message for message in state.values["messages"] if message.id == message_id
-    ]
+    messages = await find_messages(
+        agent, config, state_cache.get(conversation_id), message_id
+    )
     for message in messages:
         message.additional_kwargs["feedback"] = "thumbdown"
 
@@ -73,3 +51,25 @@ async def thumbdown(
         config,
         {"messages": messages},
     )
+
+
+async def find_messages(
+    agent: CompiledStateGraph,
+    config: RunnableConfig,
+    cached: list[BaseMessage] | None,
+    message_id: str,
+) -> list[BaseMessage]:
+    """Finds the messages with the given id (there should be only one).
+
+    Looks in the `cached` final state of the last answer first, and only reads the
+    checkpoint if the message is not there.
+    """
+    messages = [message for message in cached or [] if message.id == message_id]
+    if not messages:
+        state = await agent.aget_state(config)
+        messages = [
+            message
+            for message in state.values.get("messages", [])
+            if message.id == message_id
+        ]
+    return messages
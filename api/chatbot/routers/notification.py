@@ -0,0 +1,33 @@
+from fastapi import APIRouter, Request
+from fastapi.responses import StreamingResponse
+
+from chatbot.dependencies import UserIdHeaderDep
+from chatbot.dependencies.commons import NotificationHubDep
+
+
+router = APIRouter(prefix="/notifications")
+
+
+@router.get("")
+async def notifications(
+    request: Request,
+    userid: UserIdHeaderDep,
+    hub: NotificationHubDep,
+):
+    """Server-Sent Events of the notifications of the user, e.g. generated titles."""
+
+    async def generate_stream():
+        async for data in hub.subscribe(
+            userid, is_disconnected=request.is_disconnected
+        ):
+            yield f"data: {data}\n\n"
+
+    return StreamingResponse(
+        generate_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",  # Disable nginx buffering for real-time streaming
+        },
+    )
@@ -11,6 +11,7 @@ from chatbot.dependencies.commons import SettingsDep
 from chatbot.dependencies.db import SqlalchemyEngineDep, SqlalchemyROEngineDep
 from chatbot.llm_client import (
     llamacppChatOpenAI,
+    SGLangChatOpenAI,
     TGIChatOpenAI,
     VLLMChatOpenAI,
     GithubChatOpenAI,
@@ -47,6 +48,8 @@ async def readyz_check(
                 llm._fetch_server_props()
             elif isinstance(llm, TGIChatOpenAI):
                 llm._fetch_server_info()
+            elif isinstance(llm, SGLangChatOpenAI):
+                llm._fetch_server_info()
             elif isinstance(llm, VLLMChatOpenAI):
                 llm._fetch_models_meta()
             elif isinstance(llm, GithubChatOpenAI):
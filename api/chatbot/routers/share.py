@@ -12,12 +12,14 @@ from starlette.requests import Request
 
 from chatbot.dependencies import (
     AgentForStateDep,
+    OwnerCacheDep,
     SqlalchemyROSessionDep,
     SqlalchemySessionDep,
     UserIdHeaderDep,
     uuid_or_404,
 )
-from chatbot.models import Conversation as ORMConv
+from chatbot.dependencies.db import SqlalchemySessionMakerDep
+from chatbot.dependencies.ownership import validate_conversation_owner
 from chatbot.models import Share as ORMShare
 from chatbot.schemas import ChatMessage, CreateShare, Share
 
@@ -70,12 +72,13 @@ async def create_share(
     request: Request,
     userid: UserIdHeaderDep,
     session: SqlalchemySessionDep,
+    session_maker: SqlalchemySessionMakerDep,
+    owner_cache: OwnerCacheDep,
     agent: AgentForStateDep,
 ) -> Share:
-    # TODO: maybe only get the conv.owner
-    conv: ORMConv = await session.get_one(ORMConv, payload.source_id)
-    if conv.owner != userid:
-        raise HTTPException(status_code=403, detail="authorization error")
+    await validate_conversation_owner(
+        session_maker, owner_cache, payload.source_id, userid
+    )
 
     config: RunnableConfig = {"configurable": {"thread_id": payload.source_id}}
     agent_state = await agent.aget_state(config)
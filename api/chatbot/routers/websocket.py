@@ -0,0 +1,222 @@
+import asyncio
+import logging
+from typing import AsyncIterator
+from uuid import UUID
+
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
+from pydantic_core import to_json
+
+from chatbot.dependencies import OwnerCacheDep, UserIdHeaderDep
+from chatbot.dependencies.agent import (
+    AgentWrapperDep,
+    SmrChainWrapperDep,
+    StateCacheDep,
+)
+from chatbot.dependencies.commons import (
+    NotificationHubDep,
+    SettingsDep,
+    StreamRegistryDep,
+)
+from chatbot.dependencies.db import ConversationUpdatesDep, SqlalchemySessionMakerDep
+from chatbot.dependencies.ownership import validate_conversation_owner
+from chatbot.metrics import connected_clients
+from chatbot.routers.chat import (
+    ChunkEncoder,
+    DeltaChunkEncoder,
+    start_generation,
+)
+from chatbot.schemas import CancelFrame, ChatFrame, ClientFrame, ResumeFrame
+from chatbot.streaming import ReplayBuffer
+from chatbot.utils import get_client_ip
+
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+MAX_STREAMS = 8
+"""Maximum number of concurrent streams per connection."""
+SEND_QUEUE_SIZE = 64
+"""Frames waiting to be sent per connection, streams wait when it is full."""
+
+
+@router.websocket("/chat")
+async def chat_websocket(
+    websocket: WebSocket,
+    userid: UserIdHeaderDep,
+    agent_wrapper: AgentWrapperDep,
+    smry_chain_wrapper: SmrChainWrapperDep,
+    session_maker: SqlalchemySessionMakerDep,
+    conversation_updates: ConversationUpdatesDep,
+    settings: SettingsDep,
+    stream_registry: StreamRegistryDep,
+    notification_hub: NotificationHubDep,
+    state_cache: StateCacheDep,
+    owner_cache: OwnerCacheDep,
+):
+    """Multiplexes the chat streams of several conversations over one websocket.
+
+    The client sends `ChatFrame`, `ResumeFrame` and `CancelFrame` as JSON. The server sends:
+
+        {"conversation_id": "...", "id": 1, "data": {...}}   # an event, as in `chat_stream`
+        {"conversation_id": "...", "end": true}              # the end of a stream
+        {"conversation_id": "...", "error": "..."}           # a rejected frame
+        {"notification": {...}}                              # a notification, e.g. a generated title
+
+    Generations are the same as the ones of `chat_stream`, and can be resumed from
+    either endpoint.
+    """
+    await websocket.accept()
+    connected_clients.inc()
+    connection = ChatConnection(websocket)
+    connection.forward_notifications(notification_hub.subscribe(userid))
+    try:
+        while True:
+            try:
+                frame = ClientFrame.validate_json(await websocket.receive_text())
+            except ValidationError as e:
+                connection.send_error(None, str(e))
+                continue
+
+            if isinstance(frame, CancelFrame):
+                connection.cancel(frame.conversation_id)
+                continue
+
+            try:
+                await validate_conversation_owner(
+                    session_maker, owner_cache, frame.conversation_id, userid
+                )
+            except HTTPException as e:
+                connection.send_error(frame.conversation_id, e.detail)
+                continue
+            if (
+                frame.conversation_id not in connection.streams
+                and len(connection.streams) >= MAX_STREAMS
+            ):
+                connection.send_error(
+                    frame.conversation_id, "Too many concurrent streams."
+                )
+                continue
+
+            if isinstance(frame, ChatFrame):
+                encoder_class = (
+                    DeltaChunkEncoder if frame.version == 2 else ChunkEncoder
+                )
+                buffer = start_generation(
+                    frame.conversation_id,
+                    frame.message,
+                    userid=userid,
+                    client_ip=get_client_ip(websocket),
+                    encoder=encoder_class(parent_id=frame.message.id),
+                    agent_wrapper=agent_wrapper,
+                    smry_chain_wrapper=smry_chain_wrapper,
+                    conversation_updates=conversation_updates,
+                    settings=settings,
+                    stream_registry=stream_registry,
+                    notification_hub=notification_hub,
+                    state_cache=state_cache,
+                )
+                connection.subscribe(frame.conversation_id, buffer)
+            elif isinstance(frame, ResumeFrame):
+                buffer = (
+                    stream_registry.get(frame.conversation_id, frame.message_id)
+                    if stream_registry is not None
+                    else None
+                )
+                if buffer is None or not buffer.retains(frame.last_event_id):
+                    connection.send_error(frame.conversation_id, "Stream not found.")
+                    continue
+                connection.subscribe(frame.conversation_id, buffer, frame.last_event_id)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        connection.close()
+        connected_clients.dec()
+
+
+class ChatConnection:
+    """The streams of one websocket connection.
+
+    Every stream forwards its events to a bounded queue, drained by a single sender.
+    When the client does not keep up, the queue fills up and the streams stop reading
+    their buffers, so a slow client slows down its own streams, not the generations.
+    """
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.streams: dict[UUID, tuple[ReplayBuffer, asyncio.Task]] = {}
+        self._queue: asyncio.Queue[str] = asyncio.Queue(SEND_QUEUE_SIZE)
+        self._sender = asyncio.create_task(self._send())
+        self._notifier: asyncio.Task | None = None
+
+    def subscribe(
+        self, conversation_id: UUID, buffer: ReplayBuffer, last_event_id: int = 0
+    ) -> None:
+        """Forwards the events of `buffer`, replacing the current stream of the conversation."""
+        if (stream := self.streams.pop(conversation_id, None)) is not None:
+            stream[1].cancel()
+        task = asyncio.create_task(
+            self._forward(conversation_id, buffer, last_event_id)
+        )
+        self.streams[conversation_id] = (buffer, task)
+
+    def cancel(self, conversation_id: UUID) -> None:
+        """Aborts the generation of the conversation, its stream ends after the partial answer."""
+        if (stream := self.streams.get(conversation_id)) is not None:
+            stream[0].abort()
+
+    def forward_notifications(self, notifications: AsyncIterator[str]) -> None:
+        async def forward() -> None:
+            async for data in notifications:
+                await self._queue.put(f'{{"notification":{data}}}')
+
+        self._notifier = asyncio.create_task(forward())
+
+    def send_error(self, conversation_id: UUID | None, error: str) -> None:
+        """Queues an error frame, dropped if the queue is full.
+
+        Errors are sent from the receive loop, which must not wait for a slow client.
+        """
+        try:
+            self._queue.put_nowait(
+                to_json({"conversation_id": conversation_id, "error": error}).decode()
+            )
+        except asyncio.QueueFull:
+            logger.warning("Send queue full, dropping error: %s", error)
+
+    def close(self) -> None:
+        for _, task in self.streams.values():
+            task.cancel()
+        self.streams.clear()
+        if self._notifier is not None:
+            self._notifier.cancel()
+        self._sender.cancel()
+
+    async def _forward(
+        self, conversation_id: UUID, buffer: ReplayBuffer, last_event_id: int
+    ) -> None:
+        prefix = f'{{"conversation_id":"{conversation_id}","id":'
+        try:
+            async for frame in buffer.subscribe(
+                last_event_id,
+                formatter=lambda event_id, data: f'{prefix}{event_id},"data":{data}}}',
+            ):
+                await self._queue.put(frame)
+            await self._queue.put(
+                f'{{"conversation_id":"{conversation_id}","end":true}}'
+            )
+        finally:
+            # Unless it was replaced by another stream.
+            if (
+                self.streams.get(conversation_id, (None, None))[1]
+                is asyncio.current_task()
+            ):
+                del self.streams[conversation_id]
+
+    async def _send(self) -> None:
+        try:
+            while True:
+                await self.websocket.send_text(await self._queue.get())
+        except (WebSocketDisconnect, RuntimeError):
+            logger.debug("Websocket closed while sending")
@@ -1,13 +1,40 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING
+import asyncio
+import hashlib
+import logging
+import re
+import unicodedata
+from time import perf_counter
+from typing import TYPE_CHECKING, Any, Callable
 
+from langchain_core.messages import BaseMessage
+from langchain_core.messages.utils import count_tokens_approximately
 from langchain_core.output_parsers import BaseTransformOutputParser
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import Runnable
+from langchain_core.runnables.config import run_in_executor
+
+from chatbot.cache import LRUCache
+from chatbot.llm_client.scheduler import PRIORITY_METADATA_KEY, Priority
+from chatbot.metrics.safety import (
+    batch_delay_seconds,
+    batch_size,
+    verdict_cache_requests,
+)
 
 if TYPE_CHECKING:
     from langchain_core.language_models import BaseLanguageModel
-    from langchain_core.runnables import Runnable
+    from langchain_core.runnables import RunnableConfig
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_INPUT_TOKENS = 2048
+GUARD_MAX_OUTPUT_TOKENS = 16
+"""Enough for a verdict, e.g. "unsafe\nS1"."""
+GUARD_TEMPLATE_TOKENS = 512
+"""Tokens reserved for the guard model's own prompt template (e.g. the hazard taxonomy)."""
 
 
 # See <https://huggingface.co/meta-llama/Llama-Guard-3-8B#hazard-taxonomy-and-policy>
@@ -60,6 +87,333 @@ tmpl = ChatPromptTemplate.from_messages(
 output_parse = HazardOutputParser()
 
 
-def create_hazard_classifier(llm: BaseLanguageModel) -> Runnable:
-    """return the guard chain runnable."""
-    return tmpl | llm | output_parse
+def create_hazard_classifier(
+    llm: BaseLanguageModel,
+    *,
+    batch_window: float | None = None,
+    max_batch_size: int = 32,
+    verdict_cache: LRUCache[str, tuple[str, str | None]] | None = None,
+    max_input_tokens: int | None = DEFAULT_MAX_INPUT_TOKENS,
+) -> Runnable:
+    """return the guard chain runnable.
+
+    If `batch_window` is set and `llm` supports it, concurrent classifications are sent
+    together by a `CompletionBatcher`, in which case the classifier should be shared
+    across requests.
+    If `verdict_cache` is set, verdicts of already classified contents are reused.
+    Inputs longer than `max_input_tokens` (or the guard model's input budget) are classified
+    as head and tail windows, see `WindowedClassifier`.
+    """
+    # Avoid circular import, `chatbot.agent` depends on this module.
+    from chatbot.agent.token_management import resolve_token_management_params
+
+    chain = tmpl | llm | output_parse
+    chain = chain.with_config(metadata={PRIORITY_METADATA_KEY: Priority.SAFETY.label})
+    if batch_window is not None:
+        # `abatch_complete` is my custom method for vLLM.
+        if hasattr(llm, "abatch_complete"):
+            chain = CompletionBatcher(
+                chain, llm, window=batch_window, max_batch_size=max_batch_size
+            )
+        else:
+            logger.warning(
+                "%s cannot complete batches, safety classifications not batched.",
+                type(llm).__name__,
+            )
+
+    token_counter, model_max_input_tokens, is_message_counting = (
+        resolve_token_management_params(llm)
+    )
+    if is_message_counting:
+        logger.warning("Cannot count tokens of the guard model, input not truncated.")
+    else:
+        budget = model_max_input_tokens - GUARD_TEMPLATE_TOKENS
+        if max_input_tokens is not None:
+            budget = min(budget, max_input_tokens)
+        chain = WindowedClassifier(
+            chain, token_counter=token_counter, max_tokens=max(budget, 1)
+        )
+    if verdict_cache is not None:
+        model = getattr(llm, "model_name", None) or type(llm).__name__
+        chain = VerdictCachingClassifier(chain, verdict_cache, model=model)
+    return chain
+
+
+class WindowedClassifier(Runnable[dict[str, Any], tuple[str, str | None]]):
+    """Bounds the input of the guard model to `max_tokens`.
+
+    Inputs within the budget are classified as is. Otherwise the budget is split evenly
+    among the messages, each message over its share is cut to its head and to its tail,
+    and the two windows are classified in parallel. The input is unsafe if either
+    window is, and safe only if both are.
+
+    If `token_counter` fails, tokens are estimated by `count_tokens_approximately` instead,
+    for that call only (e.g. a tokenize request failing), or for good if counting is not
+    supported at all (e.g. `get_num_tokens_from_messages` of a model unknown to tiktoken).
+    """
+
+    def __init__(
+        self,
+        bound: Runnable,
+        *,
+        token_counter: Callable[[list[BaseMessage]], int],
+        max_tokens: int,
+    ):
+        self.bound = bound
+        self.token_counter = token_counter
+        self.max_tokens = max_tokens
+
+    def invoke(
+        self, input: dict[str, Any], config: RunnableConfig | None = None, **kwargs: Any
+    ) -> tuple[str, str | None]:
+        verdicts = [
+            self.bound.invoke(input | {"messages": window}, config, **kwargs)
+            for window in self._windows(input["messages"])
+        ]
+        return combine_verdicts(verdicts)
+
+    async def ainvoke(
+        self, input: dict[str, Any], config: RunnableConfig | None = None, **kwargs: Any
+    ) -> tuple[str, str | None]:
+        # Token counters may be blocking, e.g. requesting the tokenizer of the model.
+        windows = await run_in_executor(config, self._windows, input["messages"])
+        verdicts = await asyncio.gather(
+            *(
+                self.bound.ainvoke(input | {"messages": window}, config, **kwargs)
+                for window in windows
+            )
+        )
+        return combine_verdicts(verdicts)
+
+    def _windows(self, messages: list[BaseMessage]) -> list[list[BaseMessage]]:
+        if self._count_tokens(messages) <= self.max_tokens:
+            return [messages]
+
+        share = self.max_tokens // len(messages)
+        heads, tails = [], []
+        for message in messages:
+            if (num_tokens := self._count_tokens([message])) <= share:
+                heads.append(message)
+                tails.append(message)
+                continue
+            text = message.text
+            # Estimate the window size by the average characters per token,
+            # with some margin for the uneven distribution.
+            num_chars = int(len(text) * share / num_tokens * 0.9)
+            heads.append(message.model_copy(update={"content": text[:num_chars]}))
+            tails.append(
+                message.model_copy(
+                    update={"content": text[-num_chars:] if num_chars else ""}
+                )
+            )
+        return [heads, tails]
+
+    def _count_tokens(self, messages: list[BaseMessage]) -> int:
+        try:
+            return self.token_counter(messages)
+        except NotImplementedError:
+            logger.warning(
+                "Cannot count tokens of the guard model, estimating them from now on.",
+                exc_info=True,
+            )
+            # The classifier is shared, but this is not going to work any better later.
+            self.token_counter = count_tokens_approximately
+        except Exception:  # noqa: BLE001
+            logger.warning(
+                "Failed to count tokens of the guard input, estimating them instead.",
+                exc_info=True,
+            )
+        return count_tokens_approximately(messages)
+
+
+def combine_verdicts(verdicts: list[tuple[str, str | None]]) -> tuple[str, str | None]:
+    """Unsafe if any of the verdicts is unsafe, safe only if all of them are safe."""
+    for verdict in verdicts:
+        if verdict[0] == "unsafe":
+            return verdict
+    if all(flag == "safe" for flag, _ in verdicts):
+        return "safe", None
+    return "unknown", None
+
+
+class VerdictCachingClassifier(Runnable[dict[str, Any], tuple[str, str | None]]):
+    """Reuses the verdicts of already classified messages.
+
+    Verdicts are keyed by the guard model and a hash of the normalized messages,
+    so regenerations, retries and common greetings are only classified once.
+    Inconclusive ("unknown") verdicts are not cached.
+    """
+
+    def __init__(
+        self,
+        bound: Runnable,
+        cache: LRUCache[str, tuple[str, str | None]],
+        *,
+        model: str,
+    ):
+        self.bound = bound
+        self.cache = cache
+        self.model = model
+
+    def invoke(
+        self, input: dict[str, Any], config: RunnableConfig | None = None, **kwargs: Any
+    ) -> tuple[str, str | None]:
+        key = verdict_key(self.model, input["messages"])
+        if (verdict := self._lookup(key)) is not None:
+            return verdict
+        verdict = self.bound.invoke(input, config, **kwargs)
+        self._update(key, verdict)
+        return verdict
+
+    async def ainvoke(
+        self, input: dict[str, Any], config: RunnableConfig | None = None, **kwargs: Any
+    ) -> tuple[str, str | None]:
+        key = verdict_key(self.model, input["messages"])
+        if (verdict := self._lookup(key)) is not None:
+            return verdict
+        verdict = await self.bound.ainvoke(input, config, **kwargs)
+        self._update(key, verdict)
+        return verdict
+
+    def _lookup(self, key: str) -> tuple[str, str | None] | None:
+        verdict = self.cache.get(key)
+        verdict_cache_requests.labels(result="miss" if verdict is None else "hit").inc()
+        return verdict
+
+    def _update(self, key: str, verdict: tuple[str, str | None]) -> None:
+        if verdict[0] != "unknown":
+            self.cache.set(key, verdict)
+
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def verdict_key(model: str, messages: list[BaseMessage]) -> str:
+    """Hash of the guard model and the normalized messages.
+
+    Only the message type, the text (NFKC normalized, whitespaces collapsed) and the
+    attachment urls are considered, ids and other metadata are ignored.
+    """
+    digest = hashlib.sha256(model.encode())
+    for message in messages:
+        text = unicodedata.normalize("NFKC", message.text)
+        text = _WHITESPACE.sub(" ", text).strip()
+        attachments = message.additional_kwargs.get("attachments") or []
+        urls = [attachment.get("url") or "" for attachment in attachments]
+        digest.update("\0".join([message.type, text, *urls]).encode() + b"\x1e")
+    return digest.hexdigest()
+
+
+class CompletionBatcher(Runnable[dict[str, Any], tuple[str, str | None]]):
+    """Sends concurrent classifications to the guard model as one batched completion.
+
+    Calls arriving within `window` seconds of the first pending call (or until
+    `max_batch_size` calls are pending) are sent together with `llm.abatch_complete`,
+    one `/v1/completions` request with a prompt per conversation (rendered by the chat
+    template of the guard model), and the verdicts are handed back to each caller.
+    Identical conversations (same roles and contents) within a batch are classified once.
+
+    Sync calls are not batched, they go through `bound`.
+    """
+
+    def __init__(
+        self,
+        bound: Runnable,
+        llm: BaseLanguageModel,
+        *,
+        window: float,
+        max_batch_size: int = 32,
+    ):
+        if window < 0:
+            raise ValueError(f"window must not be negative, got {window}")
+        if max_batch_size <= 0:
+            raise ValueError(f"max_batch_size must be positive, got {max_batch_size}")
+        self.bound = bound
+        self.llm = llm
+        self.window = window
+        self.max_batch_size = max_batch_size
+        # (key, messages, enqueued_at, future)
+        self._pending: list[tuple[tuple, list[BaseMessage], float, asyncio.Future]] = []
+        self._flush_task: asyncio.Task | None = None
+        self._running: set[asyncio.Task] = set()
+
+    def invoke(
+        self, input: dict[str, Any], config: RunnableConfig | None = None, **kwargs: Any
+    ) -> tuple[str, str | None]:
+        return self.bound.invoke(input, config, **kwargs)
+
+    async def ainvoke(
+        self, input: dict[str, Any], config: RunnableConfig | None = None, **kwargs: Any
+    ) -> tuple[str, str | None]:
+        messages = input["messages"]
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((_batch_key(messages), messages, perf_counter(), future))
+        if len(self._pending) >= self.max_batch_size:
+            self._dispatch()
+        elif self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+        return await future
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.window)
+        self._flush_task = None
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        pending, self._pending = self._pending, []
+        if pending:
+            # Keep a reference so the task is not garbage collected.
+            task = asyncio.create_task(self._run(pending))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(
+        self, pending: list[tuple[tuple, list[BaseMessage], float, asyncio.Future]]
+    ) -> None:
+        dispatched_at = perf_counter()
+        groups: dict[tuple, list[asyncio.Future]] = {}
+        conversations = []
+        for key, messages, enqueued_at, future in pending:
+            batch_delay_seconds.observe(dispatched_at - enqueued_at)
+            if key not in groups:
+                groups[key] = []
+                conversations.append(messages)
+            groups[key].append(future)
+        batch_size.observe(len(conversations))
+
+        try:
+            texts = await self.llm.abatch_complete(
+                conversations,
+                priority=Priority.SAFETY,
+                max_tokens=GUARD_MAX_OUTPUT_TOKENS,
+                temperature=0,
+            )
+            results = [output_parse.parse(text) for text in texts]
+        except Exception as e:  # noqa: BLE001
+            results = [e] * len(conversations)
+        for futures, result in zip(groups.values(), results):
+            for future in futures:
+                if future.done():
+                    continue  # The caller is gone.
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+
+def _batch_key(messages: list[BaseMessage]) -> tuple:
+    """The roles and contents of a conversation, attachments included (they are content parts once converted)."""
+    return tuple(
+        (
+            message.type,
+            repr(message.content),
+            tuple(
+                attachment.get("url")
+                for attachment in message.additional_kwargs.get("attachments") or ()
+            ),
+        )
+        for message in messages
+    )
@@ -3,11 +3,11 @@ from __future__ import annotations
 from copy import deepcopy
 
 from datetime import datetime
-from typing import Any, Literal, NotRequired, Type, TypedDict
+from typing import Annotated, Any, Literal, NotRequired, Type, TypedDict
 from uuid import UUID, uuid4
 
 from langchain_core.messages import BaseMessage, _message_from_dict
-from pydantic import BaseModel, ConfigDict, Field, field_validator
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, field_validator
 
 from chatbot.utils import utcnow
 
@@ -20,6 +20,10 @@ class Attachment(TypedDict):
     url: str
     mimetype: NotRequired[str | None] = None
     size: NotRequired[int] = 0
+    width: NotRequired[int]
+    """Image width in pixels, recorded by the server at attach time (see `routers.chat.record_image_sizes`)."""
+    height: NotRequired[int]
+    """Image height in pixels, recorded by the server at attach time."""
 
 
 class ChatMessage(BaseModel):
@@ -188,3 +192,34 @@ class UserProfile(BaseModel):
     userid: str
     username: str | None = None
     email: str | None = None
+
+
+class ChatFrame(BaseModel):
+    """Starts answering a message on the chat websocket."""
+
+    type: Literal["chat"] = "chat"
+    conversation_id: UUID
+    message: HumanChatMessage
+    version: Literal[1, 2] = 1
+    """Wire format of the messages, see `chatbot.routers.chat.STREAM_VERSION_HEADER`."""
+
+
+class ResumeFrame(BaseModel):
+    """Resumes the stream of a generation on the chat websocket."""
+
+    type: Literal["resume"] = "resume"
+    conversation_id: UUID
+    message_id: str
+    last_event_id: int = 0
+
+
+class CancelFrame(BaseModel):
+    """Aborts the generation of a conversation on the chat websocket."""
+
+    type: Literal["cancel"] = "cancel"
+    conversation_id: UUID
+
+
+ClientFrame = TypeAdapter(
+    Annotated[ChatFrame | ResumeFrame | CancelFrame, Field(discriminator="type")]
+)
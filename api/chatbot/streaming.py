@@ -0,0 +1,478 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import deque
+from time import monotonic
+from typing import Any, AsyncIterator, Awaitable, Callable, Literal
+from uuid import UUID
+
+from langchain_core.messages import AIMessageChunk, BaseMessage
+from langchain_core.messages.ai import add_ai_message_chunks
+
+from chatbot.cache import LRUCache
+from chatbot.metrics.streaming import (
+    backpressure_events,
+    buffered_bytes,
+    replay_buffer_bytes,
+    stream_buffered_bytes,
+)
+
+
+logger = logging.getLogger(__name__)
+
+BackpressurePolicy = Literal["coalesce", "pause", "drop"]
+
+
+async def coalesce_chunks(
+    stream: AsyncIterator[tuple[BaseMessage, dict[str, Any]]],
+    *,
+    interval: float,
+    max_bytes: int = 4096,
+) -> AsyncIterator[tuple[BaseMessage, dict[str, Any]]]:
+    """Merges consecutive chunks of the same message in a `stream_mode="messages"` stream.
+
+    A merged chunk is emitted with the first chunk arriving `interval` seconds after the
+    merge started, once it holds `max_bytes` of text, as soon as anything else arrives,
+    or when the stream ends.
+    Chunks are merged by langchain (`add_ai_message_chunks`), which merges content
+    parts by their `index` and concatenates `additional_kwargs` strings, the same way
+    the frontend merges the chunks it receives.
+
+    NOTE: There is no timer, so if the upstream stalls, the merged chunk waits for the next
+    chunk. A timer means reading the upstream in another task, which costs CPU per chunk
+    on top of the merging (see `benchmarks/sse_stream.py`).
+    """
+    # Chunks are only merged when flushed, merging is not cheap.
+    pending: list[AIMessageChunk] = []
+    pending_metadata: dict[str, Any] = {}
+    pending_bytes = 0
+    deadline = 0.0
+    async for msg, metadata in stream:
+        if pending and _mergeable(pending[0], msg):
+            pending.append(msg)
+            pending_bytes += _text_size(msg)
+            if pending_bytes >= max_bytes or monotonic() >= deadline:
+                yield _merge(pending), pending_metadata
+                pending = []
+            continue
+
+        if pending:
+            yield _merge(pending), pending_metadata
+            pending = []
+        if not isinstance(msg, AIMessageChunk):
+            yield msg, metadata
+            continue
+        pending, pending_metadata = [msg], metadata
+        pending_bytes = _text_size(msg)
+        deadline = monotonic() + interval
+
+    if pending:
+        yield _merge(pending), pending_metadata
+
+
+async def coalesce_while(
+    stream: AsyncIterator[tuple[BaseMessage, dict[str, Any]]],
+    congested: Callable[[], bool],
+) -> AsyncIterator[tuple[BaseMessage, dict[str, Any]]]:
+    """Merges consecutive chunks of the same message while `congested()` is true.
+
+    Chunks pass through untouched otherwise, so unlike `coalesce_chunks` this adds no
+    latency to a stream that keeps up. The merged chunk is emitted with the first chunk
+    arriving once the congestion is over, as soon as anything else arrives, or when
+    the stream ends.
+    """
+    pending: list[AIMessageChunk] = []
+    pending_metadata: dict[str, Any] = {}
+    async for msg, metadata in stream:
+        if pending and _mergeable(pending[0], msg):
+            pending.append(msg)
+            if not congested():
+                yield _merge(pending), pending_metadata
+                pending = []
+            continue
+
+        if pending:
+            yield _merge(pending), pending_metadata
+            pending = []
+        if isinstance(msg, AIMessageChunk) and congested():
+            pending, pending_metadata = [msg], metadata
+            continue
+        yield msg, metadata
+
+    if pending:
+        yield _merge(pending), pending_metadata
+
+
+async def capture_values(
+    stream: AsyncIterator[tuple[str, Any]],
+    on_values: Callable[[dict[str, Any]], None],
+) -> AsyncIterator[tuple[BaseMessage, dict[str, Any]]]:
+    """Adapts a `stream_mode=["messages", "values"]` stream to a `stream_mode="messages"` one.
+
+    The states are handed to `on_values`, the last one is the final state of the graph.
+    """
+    async for mode, payload in stream:
+        if mode == "values":
+            on_values(payload)
+        else:
+            yield payload
+
+
+def _merge(chunks: list[AIMessageChunk]) -> AIMessageChunk:
+    if len(chunks) == 1:
+        return chunks[0]
+    return add_ai_message_chunks(chunks[0], *chunks[1:])
+
+
+def _mergeable(pending: AIMessageChunk, msg: BaseMessage) -> bool:
+    return isinstance(msg, AIMessageChunk) and msg.id == pending.id
+
+
+def _text_size(msg: AIMessageChunk) -> int:
+    size = len(msg.content) if isinstance(msg.content, str) else 0
+    if isinstance(msg.content, list):
+        for part in msg.content:
+            if isinstance(part, dict):
+                size += len(part.get("text") or part.get("thinking") or "")
+    raw_content = msg.additional_kwargs.get("raw_content")
+    return size + (len(raw_content) if isinstance(raw_content, str) else 0)
+
+
+def sse_event(event_id: int, data: str) -> str:
+    return f"id: {event_id}\ndata: {data}\n\n"
+
+
+class ReplayBuffer:
+    """The server-sent events of one generation, kept for clients to resume from.
+
+    The generation is decoupled from the client connection: it is consumed by a task
+    (see `start`), and clients `subscribe` to the buffer. Events are numbered from 1
+    (the SSE `id` field), so a reconnecting client can resume after the `Last-Event-ID`
+    it received.
+    Once the buffer holds more than `max_bytes`, the oldest events are evicted.
+    Unless `keep_sent`, events are also evicted once sent to every subscriber, for
+    generations that are not resumable.
+
+    The generation is aborted (its task cancelled) once it has had no subscriber for
+    `abandon_timeout` seconds, None to always run it to completion.
+
+    Once the slowest subscriber is more than `high_water` bytes behind, the buffer is
+    `congested` until it catches up to `low_water` bytes, and `policy` applies:
+
+    - "coalesce": nothing here, the producer is expected to merge chunks meanwhile (see `coalesce_while`).
+    - "pause": the generation is not consumed until the subscribers catch up.
+    - "drop": the subscribers too far behind are dropped, their clients get the final answer from the conversation.
+      So once a subscriber is dropped, the generation always runs to completion.
+
+    The buffer is not thread-safe, it must only be used within one event loop.
+    """
+
+    def __init__(
+        self,
+        message_id: str,
+        *,
+        max_bytes: int | None = None,
+        headers: dict[str, str] | None = None,
+        abandon_timeout: float | None = 0,
+        high_water: int | None = None,
+        low_water: int = 0,
+        policy: BackpressurePolicy = "coalesce",
+        keep_sent: bool = True,
+    ):
+        self.message_id = message_id
+        """Id of the message that started the generation."""
+        self.max_bytes = max_bytes
+        self.keep_sent = keep_sent
+        self.abandon_timeout = abandon_timeout
+        self.headers = headers or {}
+        """Response headers of the original stream."""
+        self.high_water = high_water
+        self.low_water = low_water
+        self.policy = policy
+        self.nbytes = 0
+        self.buffered_bytes = 0
+        """Size of the events not sent to the slowest subscriber yet."""
+        self.peak_buffered_bytes = 0
+        self.congested = False
+        self.last_event_id = 0
+        self.closed = False
+        self._events: deque[str] = deque()
+        self._updated = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._subscribers = 0
+        # Bytes behind, by subscriber.
+        self._lags: dict[object, int] = {}
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._abandon_handle: asyncio.TimerHandle | None = None
+        self._dropped = False
+        """Whether a subscriber was dropped, its client expects the final answer."""
+
+    @property
+    def first_event_id(self) -> int:
+        return self.last_event_id - len(self._events) + 1
+
+    def retains(self, last_event_id: int) -> bool:
+        """Whether the events after `last_event_id` are all still in the buffer."""
+        return self.first_event_id - 1 <= last_event_id <= self.last_event_id
+
+    def start(
+        self,
+        events: AsyncIterator[str],
+        on_done: Callable[[], Awaitable[None]] | None = None,
+    ) -> None:
+        """Consumes `events` (their data) in a task, and awaits `on_done` after that, even if aborted.
+
+        With the "pause" policy, `events` is not consumed while the buffer is congested.
+        """
+
+        async def fill() -> None:
+            try:
+                async for event in events:
+                    if self.policy == "pause" and self.congested:
+                        await self._drained.wait()
+                    self.append(event)
+            finally:
+                self.close()
+                stream_buffered_bytes.observe(self.peak_buffered_bytes)
+                if on_done is not None:
+                    try:
+                        await on_done()
+                    except Exception:
+                        logger.exception(
+                            "Failed to finish the generation %s", self.message_id
+                        )
+
+        self._task = asyncio.create_task(fill())
+
+    def append(self, data: str) -> None:
+        """Appends the data of an event."""
+        self.last_event_id += 1
+        self._events.append(data)
+        self.nbytes += len(data)
+        for key in self._lags:
+            self._lags[key] += len(data)
+        self._update_buffered()
+        while (
+            self.max_bytes is not None
+            and self.nbytes > self.max_bytes
+            and len(self._events) > 1
+        ):
+            self.nbytes -= len(self._events.popleft())
+        self._notify()
+
+    def close(self) -> None:
+        self.closed = True
+        self._notify()
+
+    def abort(self) -> None:
+        """Aborts the generation, by cancelling its task."""
+        if self._task is not None and not self.closed:
+            self._task.cancel()
+
+    async def subscribe(
+        self,
+        last_event_id: int = 0,
+        *,
+        is_disconnected: Callable[[], Awaitable[bool]] | None = None,
+        poll_interval: float = 1.0,
+        formatter: Callable[[int, str], str] = sse_event,
+    ) -> AsyncIterator[str]:
+        """Yields the events after `last_event_id`, until the generation ends.
+
+        Events are formatted by `formatter` from their id and data, as server-sent
+        events by default.
+
+        Stops early if the subscriber falls behind the evicted events, or behind
+        `high_water` with the "drop" policy, it has to reload the conversation.
+        While waiting for events, `is_disconnected` is polled every `poll_interval`
+        seconds, to notice that the client is gone even if nothing is sent to it
+        (e.g. while a tool runs).
+        """
+        self._subscribers += 1
+        if self._abandon_handle is not None:
+            self._abandon_handle.cancel()
+            self._abandon_handle = None
+        try:
+            async for event_id, data in self._subscribe(
+                last_event_id, is_disconnected, poll_interval
+            ):
+                yield formatter(event_id, data)
+        finally:
+            self._unsubscribe()
+
+    async def _subscribe(
+        self,
+        cursor: int,
+        is_disconnected: Callable[[], Awaitable[bool]] | None,
+        poll_interval: float,
+    ) -> AsyncIterator[tuple[int, str]]:
+        key = object()
+        self._lags[key] = (
+            sum(
+                len(data) for data in list(self._events)[-self.last_event_id + cursor :]
+            )
+            if self.retains(cursor) and cursor < self.last_event_id
+            else 0
+        )
+        self._update_buffered()
+        try:
+            while True:
+                if not self.retains(cursor):
+                    logger.info(
+                        "Events after %s of %s evicted", cursor, self.message_id
+                    )
+                    return
+                # Take the events before yielding, `_events` may change meanwhile.
+                # Index from the end, subscribers are usually close to it.
+                pending = [
+                    (event_id, self._events[event_id - self.last_event_id - 1])
+                    for event_id in range(cursor + 1, self.last_event_id + 1)
+                ]
+                for event in pending:
+                    yield event
+                    # The previous event is sent once the next one is requested.
+                    self._lags[key] -= len(event[1])
+                    self._update_buffered()
+                    if not self.keep_sent:
+                        self._evict_sent()
+                    if (
+                        self.policy == "drop"
+                        and self.high_water is not None
+                        and self._lags[key] > self.high_water
+                    ):
+                        logger.info(
+                            "Subscriber of %s too far behind, dropping",
+                            self.message_id,
+                        )
+                        backpressure_events.labels(policy="drop").inc()
+                        self._dropped = True
+                        return
+                cursor += len(pending)
+                if self.closed and cursor == self.last_event_id:
+                    return
+                if cursor != self.last_event_id:
+                    continue
+                if is_disconnected is None:
+                    await self._updated.wait()
+                    continue
+                try:
+                    await asyncio.wait_for(self._updated.wait(), poll_interval)
+                except TimeoutError:
+                    if await is_disconnected():
+                        logger.info("Subscriber of %s disconnected", self.message_id)
+                        return
+        finally:
+            del self._lags[key]
+            self._update_buffered()
+
+    def _evict_sent(self) -> None:
+        """Evicts the events that the slowest subscriber has been sent."""
+        while (
+            self._events and self.nbytes - len(self._events[0]) >= self.buffered_bytes
+        ):
+            self.nbytes -= len(self._events.popleft())
+
+    def _unsubscribe(self) -> None:
+        self._subscribers -= 1
+        if (
+            self._subscribers
+            or self.closed
+            or self._task is None
+            or self.abandon_timeout is None
+            or self._dropped
+        ):
+            return
+        self._abandon_handle = asyncio.get_running_loop().call_later(
+            self.abandon_timeout, self._abandon
+        )
+
+    def _abandon(self) -> None:
+        self._abandon_handle = None
+        if self._subscribers or self.closed or self._task is None:
+            return
+        logger.info("Aborting the generation %s, nobody is listening", self.message_id)
+        self.abort()
+
+    def _update_buffered(self) -> None:
+        value = max(self._lags.values(), default=0)
+        buffered_bytes.inc(value - self.buffered_bytes)
+        self.buffered_bytes = value
+        self.peak_buffered_bytes = max(self.peak_buffered_bytes, value)
+        if self.high_water is None:
+            return
+        if not self.congested and value > self.high_water:
+            self.congested = True
+            self._drained.clear()
+            if self.policy != "drop":
+                # Drops are counted per subscriber.
+                backpressure_events.labels(policy=self.policy).inc()
+        elif self.congested and value <= self.low_water:
+            self.congested = False
+            self._drained.set()
+
+    def _notify(self) -> None:
+        self._updated.set()
+        self._updated = asyncio.Event()
+
+
+class StreamRegistry:
+    """Replay buffers of the ongoing (and recently finished) generations, by conversation.
+
+    At most `maxsize` buffers of `max_bytes` each are kept, for `ttl` seconds after
+    the generation started. A buffer evicted from the registry is not resumable anymore,
+    but its generation and subscribers carry on.
+    A generation without subscribers is aborted after `abandon_timeout` seconds,
+    clients have that long to resume it.
+    `high_water`, `low_water` and `policy` are the backpressure of the buffers, see
+    `ReplayBuffer`.
+    Buffers only live in this process, clients must reconnect to the same replica.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 256,
+        *,
+        ttl: float = 900,
+        max_bytes: int = 1024 * 1024,
+        abandon_timeout: float | None = 30,
+        high_water: int | None = None,
+        low_water: int = 0,
+        policy: BackpressurePolicy = "coalesce",
+    ):
+        self.max_bytes = max_bytes
+        self.abandon_timeout = abandon_timeout
+        self.high_water = high_water
+        self.low_water = low_water
+        self.policy = policy
+        self._buffers: LRUCache[UUID, ReplayBuffer] = LRUCache(maxsize, ttl=ttl)
+        replay_buffer_bytes.set_function(
+            lambda: sum(buffer.nbytes for buffer in self._buffers.values())
+        )
+
+    def create(
+        self,
+        conversation_id: UUID,
+        message_id: str,
+        headers: dict[str, str] | None = None,
+    ) -> ReplayBuffer:
+        """Creates the buffer of a new generation, replacing the previous one of the conversation."""
+        buffer = ReplayBuffer(
+            message_id,
+            max_bytes=self.max_bytes,
+            headers=headers,
+            abandon_timeout=self.abandon_timeout,
+            high_water=self.high_water,
+            low_water=self.low_water,
+            policy=self.policy,
+        )
+        self._buffers.set(conversation_id, buffer)
+        return buffer
+
+    def get(self, conversation_id: UUID, message_id: str) -> ReplayBuffer | None:
+        """Gets the buffer of the generation started by `message_id`, if it is still kept."""
+        buffer = self._buffers.get(conversation_id)
+        if buffer is None or buffer.message_id != message_id:
+            return None
+        return buffer
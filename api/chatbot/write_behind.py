@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any
+from uuid import UUID
+
+from sqlalchemy import Update, bindparam, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from chatbot.metrics.conversation import update_batch_size
+from chatbot.models import Conversation
+
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationUpdates:
+    """Updates of conversations (e.g. `last_message_at`, `title`), written behind in batches.
+
+    Updates are merged per conversation, the latest value of a field wins, and written in
+    one statement every `interval` seconds, or as soon as `max_pending` conversations
+    have pending updates. So the conversations (and the order of the conversation list)
+    are at most about `interval` seconds stale.
+    Failed writes are retried with the next batch, pending updates are lost if the
+    process dies. Updates of deleted conversations are ignored.
+    The buffer is not thread-safe, it must only be used within one event loop.
+    """
+
+    def __init__(
+        self,
+        session_maker: async_sessionmaker[AsyncSession],
+        *,
+        interval: float = 2.0,
+        max_pending: int = 1000,
+    ):
+        self.session_maker = session_maker
+        self.interval = interval
+        self.max_pending = max_pending
+        self._pending: dict[UUID, dict[str, Any]] = {}
+        self._full = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._stopping = False
+
+    def add(self, conversation_id: UUID, **fields: Any) -> None:
+        """Updates fields of a conversation, at the next flush."""
+        self._pending.setdefault(conversation_id, {}).update(fields)
+        if len(self._pending) >= self.max_pending:
+            self._full.set()
+
+    def discard(self, conversation_id: UUID, *fields: str) -> None:
+        """Discards the pending updates of some fields, e.g. if they were written directly."""
+        if (pending := self._pending.get(conversation_id)) is None:
+            return
+        for field in fields:
+            pending.pop(field, None)
+        if not pending:
+            del self._pending[conversation_id]
+
+    async def flush(self) -> None:
+        """Writes the pending updates."""
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        self._full.clear()
+        try:
+            async with self.session_maker() as session:
+                for names, params in _group_by_fields(batch).items():
+                    await session.execute(_update_statement(names), params)
+                await session.commit()
+        except Exception:
+            logger.exception("Failed to update %s conversations", len(batch))
+            # Retry with the next batch, unless overridden meanwhile.
+            for conv_id, fields in batch.items():
+                self._pending[conv_id] = fields | self._pending.get(conv_id, {})
+            return
+        update_batch_size.observe(len(batch))
+
+    def start(self) -> None:
+        """Starts flushing periodically."""
+
+        async def run() -> None:
+            while not self._stopping:
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.interval)
+                except TimeoutError:
+                    pass
+                await self.flush()
+
+        self._stopping = False
+        self._task = asyncio.create_task(run())
+
+    async def stop(self) -> None:
+        """Stops flushing periodically, after writing the pending updates."""
+        if self._task is None:
+            await self.flush()
+            return
+        # Not cancelled, so that a write in progress completes.
+        self._stopping = True
+        self._full.set()
+        await self._task
+        self._task = None
+
+
+def _group_by_fields(
+    batch: dict[UUID, dict[str, Any]],
+) -> dict[tuple[str, ...], list[dict[str, Any]]]:
+    """Groups the updates by the fields they set, one `executemany` per group."""
+    groups: dict[tuple[str, ...], list[dict[str, Any]]] = {}
+    for conv_id, fields in batch.items():
+        names = tuple(sorted(fields))
+        params = {f"new_{name}": value for name, value in fields.items()}
+        groups.setdefault(names, []).append({"conv_id": conv_id, **params})
+    return groups
+
+
+def _update_statement(names: tuple[str, ...]) -> Update:
+    # A core (rather than ORM bulk) UPDATE, which does not fail on deleted rows.
+    table = Conversation.__table__
+    return (
+        update(table)
+        .where(table.c.id == bindparam("conv_id"))
+        .values({name: bindparam(f"new_{name}") for name in names})
+    )
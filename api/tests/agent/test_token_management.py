@@ -1,13 +1,20 @@
 import unittest
 
+from langchain_core.tools import tool
+
 from chatbot.agent.token_management import (
     DEFAULT_INPUT_TOKEN_RATIO,
+    DEFAULT_MIN_OUTPUT_TOKENS,
     DEFAULT_TOKEN_CONTEXT_LENGTH,
     MIN_POSITIVE_TOKENS,
+    TOOL_TEMPLATE_TOKENS,
+    OutputBudget,
     _calculate_max_input_tokens,
     _get_effective_token_counter,
     _get_model_max_output_tokens,
     _resolve_token_context_length,
+    count_tool_tokens,
+    resolve_output_budget,
     resolve_token_management_params,
 )
 
@@ -170,5 +177,89 @@ class TestGetModelMaxOutputTokens(unittest.TestCase):
         self.assertIsNone(result)
 
 
+class TestOutputBudget(unittest.TestCase):
+    def test_remaining_context(self):
+        budget = OutputBudget(context_length=8192, min_tokens=1024)
+        self.assertEqual(budget.max_input_tokens, 7168)
+        self.assertEqual(budget.for_prompt(2000), 6192)
+
+    def test_capped_by_max_tokens(self):
+        budget = OutputBudget(context_length=8192, min_tokens=1024, max_tokens=4096)
+        self.assertEqual(budget.for_prompt(1000), 4096)
+        self.assertEqual(budget.for_prompt(6000), 2192)
+
+    def test_at_least_min_tokens(self):
+        budget = OutputBudget(context_length=8192, min_tokens=1024)
+        self.assertEqual(budget.for_prompt(8000), 1024)
+
+
+class TestCountToolTokens(unittest.TestCase):
+    def test_no_tools(self):
+        self.assertEqual(count_tool_tokens([], lambda messages: 42), 0)
+
+    def test_schemas_counted(self):
+        @tool
+        def search(query: str) -> str:
+            """Search the web."""
+            return query
+
+        def token_counter(messages):
+            # One "token" per character of the schemas.
+            return sum(len(message.content) for message in messages)
+
+        tokens = count_tool_tokens([search], token_counter)
+        self.assertGreater(tokens, TOOL_TEMPLATE_TOKENS + len("Search the web."))
+
+
+class TestResolveOutputBudget(unittest.TestCase):
+    class DummyLanguageModel:
+        def __init__(self, context_length=None, max_tokens=None, metadata=None):
+            self.context_length = context_length
+            self.max_tokens = max_tokens
+            self.metadata = metadata
+
+        def get_context_length(self):
+            return self.context_length
+
+    def test_unknown_context_length(self):
+        model = TestResolveOutputBudget.DummyLanguageModel()
+        self.assertIsNone(resolve_output_budget(model))
+
+    def test_user_context_length(self):
+        model = TestResolveOutputBudget.DummyLanguageModel()
+        budget = resolve_output_budget(model, context_length=8192)
+        self.assertEqual(
+            budget, OutputBudget(8192, DEFAULT_MIN_OUTPUT_TOKENS, max_tokens=None)
+        )
+
+    def test_min_from_metadata(self):
+        model = TestResolveOutputBudget.DummyLanguageModel(
+            context_length=32768,
+            max_tokens=8192,
+            metadata={"min_output_tokens": "2048"},
+        )
+        self.assertEqual(
+            resolve_output_budget(model), OutputBudget(32768, 2048, max_tokens=8192)
+        )
+
+    def test_invalid_min_in_metadata(self):
+        model = TestResolveOutputBudget.DummyLanguageModel(
+            context_length=32768, metadata={"min_output_tokens": "foo"}
+        )
+        self.assertEqual(
+            resolve_output_budget(model).min_tokens, DEFAULT_MIN_OUTPUT_TOKENS
+        )
+
+    def test_min_capped_by_max_tokens(self):
+        model = TestResolveOutputBudget.DummyLanguageModel(
+            context_length=32768, max_tokens=512
+        )
+        self.assertEqual(resolve_output_budget(model).min_tokens, 512)
+
+    def test_min_exceeds_context(self):
+        model = TestResolveOutputBudget.DummyLanguageModel(context_length=1000)
+        self.assertIsNone(resolve_output_budget(model))
+
+
 if __name__ == "__main__":
     unittest.main()
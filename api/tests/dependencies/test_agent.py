@@ -0,0 +1,28 @@
+import os
+import tempfile
+import unittest
+
+from langgraph.checkpoint.base import empty_checkpoint
+
+from chatbot.config import DBPoolSettings
+from chatbot.dependencies.agent import open_checkpointers
+
+
+class TestOpenCheckpointers(unittest.IsolatedAsyncioTestCase):
+    async def test_sqlite(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            url = f"sqlite+aiosqlite:///{os.path.join(tmpdir, 'test.sqlite')}"
+            async with open_checkpointers(url, DBPoolSettings()) as new_checkpointer:
+                checkpointer = new_checkpointer()
+                # They share the connection.
+                self.assertIs(new_checkpointer(), checkpointer)
+
+                config = {"configurable": {"thread_id": "1", "checkpoint_ns": ""}}
+                checkpoint = empty_checkpoint()
+                await checkpointer.aput(config, checkpoint, {}, {})
+                saved = await checkpointer.aget_tuple(config)
+            self.assertEqual(saved.checkpoint["id"], checkpoint["id"])
+
+
+if __name__ == "__main__":
+    unittest.main()
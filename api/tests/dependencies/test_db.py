@@ -0,0 +1,42 @@
+import unittest
+
+from prometheus_client import REGISTRY
+from sqlalchemy import text
+from sqlalchemy.pool import NullPool
+
+from chatbot.config import DBPoolSettings
+from chatbot.dependencies.db import InstrumentedPool, create_pooled_engine
+
+
+class TestCreatePooledEngine(unittest.IsolatedAsyncioTestCase):
+    async def test_pooled(self):
+        engine = create_pooled_engine(
+            "sqlite+aiosqlite://", DBPoolSettings(size=2), "test"
+        )
+        self.assertIsInstance(engine.pool, InstrumentedPool)
+        labels = {"engine": "test"}
+        before = REGISTRY.get_sample_value("db_pool_checkout_seconds_count", labels)
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+            self.assertEqual(
+                REGISTRY.get_sample_value("db_pool_checked_out", labels), 1
+            )
+        self.assertEqual(REGISTRY.get_sample_value("db_pool_checked_out", labels), 0)
+        self.assertEqual(
+            REGISTRY.get_sample_value("db_pool_checkout_seconds_count", labels),
+            (before or 0) + 1,
+        )
+        self.assertEqual(
+            REGISTRY.get_sample_value("db_pool_max_connections", labels), 12
+        )
+        await engine.dispose()
+
+    def test_unpooled(self):
+        engine = create_pooled_engine(
+            "sqlite+aiosqlite://", DBPoolSettings(size=0), "test-unpooled"
+        )
+        self.assertIsInstance(engine.pool, NullPool)
+
+
+if __name__ == "__main__":
+    unittest.main()
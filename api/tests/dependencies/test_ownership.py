@@ -0,0 +1,52 @@
+import unittest
+from uuid import uuid4
+
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from chatbot.cache import LRUCache
+from chatbot.dependencies.ownership import validate_conversation_owner
+from chatbot.models import Base, Conversation
+
+
+class TestValidateConversationOwner(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite://")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session_maker = async_sessionmaker(self.engine, expire_on_commit=False)
+        async with self.session_maker() as session:
+            self.conv = Conversation(title="test", owner="alice")
+            session.add(self.conv)
+            await session.commit()
+        self.owner_cache = LRUCache(8)
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+
+    async def test_cached(self):
+        await validate_conversation_owner(
+            self.session_maker, self.owner_cache, self.conv.id, "alice"
+        )
+        self.assertEqual(self.owner_cache.get(self.conv.id), "alice")
+
+        # Served from the cache.
+        await self.engine.dispose()
+        self.session_maker.configure(bind=None)
+        with self.assertRaises(HTTPException) as cm:
+            await validate_conversation_owner(
+                self.session_maker, self.owner_cache, self.conv.id, "bob"
+            )
+        self.assertEqual(cm.exception.status_code, 403)
+
+    async def test_not_found(self):
+        with self.assertRaises(HTTPException) as cm:
+            await validate_conversation_owner(
+                self.session_maker, self.owner_cache, uuid4(), "alice"
+            )
+        self.assertEqual(cm.exception.status_code, 404)
+        self.assertEqual(len(self.owner_cache), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
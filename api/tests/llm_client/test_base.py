@@ -1,6 +1,8 @@
 import unittest
 
-from chatbot.llm_client.base import StreamThinkingProcessor
+from langchain_core.messages import AIMessage, HumanMessage
+
+from chatbot.llm_client.base import ExtendedChatOpenAI, StreamThinkingProcessor
 
 
 class TestStreamThinkingProcessor(unittest.TestCase):
@@ -273,5 +275,81 @@ class TestStreamThinkingProcessor(unittest.TestCase):
         )  # Assert that after reset, it processes text as text
 
 
+class TestConvertMessages(unittest.TestCase):
+    def _human(self, id: str, num_images: int) -> HumanMessage:
+        return HumanMessage(
+            id=id,
+            content="foo",
+            additional_kwargs={
+                "attachments": [
+                    {"url": f"https://a/{id}/{i}.png", "mimetype": "image/png"}
+                    for i in range(num_images)
+                ]
+            },
+        )
+
+    def test_conversion_is_memoized(self):
+        llm = ExtendedChatOpenAI(api_key="whatever")
+        message = self._human("1", 1)
+        first = llm.convert_messages([message])
+        second = llm.convert_messages([message.model_copy(deep=True)])
+        self.assertEqual(first, second)
+        self.assertIs(first[0], second[0])
+
+    def test_changed_content_is_reconverted(self):
+        llm = ExtendedChatOpenAI(api_key="whatever")
+        llm.convert_messages([HumanMessage(id="1", content="foo")])
+        converted = llm.convert_messages([HumanMessage(id="1", content="bar")])
+        self.assertEqual(converted, [{"role": "user", "content": "bar"}])
+
+    def test_changed_image_is_reconverted(self):
+        llm = ExtendedChatOpenAI(api_key="whatever")
+
+        def human(url: str) -> HumanMessage:
+            return HumanMessage(
+                id="1", content=[{"type": "image_url", "image_url": {"url": url}}]
+            )
+
+        llm.convert_messages([human("https://a/1.png")])
+        converted = llm.convert_messages([human("https://a/2.png")])
+        self.assertEqual(
+            converted[0]["content"][0]["image_url"]["url"], "https://a/2.png"
+        )
+
+    def test_changed_tool_calls_are_reconverted(self):
+        llm = ExtendedChatOpenAI(api_key="whatever")
+
+        def ai(query: str) -> AIMessage:
+            return AIMessage(
+                id="1",
+                content="",
+                tool_calls=[{"id": "call", "name": "search", "args": {"q": query}}],
+            )
+
+        llm.convert_messages([ai("foo")])
+        converted = llm.convert_messages([ai("bar")])
+        self.assertEqual(
+            converted[0]["tool_calls"][0]["function"]["arguments"], '{"q": "bar"}'
+        )
+
+    def test_truncation_does_not_mutate_cache(self):
+        llm = ExtendedChatOpenAI(
+            api_key="whatever", metadata={"limit_mm_per_prompt": {"image": 1}}
+        )
+        messages = [self._human("1", 2), self._human("2", 1)]
+        for _ in range(2):
+            converted = llm.convert_messages(messages)
+            images = [
+                part["image_url"]["url"]
+                for message in converted
+                for part in message["content"]
+                if part["type"] == "image_url"
+            ]
+            self.assertEqual(images, ["https://a/2/0.png"])
+        # The cached conversion is intact: text and both images.
+        llm.metadata = {"limit_mm_per_prompt": {"image": 3}}
+        self.assertEqual(len(llm.convert_messages(messages[:1])[0]["content"]), 3)
+
+
 if __name__ == "__main__":
     unittest.main()
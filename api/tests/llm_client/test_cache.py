@@ -0,0 +1,43 @@
+import unittest
+
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+
+from chatbot.llm_client.cache import ResponseCache, with_response_cache
+
+
+class TestResponseCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.cache = ResponseCache(16)
+        self.llm = GenericFakeChatModel(
+            messages=iter([AIMessage(content="foo"), AIMessage(content="bar")])
+        )
+
+    async def test_repeated_call_cached(self):
+        llm = with_response_cache(self.llm, self.cache)
+        first = await llm.ainvoke([HumanMessage(content="hi", id="1")])
+        # Message ids are not part of the prompt.
+        second = await llm.ainvoke([HumanMessage(content="hi", id="2")])
+        self.assertEqual(first.content, "foo")
+        self.assertEqual(second.content, "foo")
+        self.assertEqual(self.cache.entries, 1)
+        self.assertGreater(self.cache.nbytes, 0)
+
+    async def test_different_prompt_not_cached(self):
+        llm = with_response_cache(self.llm, self.cache)
+        await llm.ainvoke([HumanMessage(content="hi")])
+        second = await llm.ainvoke([HumanMessage(content="hello")])
+        self.assertEqual(second.content, "bar")
+        self.assertEqual(self.cache.entries, 2)
+
+    async def test_opt_in(self):
+        self.assertIs(with_response_cache(self.llm, None), self.llm)
+        await with_response_cache(self.llm, self.cache).ainvoke("hi")
+        # The original model does not use the cache.
+        self.assertIsNone(self.llm.cache)
+        second = await self.llm.ainvoke("hi")
+        self.assertEqual(second.content, "bar")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+from unittest.mock import patch
+
+from langchain_core.messages import HumanMessage
+
+from chatbot.llm_client.github import (
+    IMAGE_SIZE_RETRY_AFTER,
+    MAX_IMAGE_DIMENSION,
+    _collect_image_sizes,
+    _failed_urls,
+    _image_sizes,
+    url_to_size,
+)
+
+
+class TestImageSizes(unittest.TestCase):
+    def setUp(self):
+        _image_sizes.clear()
+        _failed_urls.clear()
+
+    def test_collect_image_sizes(self):
+        messages = [
+            HumanMessage(
+                content="foo",
+                additional_kwargs={
+                    "attachments": [
+                        {"url": "https://a/1.png", "width": 640, "height": 480},
+                        {"url": "https://a/2.png"},
+                    ]
+                },
+            ),
+            HumanMessage(content="bar"),
+        ]
+        self.assertEqual(
+            _collect_image_sizes(messages), {"https://a/1.png": (640, 480)}
+        )
+
+    def test_invalid_image_sizes(self):
+        messages = [
+            HumanMessage(
+                content="foo",
+                additional_kwargs={
+                    "attachments": [
+                        {"url": "https://a/1.png", "width": -640, "height": 480},
+                        {"url": "https://a/2.png", "width": "640", "height": 480},
+                        {"url": "https://a/3.png", "width": 10**9, "height": 480},
+                    ]
+                },
+            ),
+        ]
+        self.assertEqual(
+            _collect_image_sizes(messages),
+            {"https://a/3.png": (MAX_IMAGE_DIMENSION, 480)},
+        )
+
+    @patch("chatbot.llm_client.github._url_to_size", return_value=(64, 32))
+    def test_remote_url_fetched_once(self, mock_url_to_size):
+        for _ in range(3):
+            self.assertEqual(url_to_size("https://a/1.png"), (64, 32))
+        mock_url_to_size.assert_called_once_with("https://a/1.png")
+
+    @patch("chatbot.llm_client.github._url_to_size", return_value=None)
+    def test_failure_retried_later(self, mock_url_to_size):
+        with patch("chatbot.cache.monotonic", return_value=0):
+            self.assertIsNone(url_to_size("https://a/1.png"))
+            self.assertIsNone(url_to_size("https://a/1.png"))
+        self.assertEqual(mock_url_to_size.call_count, 1)
+
+        mock_url_to_size.return_value = (64, 32)
+        with patch("chatbot.cache.monotonic", return_value=IMAGE_SIZE_RETRY_AFTER):
+            self.assertEqual(url_to_size("https://a/1.png"), (64, 32))
+
+    @patch("chatbot.llm_client.github._url_to_size", return_value=(64, 32))
+    def test_data_url_not_cached(self, mock_url_to_size):
+        url_to_size("data:image/png;base64,AAAA")
+        url_to_size("data:image/png;base64,AAAA")
+        self.assertEqual(mock_url_to_size.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+
+from chatbot.llm_client.ratelimit import (
+    AdaptiveRateLimiter,
+    ClientRateLimitError,
+    _get_retry_after,
+    _parse_duration,
+)
+
+
+class TestRateLimitHeaders(unittest.TestCase):
+    def test_parse_duration(self):
+        self.assertEqual(_parse_duration("1"), 1)
+        self.assertEqual(_parse_duration("1.5s"), 1.5)
+        self.assertEqual(_parse_duration("6m0s"), 360)
+        self.assertEqual(_parse_duration("20ms"), 0.02)
+        self.assertIsNone(_parse_duration("soon"))
+
+    def test_get_retry_after(self):
+        self.assertEqual(_get_retry_after({"retry-after-ms": "1500"}), 1.5)
+        self.assertEqual(_get_retry_after({"retry-after": "3"}), 3)
+        self.assertEqual(_get_retry_after({"x-ratelimit-reset-requests": "1m"}), 60)
+        self.assertEqual(
+            _get_retry_after({"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"}), 0
+        )
+        self.assertIsNone(_get_retry_after({}))
+
+
+class TestAdaptiveRateLimiter(unittest.IsolatedAsyncioTestCase):
+    async def test_unlimited(self):
+        limiter = AdaptiveRateLimiter()
+        for _ in range(100):
+            self.assertTrue(limiter.acquire(blocking=False))
+
+    async def test_burst(self):
+        limiter = AdaptiveRateLimiter(60, burst=2)
+        self.assertTrue(await limiter.aacquire(blocking=False))
+        self.assertTrue(await limiter.aacquire(blocking=False))
+        self.assertFalse(await limiter.aacquire(blocking=False))
+
+    async def test_reject_when_waiting_too_long(self):
+        limiter = AdaptiveRateLimiter(60, burst=1, max_wait=0.5)
+        await limiter.aacquire()
+        with self.assertRaises(ClientRateLimitError) as cm:
+            await limiter.aacquire()
+        self.assertGreater(cm.exception.retry_after, 0.5)
+
+    async def test_blocked_by_retry_after(self):
+        limiter = AdaptiveRateLimiter(max_wait=5)
+        limiter.on_rate_limited({"retry-after": "10"})
+        with self.assertRaises(ClientRateLimitError):
+            await limiter.aacquire()
+
+    def test_rate_halved_and_recovered(self):
+        limiter = AdaptiveRateLimiter(100)
+        limiter.on_rate_limited()
+        self.assertEqual(limiter.rate, 50)
+        for _ in range(5):
+            limiter.on_success()
+        self.assertEqual(limiter.rate, 75)
+        for _ in range(20):
+            limiter.on_success()
+        self.assertEqual(limiter.rate, 100)
+
+    def test_rate_learned_from_headers(self):
+        limiter = AdaptiveRateLimiter()
+        limiter.on_rate_limited({"x-ratelimit-limit-requests": "15"})
+        self.assertEqual(limiter.rate, 15)
+        self.assertEqual(limiter.ceiling, 15)
+
+
+if __name__ == "__main__":
+    unittest.main()
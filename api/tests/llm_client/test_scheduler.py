@@ -0,0 +1,68 @@
+import asyncio
+import unittest
+
+from chatbot.llm_client.scheduler import (
+    PRIORITY_METADATA_KEY,
+    AdmissionScheduler,
+    Priority,
+)
+
+
+class TestPriority(unittest.TestCase):
+    def test_from_metadata(self):
+        self.assertEqual(Priority.from_metadata(None), Priority.CHAT)
+        self.assertEqual(
+            Priority.from_metadata({PRIORITY_METADATA_KEY: "safety"}), Priority.SAFETY
+        )
+        self.assertEqual(
+            Priority.from_metadata({PRIORITY_METADATA_KEY: Priority.SUMMARIZATION}),
+            Priority.SUMMARIZATION,
+        )
+        self.assertEqual(
+            Priority.from_metadata({PRIORITY_METADATA_KEY: "foo"}), Priority.CHAT
+        )
+
+
+class TestAdmissionScheduler(unittest.IsolatedAsyncioTestCase):
+    async def test_admitted_by_priority(self):
+        scheduler = AdmissionScheduler(1, model="test-priority")
+        admitted = []
+        release = asyncio.Event()
+
+        async def call(name: str, priority: Priority, wait: bool = False):
+            async with scheduler.admit(priority):
+                admitted.append(name)
+                if wait:
+                    await release.wait()
+
+        first = asyncio.create_task(call("first", Priority.CHAT, wait=True))
+        await asyncio.sleep(0)
+        others = [
+            asyncio.create_task(call("smry", Priority.SUMMARIZATION)),
+            asyncio.create_task(call("picker", Priority.TOOL_PICKER)),
+            asyncio.create_task(call("chat", Priority.CHAT)),
+        ]
+        await asyncio.sleep(0)
+        self.assertEqual(scheduler.queue_depth, 3)
+
+        release.set()
+        await asyncio.gather(first, *others)
+        self.assertEqual(admitted, ["first", "chat", "picker", "smry"])
+        self.assertEqual(scheduler.in_flight, 0)
+
+    async def test_cancelled_waiter(self):
+        scheduler = AdmissionScheduler(1, model="test-cancel")
+        async with scheduler.admit():
+            waiter = asyncio.create_task(scheduler._acquire(Priority.CHAT))
+            await asyncio.sleep(0)
+            waiter.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiter
+            self.assertEqual(scheduler.queue_depth, 0)
+        self.assertEqual(scheduler.in_flight, 0)
+        async with scheduler.admit():
+            self.assertEqual(scheduler.in_flight, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
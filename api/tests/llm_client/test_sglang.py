@@ -0,0 +1,77 @@
+import json
+import unittest
+
+import httpx
+from langchain_core.messages import AIMessage, HumanMessage
+
+from chatbot.llm_client.sglang import SGLangChatOpenAI
+
+
+class TestSGLangChatOpenAI(unittest.TestCase):
+    def setUp(self):
+        self.requests: list[httpx.Request] = []
+        self.routes: dict[str, dict] = {}
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if request.url.path not in self.routes:
+            return httpx.Response(404)
+        return httpx.Response(200, json=self.routes[request.url.path])
+
+    def llm(self, **kwargs) -> SGLangChatOpenAI:
+        return SGLangChatOpenAI(
+            api_key="whatever",
+            base_url="http://sglang:30000/v1",
+            model="Qwen/Qwen3-8B",
+            http_client=httpx.Client(transport=httpx.MockTransport(self.handler)),
+            **kwargs,
+        )
+
+    def test_context_length_from_server_info(self):
+        self.routes["/get_server_info"] = {"context_length": 32768}
+        self.assertEqual(self.llm().get_context_length(), 32768)
+        self.assertEqual(
+            [request.url.path for request in self.requests], ["/get_server_info"]
+        )
+
+    def test_context_length_from_models(self):
+        self.routes["/get_server_info"] = {"context_length": None}
+        self.routes["/v1/models"] = {
+            "data": [
+                {"id": "other", "max_model_len": 4096},
+                {"id": "Qwen/Qwen3-8B", "max_model_len": 40960},
+            ]
+        }
+        self.assertEqual(self.llm().get_context_length(), 40960)
+
+    def test_num_tokens_from_messages(self):
+        self.routes["/v1/tokenize"] = {"count": [3, 5]}
+        llm = self.llm(tokens_per_message=4)
+        messages = [
+            HumanMessage(content="What's the weather?"),
+            AIMessage(
+                content="",
+                tool_calls=[
+                    {"id": "call", "name": "weather", "args": {"city": "Paris"}}
+                ],
+            ),
+        ]
+        self.assertEqual(llm.get_num_tokens_from_messages(messages), 3 + 5 + 2 * 4)
+
+        body = json.loads(self.requests[-1].content)
+        self.assertEqual(body["model"], "Qwen/Qwen3-8B")
+        self.assertFalse(body["add_special_tokens"])
+        self.assertEqual(body["prompt"][0], "What's the weather?")
+        # The tool calls are counted as text.
+        self.assertIn('weather\n{"city": "Paris"}', body["prompt"][1])
+
+    def test_num_tokens_single_count(self):
+        self.routes["/v1/tokenize"] = {"count": 7}
+        llm = self.llm(tokens_per_message=4)
+        self.assertEqual(
+            llm.get_num_tokens_from_messages([HumanMessage(content="hi")]), 11
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
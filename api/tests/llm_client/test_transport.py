@@ -0,0 +1,144 @@
+import unittest
+from types import SimpleNamespace
+
+import httpx
+from langchain_core.messages import HumanMessage
+from prometheus_client import REGISTRY
+
+from chatbot.llm_client.transport import (
+    bind_http_clients,
+    create_http_clients,
+    instrument_pool,
+)
+from chatbot.llm_client.vllm import VLLMChatOpenAI
+
+
+COMPLETION = {
+    "id": "chatcmpl-1",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "Qwen/Qwen3-8B",
+    "choices": [
+        {
+            "index": 0,
+            "message": {"role": "assistant", "content": "Hello!"},
+            "finish_reason": "stop",
+        }
+    ],
+}
+
+
+class TestBindHttpClients(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.requests: list[tuple[str, str]] = []
+        self.llm = VLLMChatOpenAI(
+            api_key="whatever",
+            base_url="http://vllm:8000/v1",
+            model="Qwen/Qwen3-8B",
+        )
+        bind_http_clients(
+            self.llm,
+            httpx.Client(transport=httpx.MockTransport(self.handler("sync"))),
+            httpx.AsyncClient(transport=httpx.MockTransport(self.handler("async"))),
+        )
+
+    def handler(self, client: str):
+        def handle(request: httpx.Request) -> httpx.Response:
+            self.requests.append((client, request.url.path))
+            if request.url.path == "/v1/chat/completions":
+                return httpx.Response(200, json=COMPLETION)
+            if request.url.path == "/v1/models":
+                return httpx.Response(
+                    200,
+                    json={"data": [{"id": "Qwen/Qwen3-8B", "max_model_len": 40960}]},
+                )
+            return httpx.Response(404)
+
+        return handle
+
+    def test_chat_completions(self):
+        self.assertEqual(
+            self.llm.invoke([HumanMessage(content="hi")]).content, "Hello!"
+        )
+        self.assertEqual(self.requests, [("sync", "/v1/chat/completions")])
+
+    async def test_async_chat_completions(self):
+        msg = await self.llm.ainvoke([HumanMessage(content="hi")])
+        self.assertEqual(msg.content, "Hello!")
+        self.assertEqual(self.requests, [("async", "/v1/chat/completions")])
+
+    def test_auxiliary_calls(self):
+        self.assertEqual(self.llm.get_context_length(), 40960)
+        self.assertEqual(self.requests, [("sync", "/v1/models")])
+
+
+class TestCreateHttpClients(unittest.TestCase):
+    def test_timeout(self):
+        http_client, http_async_client = create_http_clients(
+            max_connections=10,
+            max_keepalive_connections=5,
+            keepalive_expiry=30.0,
+            http2=False,
+            timeout=600.0,
+        )
+        self.assertEqual(http_client.timeout, httpx.Timeout(600.0))
+        self.assertEqual(http_async_client.timeout, httpx.Timeout(600.0))
+
+
+class TestInstrumentPool(unittest.TestCase):
+    @staticmethod
+    def sample(name: str, **labels) -> float | None:
+        return REGISTRY.get_sample_value(name, labels)
+
+    def test_gauges(self):
+        transport = httpx.HTTPTransport()
+        transport._pool = SimpleNamespace(
+            connections=[
+                SimpleNamespace(is_idle=lambda: True),
+                SimpleNamespace(is_idle=lambda: False),
+                SimpleNamespace(is_idle=lambda: False),
+            ],
+            _requests=[
+                SimpleNamespace(is_queued=lambda: True),
+                SimpleNamespace(is_queued=lambda: False),
+            ],
+        )
+        instrument_pool(transport, "test")
+
+        self.assertEqual(
+            self.sample("llm_http_pool_connections", client="test", state="active"), 2
+        )
+        self.assertEqual(
+            self.sample("llm_http_pool_connections", client="test", state="idle"), 1
+        )
+        self.assertEqual(self.sample("llm_http_pool_queued_requests", client="test"), 1)
+
+        # The gauges are read when scraped.
+        transport._pool.connections.pop()
+        self.assertEqual(
+            self.sample("llm_http_pool_connections", client="test", state="active"), 1
+        )
+
+    def test_real_pool(self):
+        # Fails if httpx renames the private attributes.
+        instrument_pool(httpx.HTTPTransport(), "test-real")
+        self.assertEqual(
+            self.sample("llm_http_pool_connections", client="test-real", state="idle"),
+            0,
+        )
+        self.assertEqual(
+            self.sample("llm_http_pool_queued_requests", client="test-real"), 0
+        )
+
+    def test_pool_not_found(self):
+        with self.assertLogs("chatbot.llm_client.transport", level="WARNING"):
+            instrument_pool(httpx.MockTransport(lambda _: None), "test-missing")
+        self.assertIsNone(
+            self.sample(
+                "llm_http_pool_connections", client="test-missing", state="idle"
+            )
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import json
+import unittest
+
+import httpx
+from langchain_core.messages import HumanMessage
+
+from chatbot.llm_client.vllm import VLLMChatOpenAI
+
+
+class TestBatchComplete(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.requests: list[httpx.Request] = []
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        body = json.loads(request.content)
+        if request.url.path == "/tokenize":
+            text = body["messages"][-1]["content"]
+            return httpx.Response(200, json={"tokens": [len(text)]})
+        if request.url.path == "/v1/completions":
+            # Out of order, as vLLM may return them.
+            choices = [
+                {"index": index, "text": f"out-{prompt[0]}"}
+                for index, prompt in enumerate(body["prompt"])
+            ]
+            return httpx.Response(200, json={"choices": choices[::-1]})
+        return httpx.Response(404)
+
+    async def test_one_completion_request(self):
+        llm = VLLMChatOpenAI(
+            api_key="whatever",
+            base_url="http://vllm:8000/v1",
+            model="meta-llama/Llama-Guard-3-8B",
+            http_async_client=httpx.AsyncClient(
+                transport=httpx.MockTransport(self.handler)
+            ),
+        )
+        texts = await llm.abatch_complete(
+            [[HumanMessage(content="a")], [HumanMessage(content="bbb")]],
+            max_tokens=16,
+        )
+        self.assertEqual(texts, ["out-1", "out-3"])
+
+        completions = [r for r in self.requests if r.url.path == "/v1/completions"]
+        self.assertEqual(len(completions), 1)
+        body = json.loads(completions[0].content)
+        self.assertEqual(body["prompt"], [[1], [3]])
+        self.assertEqual(body["max_tokens"], 16)
+        tokenize = json.loads(self.requests[0].content)
+        self.assertTrue(tokenize["add_generation_prompt"])
+
+
+if __name__ == "__main__":
+    unittest.main()
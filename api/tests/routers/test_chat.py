@@ -0,0 +1,175 @@
+import json
+import unittest
+from unittest.mock import patch
+
+from langchain_core.messages import AIMessageChunk, HumanMessage
+
+from chatbot.routers.chat import (
+    ChunkEncoder,
+    DeltaChunkEncoder,
+    PartialAnswer,
+    record_image_sizes,
+)
+from chatbot.schemas import ChatMessage, HumanChatMessage
+
+
+def from_lc(msg, parent_id=None) -> str:
+    return ChatMessage.from_lc(msg, parent_id=parent_id).model_dump_json()
+
+
+class TestChunkEncoder(unittest.TestCase):
+    def test_same_as_chat_message(self):
+        chunks = [
+            AIMessageChunk(id="run-1", content=""),
+            AIMessageChunk(
+                id="run-1",
+                content=[{"type": "text", "text": 'Hé "quoted"\n', "index": 0}],
+                additional_kwargs={"raw_content": 'Hé "quoted"\n'},
+            ),
+            AIMessageChunk(
+                id="run-1",
+                content=[{"type": "thinking", "thinking": "hmm", "index": 0}],
+                additional_kwargs={"score": 1.0, "extra": None, "nested": [1, {}]},
+            ),
+            AIMessageChunk(id="run-2", content="next message"),
+        ]
+        for parent_id in ("parent-1", None):
+            encoder = ChunkEncoder(parent_id=parent_id)
+            for chunk in chunks:
+                with self.subTest(parent_id=parent_id, chunk=chunk):
+                    self.assertEqual(encoder.encode(chunk), from_lc(chunk, parent_id))
+
+    def test_fallback(self):
+        encoder = ChunkEncoder(parent_id="parent-1")
+        messages = [
+            HumanMessage(id="human-1", content="hi"),
+            AIMessageChunk(id="run-1", content="named", name="assistant"),
+            AIMessageChunk(
+                id="run-1",
+                content="lifted",
+                additional_kwargs={"sent_at": "2025-01-01T00:00:00Z"},
+            ),
+        ]
+        for msg in messages:
+            with self.subTest(msg=msg):
+                self.assertEqual(encoder.encode(msg), from_lc(msg, "parent-1"))
+
+
+class TestDeltaChunkEncoder(unittest.TestCase):
+    def test_envelope_then_deltas(self):
+        encoder = DeltaChunkEncoder(parent_id="parent-1")
+        first = AIMessageChunk(
+            id="run-1",
+            content=[{"type": "text", "text": "Hel", "index": 0}],
+            additional_kwargs={"raw_content": "Hel"},
+        )
+        envelope = json.loads(encoder.encode(first))
+        self.assertEqual(envelope["parent_id"], "parent-1")
+        self.assertEqual(envelope["id"], "run-1")
+        self.assertEqual(envelope["type"], "AIMessageChunk")
+        self.assertEqual(envelope["content"], first.content)
+        self.assertEqual(envelope["additional_kwargs"], {})
+
+        self.assertEqual(
+            encoder.encode(
+                AIMessageChunk(
+                    id="run-1",
+                    content=[{"type": "text", "text": "lo", "index": 0}],
+                    additional_kwargs={"raw_content": "lo"},
+                )
+            ),
+            '{"c":[{"type":"text","text":"lo","index":0}]}',
+        )
+        self.assertEqual(
+            encoder.encode(
+                AIMessageChunk(id="run-1", content="", additional_kwargs={"a": 1})
+            ),
+            '{"c":"","k":{"a":1}}',
+        )
+
+        # A new message gets its own envelope.
+        self.assertEqual(
+            json.loads(encoder.encode(AIMessageChunk(id="run-2", content="x")))["id"],
+            "run-2",
+        )
+
+    def test_other_messages(self):
+        encoder = DeltaChunkEncoder(parent_id="parent-1")
+        chunk = AIMessageChunk(id="run-1", content="a")
+        encoder.encode(chunk)
+        human = HumanMessage(id="human-1", content="hi")
+        self.assertEqual(encoder.encode(human), from_lc(human, "parent-1"))
+        # The envelope is sent again after another message.
+        self.assertEqual(encoder.encode(chunk), from_lc(chunk, "parent-1"))
+
+
+class TestPartialAnswer(unittest.TestCase):
+    def test_to_message(self):
+        answer = PartialAnswer()
+        metadata = {"langgraph_node": "chatbot"}
+        answer.add(AIMessageChunk(id="run-1", content="ignored"), metadata)
+        answer.add(AIMessageChunk(id="run-2", content="Hel"), metadata)
+        answer.add(AIMessageChunk(id="run-2", content="lo"), metadata)
+        answer.add(AIMessageChunk(id="run-3", content="x"), {"langgraph_node": "tools"})
+
+        partial = answer.to_message()
+        self.assertEqual(partial.id, "run-2")
+        self.assertEqual(partial.content, "Hello")
+        self.assertEqual(partial.response_metadata["finish_reason"], "cancelled")
+
+    def test_complete_message(self):
+        answer = PartialAnswer()
+        answer.add(
+            AIMessageChunk(
+                id="run-1",
+                content="done",
+                usage_metadata={
+                    "input_tokens": 1,
+                    "output_tokens": 1,
+                    "total_tokens": 2,
+                },
+            ),
+            {"langgraph_node": "chatbot"},
+        )
+        self.assertIsNone(answer.to_message())
+        self.assertEqual(answer.output_tokens, 1)
+
+
+class TestRecordImageSizes(unittest.TestCase):
+    @patch("chatbot.routers.chat.url_to_size", return_value=(640, 480))
+    def test_client_sizes_replaced(self, mock_url_to_size):
+        message = HumanChatMessage(
+            content="foo",
+            attachments=[
+                {
+                    "url": "https://a/1.png",
+                    "mimetype": "image/png",
+                    "width": 1,
+                    "height": 1,
+                },
+                {
+                    "url": "https://a/2.mp4",
+                    "mimetype": "video/mp4",
+                    "width": 1,
+                    "height": 1,
+                },
+            ],
+        )
+        record_image_sizes(message)
+        self.assertEqual(
+            message.attachments,
+            [
+                {
+                    "url": "https://a/1.png",
+                    "mimetype": "image/png",
+                    "width": 640,
+                    "height": 480,
+                },
+                {"url": "https://a/2.mp4", "mimetype": "video/mp4"},
+            ],
+        )
+        mock_url_to_size.assert_called_once_with("https://a/1.png")
+
+
+if __name__ == "__main__":
+    unittest.main()
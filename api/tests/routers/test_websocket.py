@@ -0,0 +1,83 @@
+import asyncio
+import json
+import unittest
+from uuid import uuid4
+
+from chatbot.routers.websocket import SEND_QUEUE_SIZE, ChatConnection
+from chatbot.streaming import ReplayBuffer
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent: list[dict] = []
+
+    async def send_text(self, data: str) -> None:
+        self.sent.append(json.loads(data))
+
+
+async def events(*items: str):
+    for item in items:
+        await asyncio.sleep(0.01)
+        yield item
+
+
+class TestChatConnection(unittest.IsolatedAsyncioTestCase):
+    async def test_multiplex(self):
+        websocket = FakeWebSocket()
+        connection = ChatConnection(websocket)
+        conv_1, conv_2 = uuid4(), uuid4()
+        for conv_id, items in ((conv_1, ('"a"', '"b"')), (conv_2, ('"c"',))):
+            buffer = ReplayBuffer("msg")
+            buffer.start(events(*items))
+            connection.subscribe(conv_id, buffer)
+
+        await asyncio.wait_for(
+            asyncio.gather(*(task for _, task in connection.streams.values())), 1
+        )
+        await asyncio.sleep(0.01)  # Let the sender drain.
+        connection.close()
+
+        self.assertEqual(
+            [
+                frame
+                for frame in websocket.sent
+                if frame["conversation_id"] == str(conv_1)
+            ],
+            [
+                {"conversation_id": str(conv_1), "id": 1, "data": "a"},
+                {"conversation_id": str(conv_1), "id": 2, "data": "b"},
+                {"conversation_id": str(conv_1), "end": True},
+            ],
+        )
+        self.assertIn({"conversation_id": str(conv_2), "end": True}, websocket.sent)
+        self.assertEqual(connection.streams, {})
+
+    async def test_cancel(self):
+        websocket = FakeWebSocket()
+        connection = ChatConnection(websocket)
+        conv_id = uuid4()
+        buffer = ReplayBuffer("msg", abandon_timeout=None)
+        buffer.start(events(*['"x"'] * 100))
+        connection.subscribe(conv_id, buffer)
+        await asyncio.sleep(0.03)
+
+        connection.cancel(conv_id)
+        await asyncio.sleep(0.01)
+        connection.close()
+        self.assertTrue(buffer.closed)
+        self.assertIn({"conversation_id": str(conv_id), "end": True}, websocket.sent)
+
+    async def test_error_does_not_block(self):
+        class StuckWebSocket:
+            async def send_text(self, data: str) -> None:
+                await asyncio.Event().wait()
+
+        connection = ChatConnection(StuckWebSocket())
+        for _ in range(SEND_QUEUE_SIZE + 2):
+            connection.send_error(uuid4(), "Stream not found.")
+        self.assertEqual(connection._queue.qsize(), SEND_QUEUE_SIZE)
+        connection.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+from unittest.mock import patch
+
+from chatbot.cache import LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(len(cache), 2)
+
+    @patch("chatbot.cache.monotonic")
+    def test_ttl(self, mock_monotonic):
+        cache = LRUCache(2, ttl=10)
+        mock_monotonic.return_value = 100
+        cache.set("a", 1, size=8)
+        mock_monotonic.return_value = 105
+        self.assertEqual(cache.get("a"), 1)
+        mock_monotonic.return_value = 110
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.nbytes, 0)
+
+    def test_max_bytes(self):
+        cache = LRUCache(10, max_bytes=100)
+        cache.set("a", 1, size=60)
+        cache.set("b", 2, size=30)
+        cache.set("c", 3, size=30)
+        self.assertNotIn("a", cache)
+        self.assertEqual(cache.nbytes, 60)
+
+        # Too large to be cached at all.
+        cache.set("d", 4, size=101)
+        self.assertNotIn("d", cache)
+        self.assertEqual(len(cache), 2)
+
+    def test_overwrite(self):
+        cache = LRUCache(10, max_bytes=100)
+        cache.set("a", 1, size=60)
+        cache.set("a", 2, size=30)
+        self.assertEqual(cache.get("a"), 2)
+        self.assertEqual(cache.nbytes, 30)
+        self.assertEqual(cache.pop("a"), 2)
+        self.assertEqual(cache.nbytes, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
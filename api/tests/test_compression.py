@@ -0,0 +1,47 @@
+import unittest
+import zlib
+
+import brotli
+
+from chatbot.compression import compress_stream, negotiate_encoding
+
+
+async def events(*items: str):
+    for item in items:
+        yield f"data: {item}\n\n"
+
+
+class TestNegotiateEncoding(unittest.TestCase):
+    def test_negotiate(self):
+        self.assertEqual(negotiate_encoding("gzip, deflate, br, zstd"), "br")
+        self.assertEqual(negotiate_encoding("gzip, deflate"), "gzip")
+        self.assertEqual(negotiate_encoding("br;q=0, gzip;q=0.5"), "gzip")
+        self.assertEqual(negotiate_encoding("*"), "br")
+        self.assertEqual(negotiate_encoding("*, br;q=0"), "gzip")
+        self.assertIsNone(negotiate_encoding("identity"))
+        self.assertIsNone(negotiate_encoding(None))
+
+
+class TestCompressStream(unittest.IsolatedAsyncioTestCase):
+    async def test_gzip_flushes_every_event(self):
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        received = [
+            decompressor.decompress(chunk)
+            async for chunk in compress_stream(events("a", "b"), "gzip")
+        ]
+        # Every event can be decoded as soon as it is received.
+        self.assertEqual(received, [b"data: a\n\n", b"data: b\n\n", b""])
+        self.assertTrue(decompressor.eof)
+
+    async def test_brotli_flushes_every_event(self):
+        decompressor = brotli.Decompressor()
+        received = [
+            decompressor.process(chunk)
+            async for chunk in compress_stream(events("a", "b"), "br")
+        ]
+        self.assertEqual(received, [b"data: a\n\n", b"data: b\n\n", b""])
+        self.assertTrue(decompressor.is_finished())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import asyncio
+import unittest
+
+from chatbot.notifications import NotificationHub
+
+
+class TestNotificationHub(unittest.IsolatedAsyncioTestCase):
+    async def test_publish(self):
+        hub = NotificationHub()
+        alice = hub.subscribe("alice")
+        bob = hub.subscribe("bob")
+        # Subscribe before publishing.
+        received = asyncio.gather(anext(alice), anext(bob))
+        await asyncio.sleep(0)
+
+        hub.publish("alice", "for alice")
+        hub.publish("bob", "for bob")
+        hub.publish("carol", "nobody listening")
+        self.assertEqual(await received, ["for alice", "for bob"])
+
+        await alice.aclose()
+        await bob.aclose()
+        self.assertEqual(dict(hub._subscribers), {})
+
+    async def test_disconnected(self):
+        hub = NotificationHub()
+
+        async def is_disconnected():
+            return True
+
+        subscriber = hub.subscribe(
+            "alice", is_disconnected=is_disconnected, poll_interval=0.01
+        )
+        self.assertEqual([data async for data in subscriber], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,208 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.runnables import RunnableLambda
+from langchain_openai import ChatOpenAI
+
+from chatbot.cache import LRUCache
+from chatbot.llm_client.scheduler import Priority
+from chatbot.safety import (
+    CompletionBatcher,
+    VerdictCachingClassifier,
+    WindowedClassifier,
+    combine_verdicts,
+    verdict_key,
+)
+
+
+class TestCompletionBatcher(unittest.IsolatedAsyncioTestCase):
+    class FakeGuard:
+        def __init__(self):
+            self.batches: list[list[list]] = []
+            self.kwargs: list[dict] = []
+
+        async def abatch_complete(self, conversations, **kwargs):
+            self.batches.append(conversations)
+            self.kwargs.append(kwargs)
+            return [
+                "unsafe\nS1" if "bad" in messages[-1].text else "safe"
+                for messages in conversations
+            ]
+
+    def setUp(self):
+        self.llm = self.FakeGuard()
+        self.bound = RunnableLambda(lambda x: ("unknown", None))
+
+    async def test_concurrent_calls_batched(self):
+        batcher = CompletionBatcher(self.bound, self.llm, window=0.01)
+        results = await asyncio.gather(
+            batcher.ainvoke({"messages": [HumanMessage(content="hi", id="1")]}),
+            batcher.ainvoke({"messages": [HumanMessage(content="bad")]}),
+            batcher.ainvoke({"messages": [HumanMessage(content="hi", id="2")]}),
+        )
+        self.assertEqual(results, [("safe", None), ("unsafe", "S1"), ("safe", None)])
+        # One completion request, deduplicated by role and content.
+        self.assertEqual(len(self.llm.batches), 1)
+        self.assertEqual(
+            [messages[0].text for messages in self.llm.batches[0]], ["hi", "bad"]
+        )
+        self.assertEqual(self.llm.kwargs[0]["priority"], Priority.SAFETY)
+
+    async def test_max_batch_size(self):
+        batcher = CompletionBatcher(self.bound, self.llm, window=10, max_batch_size=2)
+        results = await asyncio.gather(
+            batcher.ainvoke({"messages": [HumanMessage(content="a")]}),
+            batcher.ainvoke({"messages": [HumanMessage(content="b")]}),
+        )
+        self.assertEqual(results, [("safe", None), ("safe", None)])
+        self.assertEqual(len(self.llm.batches), 1)
+
+    async def test_exception_propagated(self):
+        async def abatch_complete(conversations, **kwargs):
+            raise ValueError("boom")
+
+        self.llm.abatch_complete = abatch_complete
+        batcher = CompletionBatcher(self.bound, self.llm, window=0)
+        with self.assertRaises(ValueError):
+            await batcher.ainvoke({"messages": [HumanMessage(content="hi")]})
+
+
+class TestVerdictCache(unittest.IsolatedAsyncioTestCase):
+    def test_verdict_key_normalized(self):
+        key = verdict_key("guard", [HumanMessage(content="Hello  world\n", id="1")])
+        self.assertEqual(
+            key, verdict_key("guard", [HumanMessage(content=" Hello world", id="2")])
+        )
+        self.assertNotEqual(
+            key, verdict_key("guard", [AIMessage(content="Hello world")])
+        )
+        self.assertNotEqual(
+            key, verdict_key("other", [HumanMessage(content="Hello world")])
+        )
+
+    async def test_repeated_verdict_cached(self):
+        calls = []
+
+        def classify(input):
+            calls.append(input)
+            return (
+                ("unknown", None)
+                if "?" in input["messages"][0].content
+                else ("safe", None)
+            )
+
+        classifier = VerdictCachingClassifier(
+            RunnableLambda(classify), LRUCache(16), model="guard"
+        )
+        for _ in range(2):
+            verdict = await classifier.ainvoke(
+                {"messages": [HumanMessage(content="hi")]}
+            )
+            self.assertEqual(verdict, ("safe", None))
+        self.assertEqual(len(calls), 1)
+
+        # Inconclusive verdicts are not cached.
+        for _ in range(2):
+            await classifier.ainvoke({"messages": [HumanMessage(content="hi?")]})
+        self.assertEqual(len(calls), 3)
+
+
+class TestWindowedClassifier(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.classified = []
+
+        def classify(input):
+            text = input["messages"][-1].content
+            self.classified.append(text)
+            return ("unsafe", "S1") if "bad" in text else ("safe", None)
+
+        def token_counter(messages):
+            return sum(len(message.text) for message in messages)
+
+        self.classifier = WindowedClassifier(
+            RunnableLambda(classify), token_counter=token_counter, max_tokens=100
+        )
+
+    async def test_short_input_as_is(self):
+        verdict = await self.classifier.ainvoke(
+            {"messages": [HumanMessage(content="hi")]}
+        )
+        self.assertEqual(verdict, ("safe", None))
+        self.assertEqual(self.classified, ["hi"])
+
+    async def test_long_input_head_and_tail(self):
+        content = "a" * 1000 + "bad"
+        verdict = await self.classifier.ainvoke(
+            {"messages": [HumanMessage(content=content)]}
+        )
+        self.assertEqual(verdict, ("unsafe", "S1"))
+        self.assertEqual(len(self.classified), 2)
+        for window in self.classified:
+            self.assertLessEqual(len(window), 100)
+        self.assertTrue(self.classified[1].endswith("bad"))
+
+    async def test_budget_shared_among_messages(self):
+        messages = [HumanMessage(content="q" * 30), AIMessage(content="a" * 1000)]
+        await self.classifier.ainvoke({"messages": messages})
+        self.assertEqual(len(self.classified), 2)
+        for window in self.classified:
+            self.assertLessEqual(len(window), 50)
+
+    async def test_token_counter_unsupported(self):
+        guard = ChatOpenAI(model="meta-llama/Llama-Guard-3-8B", api_key="test")
+        classifier = WindowedClassifier(
+            RunnableLambda(lambda input: ("safe", None)),
+            token_counter=guard.get_num_tokens_from_messages,
+            max_tokens=100,
+        )
+        # Skip downloading the encoding, the model name is what tiktoken does not know.
+        with patch.object(
+            ChatOpenAI, "_get_encoding_model", return_value=(guard.model_name, None)
+        ):
+            with self.assertRaises(NotImplementedError):
+                guard.get_num_tokens_from_messages([HumanMessage(content="hi")])
+            verdict = await classifier.ainvoke(
+                {"messages": [HumanMessage(content="a " * 1000)]}
+            )
+        self.assertEqual(verdict, ("safe", None))
+        self.assertIs(classifier.token_counter, count_tokens_approximately)
+
+    async def test_token_counter_failure_not_permanent(self):
+        calls = []
+
+        def token_counter(messages):
+            calls.append(messages)
+            if len(calls) == 1:
+                raise ConnectionError("tokenize unavailable")
+            return 1
+
+        classifier = WindowedClassifier(
+            RunnableLambda(lambda input: ("safe", None)),
+            token_counter=token_counter,
+            max_tokens=100,
+        )
+        for _ in range(2):
+            verdict = await classifier.ainvoke(
+                {"messages": [HumanMessage(content="hi")]}
+            )
+            self.assertEqual(verdict, ("safe", None))
+        self.assertIs(classifier.token_counter, token_counter)
+        self.assertEqual(len(calls), 2)
+
+    def test_combine_verdicts(self):
+        self.assertEqual(
+            combine_verdicts([("safe", None), ("unsafe", "S2")]), ("unsafe", "S2")
+        )
+        self.assertEqual(
+            combine_verdicts([("safe", None), ("safe", None)]), ("safe", None)
+        )
+        self.assertEqual(
+            combine_verdicts([("safe", None), ("unknown", None)]), ("unknown", None)
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,239 @@
+import asyncio
+import unittest
+
+from langchain_core.messages import AIMessageChunk, ToolMessage
+
+from chatbot.streaming import (
+    ReplayBuffer,
+    StreamRegistry,
+    capture_values,
+    coalesce_chunks,
+    coalesce_while,
+)
+
+
+def chunk(text: str, id: str = "run-1", index: int = 0) -> AIMessageChunk:
+    return AIMessageChunk(
+        id=id,
+        content=[{"type": "text", "text": text, "index": index}],
+        additional_kwargs={"raw_content": text},
+    )
+
+
+async def collect(stream) -> list:
+    return [item async for item in stream]
+
+
+async def source(items, delay: float = 0):
+    for item in items:
+        if delay:
+            await asyncio.sleep(delay)
+        yield item, {"langgraph_node": "chatbot"}
+
+
+class TestCoalesceChunks(unittest.IsolatedAsyncioTestCase):
+    async def test_merge_same_message(self):
+        items = [chunk("Hel"), chunk("lo"), chunk("!", index=1)]
+        out = await collect(coalesce_chunks(source(items), interval=10))
+        self.assertEqual(len(out), 1)
+        msg, metadata = out[0]
+        self.assertEqual(
+            msg.content,
+            [
+                {"type": "text", "text": "Hello", "index": 0},
+                {"type": "text", "text": "!", "index": 1},
+            ],
+        )
+        self.assertEqual(msg.additional_kwargs["raw_content"], "Hello!")
+        self.assertEqual(metadata, {"langgraph_node": "chatbot"})
+
+    async def test_flush_on_other_message(self):
+        tool_message = ToolMessage(content="result", tool_call_id="1")
+        items = [chunk("a"), chunk("b", id="run-2"), tool_message, chunk("c")]
+        out = await collect(coalesce_chunks(source(items), interval=10))
+        self.assertEqual([msg.id for msg, _ in out], ["run-1", "run-2", None, "run-1"])
+
+    async def test_flush_on_interval(self):
+        items = [chunk("a"), chunk("b"), chunk("c"), chunk("d")]
+        out = await collect(coalesce_chunks(source(items, delay=0.05), interval=0.075))
+        # The chunk arriving after the interval is included in the merged chunk.
+        self.assertEqual(
+            [msg.additional_kwargs["raw_content"] for msg, _ in out], ["abc", "d"]
+        )
+
+    async def test_flush_on_max_bytes(self):
+        items = [chunk("a" * 10) for _ in range(4)]
+        out = await collect(coalesce_chunks(source(items), interval=10, max_bytes=40))
+        # Text and raw content are both counted.
+        self.assertEqual(len(out), 2)
+
+    async def test_error_propagated(self):
+        async def failing():
+            yield chunk("a"), {}
+            raise RuntimeError("boom")
+
+        with self.assertRaises(RuntimeError):
+            await collect(coalesce_chunks(failing(), interval=10))
+
+
+class TestCaptureValues(unittest.IsolatedAsyncioTestCase):
+    async def test_capture_values(self):
+        async def multi_mode():
+            yield "values", {"messages": []}
+            yield "messages", (chunk("a"), {"langgraph_node": "chatbot"})
+            yield "values", {"messages": ["final"]}
+
+        states = []
+        items = await collect(capture_values(multi_mode(), states.append))
+        self.assertEqual([msg.content for msg, _ in items], [chunk("a").content])
+        self.assertEqual(states[-1], {"messages": ["final"]})
+
+
+class TestCoalesceWhile(unittest.IsolatedAsyncioTestCase):
+    async def test_merge_while_congested(self):
+        congested = True
+
+        async def stream():
+            nonlocal congested
+            yield chunk("a"), {}
+            yield chunk("b"), {}
+            congested = False
+            yield chunk("c"), {}
+            yield chunk("d"), {}
+
+        result = await collect(coalesce_while(stream(), lambda: congested))
+        self.assertEqual([msg.content[0]["text"] for msg, _ in result], ["abc", "d"])
+
+
+async def events(*items: str, delay: float = 0):
+    for item in items:
+        await asyncio.sleep(delay)
+        yield item
+
+
+class TestReplayBuffer(unittest.IsolatedAsyncioTestCase):
+    async def test_subscribe(self):
+        buffer = ReplayBuffer("msg-1", max_bytes=1024)
+        done = asyncio.Event()
+
+        async def on_done():
+            done.set()
+
+        buffer.start(events("a", "b", "c", delay=0.01), on_done=on_done)
+        self.assertEqual(
+            await collect(buffer.subscribe()),
+            ["id: 1\ndata: a\n\n", "id: 2\ndata: b\n\n", "id: 3\ndata: c\n\n"],
+        )
+        await asyncio.wait_for(done.wait(), 1)
+        # Resume after the second event.
+        self.assertEqual(await collect(buffer.subscribe(2)), ["id: 3\ndata: c\n\n"])
+
+    async def test_resume_while_generating(self):
+        buffer = ReplayBuffer("msg-1", max_bytes=1024)
+        buffer.start(events("a", "b", "c", delay=0.02))
+        first = buffer.subscribe()
+        self.assertEqual(await anext(first), "id: 1\ndata: a\n\n")
+        await first.aclose()  # The client disconnects.
+
+        resumed = await collect(buffer.subscribe(1))
+        self.assertEqual(resumed, ["id: 2\ndata: b\n\n", "id: 3\ndata: c\n\n"])
+
+    async def test_evict_sent(self):
+        buffer = ReplayBuffer("msg-1", keep_sent=False)
+        buffer.start(events("a", "b", "c", delay=0.01))
+        self.assertEqual(len(await collect(buffer.subscribe())), 3)
+        self.assertEqual(buffer.nbytes, 0)
+        self.assertFalse(buffer.retains(0))
+
+    async def test_evict(self):
+        buffer = ReplayBuffer("msg-1", max_bytes=2)
+        for item in ("a", "b", "c"):
+            buffer.append(item)
+        buffer.close()
+        self.assertEqual(buffer.first_event_id, 2)
+        self.assertFalse(buffer.retains(0))
+        self.assertTrue(buffer.retains(1))
+        self.assertEqual(await collect(buffer.subscribe(0)), [])
+
+    async def test_abandon(self):
+        buffer = ReplayBuffer("msg-1", abandon_timeout=0.01)
+        done = asyncio.Event()
+
+        async def on_done():
+            done.set()
+
+        buffer.start(events("a", "b", delay=1), on_done=on_done)
+        disconnected = False
+
+        async def is_disconnected():
+            return disconnected
+
+        subscriber = buffer.subscribe(
+            is_disconnected=is_disconnected, poll_interval=0.01
+        )
+        task = asyncio.create_task(collect(subscriber))
+        await asyncio.sleep(0.05)
+        self.assertFalse(done.is_set())  # Still generating for the subscriber.
+
+        disconnected = True
+        self.assertEqual(await asyncio.wait_for(task, 1), [])
+        await asyncio.wait_for(done.wait(), 1)
+        self.assertTrue(buffer.closed)
+        self.assertEqual(buffer.last_event_id, 0)
+
+    async def test_pause(self):
+        buffer = ReplayBuffer("msg-1", high_water=2, low_water=1, policy="pause")
+        buffer.start(events("a", "b", "c", "d"))
+        subscriber = buffer.subscribe()
+        self.assertEqual(await anext(subscriber), "id: 1\ndata: a\n\n")
+        await asyncio.sleep(0.01)
+        # Paused with "b", "c" and "d" produced but not sent.
+        self.assertTrue(buffer.congested)
+        self.assertEqual(buffer.last_event_id, 3)
+
+        rest = await collect(subscriber)
+        self.assertEqual(len(rest), 3)
+        self.assertFalse(buffer.congested)
+        self.assertEqual(buffer.buffered_bytes, 0)
+
+    async def test_drop(self):
+        buffer = ReplayBuffer("msg-1", high_water=2, low_water=1, policy="drop")
+        for item in ("a", "b", "c", "d"):
+            buffer.append(item)
+        subscriber = buffer.subscribe()
+        self.assertEqual(await anext(subscriber), "id: 1\ndata: a\n\n")
+        # Still 3 bytes behind.
+        self.assertEqual(await collect(subscriber), [])
+
+    async def test_dropped_subscriber_not_abandoned(self):
+        buffer = ReplayBuffer("msg-1", high_water=2, low_water=1, policy="drop")
+        done = asyncio.Event()
+
+        async def on_done():
+            done.set()
+
+        buffer.start(events(*["x"] * 50, delay=0.001), on_done=on_done)
+        subscriber = buffer.subscribe()
+        self.assertEqual(await anext(subscriber), "id: 1\ndata: x\n\n")
+        await asyncio.sleep(0.02)  # A slow client.
+        self.assertEqual(await collect(subscriber), [])
+
+        # Still generating, the client gets the final answer.
+        await asyncio.wait_for(done.wait(), 1)
+        self.assertEqual(buffer.last_event_id, 50)
+
+
+class TestStreamRegistry(unittest.TestCase):
+    def test_get(self):
+        registry = StreamRegistry(2)
+        buffer = registry.create("conv-1", "msg-1")
+        self.assertIs(registry.get("conv-1", "msg-1"), buffer)
+        self.assertIsNone(registry.get("conv-1", "msg-0"))
+
+        # A new generation replaces the previous one.
+        registry.create("conv-1", "msg-2")
+        self.assertIsNone(registry.get("conv-1", "msg-1"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+from datetime import datetime, timezone
+from uuid import uuid4
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from chatbot.models import Base, Conversation
+from chatbot.write_behind import ConversationUpdates
+
+
+class TestConversationUpdates(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite://")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session_maker = async_sessionmaker(self.engine, expire_on_commit=False)
+        async with self.session_maker() as session:
+            self.convs = [Conversation(title="test", owner="alice") for _ in range(2)]
+            session.add_all(self.convs)
+            await session.commit()
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+
+    async def get(self, conv_id) -> Conversation:
+        async with self.session_maker() as session:
+            return await session.get_one(Conversation, conv_id)
+
+    async def test_flush_on_stop(self):
+        updates = ConversationUpdates(self.session_maker, interval=60)
+        updates.start()
+        now = datetime.now(tz=timezone.utc)
+        updates.add(self.convs[0].id, last_message_at=now)
+        updates.add(self.convs[0].id, title="first")
+        updates.add(self.convs[0].id, title="second")
+        updates.add(self.convs[1].id, title="other")
+        updates.add(uuid4(), title="deleted")
+        self.assertEqual((await self.get(self.convs[0].id)).title, "test")
+
+        await updates.stop()
+        conv = await self.get(self.convs[0].id)
+        self.assertEqual(conv.title, "second")
+        self.assertEqual(conv.last_message_at, now)
+        self.assertEqual((await self.get(self.convs[1].id)).title, "other")
+
+    async def test_discard(self):
+        updates = ConversationUpdates(self.session_maker)
+        updates.add(self.convs[0].id, title="generated")
+        updates.discard(self.convs[0].id, "title")
+        await updates.flush()
+        self.assertEqual((await self.get(self.convs[0].id)).title, "test")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -189,6 +189,22 @@ const ChatInput = ({ onSubmit }) => {
             return [...updatedPrev, ...initialAttachments];
         });
 
+        // Record image dimensions at attach time, so the server does not need to download
+        // the image to count its tokens.
+        for (const file of selectedFiles.filter(f => f.type.startsWith("image/"))) {
+            createImageBitmap(file)
+                .then((bitmap) => {
+                    const { width, height } = bitmap;
+                    bitmap.close();
+                    setAttachments((prev) =>
+                        prev.map((attachment) =>
+                            attachment.name === file.name ? { ...attachment, width, height } : attachment
+                        )
+                    );
+                })
+                .catch((error) => console.debug("Cannot read dimensions of", file.name, error));
+        }
+
         const onStart = (file, controller) => {
             setUploadRequests((prev) => ({ ...prev, [file.name]: controller }));
         };
@@ -55,6 +55,28 @@ export const ConversationProvider = ({ children }) => {
         // eslint-disable-next-line react-hooks/exhaustive-deps
     }, []);
 
+    // Titles are generated in the background, and published as notifications.
+    useEffect(() => {
+        if (typeof EventSource === "undefined") {
+            return;
+        }
+        const source = new EventSource("/api/notifications");
+        source.onmessage = (event) => {
+            try {
+                const message = JSON.parse(event.data);
+                if (message.type === "info" && message.content.type === "title-generated") {
+                    dispatch({
+                        type: "renamed",
+                        conv: { id: message.content.conversation_id, title: message.content.payload },
+                    });
+                }
+            } catch (error) {
+                console.error("Invalid notification", { data: event.data, errorDetails: error });
+            }
+        };
+        return () => source.close();
+    }, []);
+
     return (
         <ConversationContext.Provider value={{ groupedConvsArray, dispatch, fetchMoreConvs, isLoading, hasMore: !!nextCursor }}>
             {children}
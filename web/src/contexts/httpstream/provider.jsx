@@ -23,13 +23,16 @@ export const HttpStreamProvider = ({ children }) => {
 
             const reader = response.body.getReader();
             const decoder = new TextDecoder();
+            let buffer = "";
 
             while (true) {
                 const { done, value } = await reader.read();
                 if (done) break;
 
-                const chunk = decoder.decode(value);
-                const lines = chunk.split('\n');
+                buffer += decoder.decode(value, { stream: true });
+                const lines = buffer.split('\n');
+                // An event may span several reads, keep the incomplete last line for the next read.
+                buffer = lines.pop();
 
                 for (const line of lines) {
                     if (line.trim().startsWith('data: ')) {